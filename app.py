@@ -7,6 +7,7 @@ import io
 import os
 import json
 import zipfile
+import collections
 from datetime import datetime,date
 from PIL import Image, ImageOps
 from scripts.validation import *    
@@ -20,6 +21,13 @@ from scripts.ui_helpers.ui_render import *
 from scripts.unifiers import *
 from scripts.utils.ocr_utils import *
 from scripts.procedure_recognition import suggest_procedure
+from scripts.utils.vlm_clients import get_vlm_client
+from scripts.utils.render_cache import open_cached_pdf
+from scripts.utils.vlm_telemetry import input_path_summary, count_input_paths
+from scripts.utils.appointment_executor import process_documents
+from scripts.utils.document_input import prepare_document, download_appointment_documents, DocumentInputError
+from scripts.utils.job_queue import get_job_queue, batch_finished
+from scripts.config.vlm_settings import VLM_JOB_QUEUE_ENABLED, VLM_JOB_POLL_INTERVAL
 import streamlit.components.v1 as components
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -52,11 +60,13 @@ fb_raw   = st.secrets["huggingface"]
 fb_creds = fb_raw.to_dict() 
 
 # ----------------- SET AUTHENTICATION & CLIENT IN SESSION ------------------
+@st.cache_resource
+def shared_vlm_client(token):
+    # One pooled client for every session in this process.
+    return get_vlm_client(api_key=token)
+
 if "client" not in st.session_state:
-    st.session_state.client = OpenAI(
-        base_url="https://router.huggingface.co/hyperbolic/v1",
-#         base_url = "https://mf32siy1syuf3src.us-east-1.aws.endpoints.huggingface.cloud/v1/",
-        api_key=fb_creds['token'],)
+    st.session_state.client = shared_vlm_client(fb_creds['token'])
 if "token" not in st.session_state:
     st.session_state.token=fb_creds['token']
 
@@ -118,7 +128,8 @@ CLEAR_CORE = [
     "current_index",
     "selected_trustee",
     "submitted_to_zoho",
-    "appt_row"
+    "appt_row",
+    "job_batch_loaded"
 ]
 
 CSR_KEYS = [
@@ -368,16 +379,9 @@ if mode == "Appointment":
     if pdf_urls:
         if st.session_state.selected_pdfs is None:
             bufs = []
-            for i, url in enumerate(pdf_urls, 1):
-                r = requests.get(url); r.raise_for_status()
-                ext = url.split('.')[-1].lower()
-                if ext not in ("pdf","png","jpg","jpeg"):
-                    # fallback to content-type header
-                    ct = r.headers.get("Content-Type", "")
-                    ext = "pdf" if "pdf" in ct else "jpg"
-
-                buf = io.BytesIO(r.content)
-                buf.name = f"{row['First Name']}_{row['Last Name']}_doc{i}.{ext}"
+            for name, content in download_appointment_documents(row):
+                buf = io.BytesIO(content)
+                buf.name = name
                 bufs.append(buf)
             st.session_state.selected_pdfs = bufs
         uploaded_files = st.session_state.selected_pdfs
@@ -396,6 +400,83 @@ if mode == "Appointment":
         uploaded_files.extend(extra)
 
 
+def prepare_upload(f, row, password_document):
+    """
+    Reads an uploaded file and returns (name, pdf_bytes) for process_document:
+    images are converted to PDF, encrypted PDFs are unlocked with the
+    contract or user password. Raises DocumentInputError.
+    """
+    contract_pw = row.get("contractPassword", "").strip() or password_document
+    f.seek(0)
+    return prepare_document(f.name, f.read(), contract_pw)
+
+
+def process_upload(f, row, password_document):
+    """
+    Runs one uploaded file through process_document.
+    Returns the result (dict or list of dicts), or None if the file failed.
+    """
+    with st.spinner(f"Processing {f.name}…"):
+        try:
+            name, pdf_bytes = prepare_upload(f, row, password_document)
+        except DocumentInputError as e:
+            st.error(str(e))
+            return None
+        try:
+            return process_document(io.BytesIO(pdf_bytes), name)
+        except Exception as e_proc:
+            st.error(f"❌ Error processing `{f.name}`: {e_proc}")
+            return None
+
+
+def collect_results(results):
+    # Per-file results are a dict, a list of dicts (split uploads) or None.
+    collected = []
+    for res in results:
+        if res is None or isinstance(res, Exception):
+            continue
+        if isinstance(res, list):
+            collected.extend(res)
+        else:
+            collected.append(res)
+    return collected
+
+
+def load_job_batch(batch_id):
+    """Replaces the session results with a finished queue batch."""
+    queue = get_job_queue()
+    for job in queue.batch_jobs(batch_id):
+        if job["status"] == "failed":
+            st.error(f"❌ Error processing `{job['filename']}`: {job['error']}")
+    st.session_state.results = collect_results(queue.batch_results(batch_id))
+    st.session_state.current_index = 0
+    st.session_state.documents_saved = False
+    st.session_state.job_batch_loaded = batch_id
+    if batch_id.startswith("prefetch-"):
+        st.info("📥 These documents were processed ahead of the appointment.")
+
+
+JOB_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌"}
+
+
+@st.fragment(run_every=VLM_JOB_POLL_INTERVAL)
+def job_batch_progress(batch_id):
+    # Polls the queue; once every job has finished, a full rerun loads the results.
+    jobs = get_job_queue().batch_jobs(batch_id)
+    if batch_finished(jobs):
+        st.rerun()
+    done = sum(job["status"] in ("done", "failed") for job in jobs)
+    st.progress(done / len(jobs) if jobs else 0.0, text=f"Processing in background: {done}/{len(jobs)} documents")
+    for job in jobs:
+        line = f"{JOB_ICONS.get(job['status'], '')} `{job['filename']}` — {job['status']}"
+        if job["status"] == "running" and job["started"]:
+            line += f" ({job['progress'] or 'processing'}, {time.time() - job['started']:.0f}s)"
+        elif job["status"] == "failed":
+            line += f": {job['error']}"
+        st.write(line)
+    st.caption("You can leave this page; processing continues and results are kept for this appointment.")
+
+
 password_document=st.text_input(label='Document password')
 
 if st.button("Submit") and uploaded_files:
@@ -432,93 +513,69 @@ if st.button("Submit") and uploaded_files:
     if encrypted_file:
         st.info(f"🔒 The file `{encrypted_file.name}` appears encrypted and will use your contractPassword.")
 
-    # 2) Now your main processing loop
-    for f in uploaded_files:
-        with st.spinner(f"Processing {f.name}…"):
-            name = f.name.lower()
-
-            # a) Image → PDF conversion (unchanged)
-            if name.endswith((".png", ".jpg", ".jpeg")):
-                f.seek(0)
-                img = Image.open(f)
-                img = ImageOps.exif_transpose(img)
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-
-                pdf_buf = io.BytesIO()
-                pdf_buf.name = f"{f.name.rsplit('.',1)[0]}.pdf"
-                img.save(pdf_buf, format="PDF")
-                pdf_buf.seek(0)
-
-                try:
-                    res = process_document(pdf_buf, pdf_buf.name)
-                except Exception as e:
-                    st.error(f"Failed to process converted PDF for {f.name}: {e}")
-                    continue
-
-
-            else:
-
-                # Not an image → treat as PDF immediately
-
-                # 0) Pull your password (contractPassword or user‐entered)
-                contract_pw = row.get("contractPassword", "").strip() or password_document
-
-                # 1) Read the raw upload bytes
-                f.seek(0)
-                raw = f.read()
-
-                # 2) Open in PyMuPDF
-                try:
-                    doc = fitz.open(stream=raw, filetype="pdf")
-                except Exception as e:
-                    st.error(f"❌ Could not open `{f.name}` at all: {e}")
-                    continue
+    # 2) Queue mode: hand the documents to the background worker; the
+    # progress section below polls for them.
+    if VLM_JOB_QUEUE_ENABLED:
+        documents = []
+        for f in uploaded_files:
+            try:
+                documents.append(prepare_upload(f, row, password_document))
+            except DocumentInputError as e:
+                st.error(str(e))
+        if documents:
+            get_job_queue().enqueue(documents, appointment_id=row.get("ID"))
+            st.session_state.job_batch_loaded = None
+            st.rerun()
+        st.stop()
 
-                # 3) If encrypted, authenticate
-                if doc.needs_pass:  # True if user password required :contentReference[oaicite:0]{index=0}
-                    if not contract_pw:
-                        st.error(f"❌ `{f.name}` is encrypted but no password provided.")
-                        doc.close()
-                        continue
-                    if not doc.authenticate(contract_pw):  # unlock with user password :contentReference[oaicite:1]{index=1}
-                        st.error(f"❌ Wrong password for `{f.name}`.")
-                        doc.close()
-                        continue
-
-                # 4) Save a *decrypted* copy to a temp file
-                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                    temp_path = tmp.name
-                try:
-                    doc.save(temp_path)      # full rewrite, strips encryption
-                except Exception as e_save:
-                    st.error(f"❌ Could not write decrypted PDF for `{f.name}`: {e_save}")
-                    doc.close()
-                    os.remove(temp_path)
-                    continue
-                doc.close()
+    # 2) Now your main processing loop: documents run concurrently, each
+    # result shows up as soon as it is ready, and results keep upload order.
+    def show_result(i, res, status):
+        f = uploaded_files[i]
+        if isinstance(res, Exception):
+            status.error(f"❌ Error processing `{f.name}`: {res}")
+        elif res is None:
+            status.warning(f"⚠️ `{f.name}` was not processed.")
+        else:
+            docs = res if isinstance(res, list) else [res]
+            status.success(f"✅ `{f.name}`: " + ", ".join(str(d.get("doc_type", "")) for d in docs))
 
-                # 5) Feed that temp‐file into your existing OCR pipeline
-                try:
-                    with open(temp_path, "rb") as unlocked:
-                        res = process_document(unlocked, f.name)
-                except Exception as e_proc:
-                    st.error(f"❌ Error processing decrypted PDF `{f.name}`: {e_proc}")
-                    os.remove(temp_path)
-                    continue
+    # Text-layer / image hits of this submission only (other sessions share the process).
+    submission_paths = collections.Counter()
 
-                # 6) Clean up the temp file
-                os.remove(temp_path)
+    def process_counted(f):
+        with count_input_paths(submission_paths):
+            return process_upload(f, row, password_document)
 
+    results = process_documents(
+        uploaded_files,
+        process_counted,
+        labels=[f.name for f in uploaded_files],
+        on_result=show_result,
+    )
 
-            # c) collect results
-            if isinstance(res, list):
-                st.session_state.results.extend(res)
-            else:
-                st.session_state.results.append(res)
+    # c) collect results
+    st.session_state.results = collect_results(results)
 
     st.session_state.current_index = 0
     st.success(f"Processing complete in {time.time() - t0:.1f}s")
+    paths = input_path_summary(submission_paths).get("_all")
+    if paths:
+        st.caption(
+            f"Text-layer fast path: {paths['text']} text / {paths['image']} image hits "
+            f"({paths['text_ratio']:.0%} via text)"
+        )
+
+# Background jobs of this appointment: show progress while they run, load
+# the results once they are all finished (also after a restart or when the
+# CSR comes back to the appointment).
+if VLM_JOB_QUEUE_ENABLED:
+    job_batch = get_job_queue().latest_batch(row.get("ID"))
+    if job_batch and st.session_state.get("job_batch_loaded") != job_batch:
+        if batch_finished(get_job_queue().batch_jobs(job_batch)):
+            load_job_batch(job_batch)
+        else:
+            job_batch_progress(job_batch)
 
 
 
@@ -883,11 +940,11 @@ if "results" in st.session_state and st.session_state.results:
         # Otherwise if it’s a PDF, render each page to PNG
         elif current.get("pdf_bytes") or current.get("original_pdf_bytes"):
             pdf_bytes = current.get("pdf_bytes", current["original_pdf_bytes"])
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            for page in doc:
-                pix = page.get_pixmap(matrix=fitz.Matrix(1, 1))
-                b64 = base64.b64encode(pix.tobytes("png")).decode("utf-8")
-                page_imgs.append(f"data:image/png;base64,{b64}")
+            # Cached across reruns, so each page is rasterized once.
+            doc = open_cached_pdf(pdf_bytes)
+            doc.prefetch(range(doc.page_count), zoom=1, max_bytes=None, formats=["PNG"])
+            for page_num in range(doc.page_count):
+                page_imgs.append(doc.encoded(page_num, zoom=1, max_bytes=None, formats=["PNG"]).data_uri)
             doc.close()
 
         else:
@@ -0,0 +1,154 @@
+# batch_process.py
+#
+# Headless entry point: runs the app's classification and extraction
+# pipeline (prepare_document + process_document) over a folder of PDFs and
+# images or a JSONL manifest, without Streamlit, Firebase or a login, and
+# writes one JSONL record per input file with its results and timings.
+#
+#   python -m scripts.batch_process samples/ --out results.jsonl --workers 4
+#   python -m scripts.batch_process --manifest batch.jsonl --out results.jsonl
+#
+# Manifest lines: {"path": "docs/a.pdf", "id": "optional", "password": "optional"};
+# relative paths are resolved against the manifest's directory. The VLM
+# endpoint and key come from VLM_BASE_URL / VLM_API_KEY (or HF_TOKEN).
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from scripts.config.vlm_settings import VLM_DOCUMENT_WORKERS
+from scripts.utils.document_input import IMAGE_EXTENSIONS, prepare_document
+
+DOCUMENT_EXTENSIONS = (".pdf", *IMAGE_EXTENSIONS)
+
+
+def find_documents(paths):
+    """Manifest-style items for files and (recursively) directories, in name order."""
+    items = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                items.extend({"path": os.path.join(root, name)} for name in sorted(files)
+                             if name.lower().endswith(DOCUMENT_EXTENSIONS))
+        else:
+            items.append({"path": path})
+    return items
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item["path"] = os.path.join(base, item["path"])
+            items.append(item)
+    return items
+
+
+def _jsonable(document):
+    # Page images and PDF copies stay out of the JSONL.
+    return {key: value for key, value in document.items() if not isinstance(value, (bytes, bytearray))}
+
+
+def process_item(item, password=None):
+    """Runs one file through the pipeline and returns its JSONL record."""
+    from scripts.utils.ocr_utils import process_document
+
+    path = item["path"]
+    record = {
+        "id": item.get("id", path),
+        "path": path,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "status": "ok",
+        "error": None,
+        "documents": [],
+    }
+    timings = {}
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+        timings["read_s"] = time.perf_counter() - start
+
+        mark = time.perf_counter()
+        name, pdf_bytes = prepare_document(os.path.basename(path), raw, item.get("password") or password)
+        timings["prepare_s"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        result = process_document(io.BytesIO(pdf_bytes), name)
+        timings["process_s"] = time.perf_counter() - mark
+
+        documents = result if isinstance(result, list) else [result]
+        record["documents"] = [_jsonable(document) for document in documents if document]
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    timings["total_s"] = time.perf_counter() - start
+    record["timings"] = timings
+    return record
+
+
+def run_batch(items, out, workers=VLM_DOCUMENT_WORKERS, password=None):
+    """
+    Processes `items` on up to `workers` threads and writes each record to
+    `out` as soon as it is ready. Returns (ok, failed) counts.
+    """
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "error": 0}
+
+    def write(record):
+        with write_lock:
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch-doc") as executor:
+        futures = [executor.submit(process_item, item, password) for item in items]
+        for future in as_completed(futures):
+            write(future.result())
+    return counts["ok"], counts["error"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify and extract documents without the Streamlit app.")
+    parser.add_argument("inputs", nargs="*", help="PDF/image files or directories")
+    parser.add_argument("--manifest", help="JSONL manifest of {path, id?, password?}")
+    parser.add_argument("--out", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=VLM_DOCUMENT_WORKERS, help="documents processed at once")
+    parser.add_argument("--password", help="password for encrypted PDFs without one in the manifest")
+    parser.add_argument("--log-level", default="WARNING", help="pipeline log level (INFO shows progress lines)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(threadName)s %(message)s")
+    items = find_documents(args.inputs)
+    if args.manifest:
+        items.extend(read_manifest(args.manifest))
+    if not items:
+        sys.exit("no documents given (pass files, directories or --manifest)")
+
+    start = time.perf_counter()
+    if args.out == "-":
+        ok, failed = run_batch(items, sys.stdout, workers=args.workers, password=args.password)
+    else:
+        with open(args.out, "w", encoding="utf-8") as out:
+            ok, failed = run_batch(items, out, workers=args.workers, password=args.password)
+    elapsed = time.perf_counter() - start
+    print(f"{ok} processed, {failed} failed in {elapsed:.1f}s "
+          f"({len(items) / elapsed * 60:.1f} documents/min)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# bench_poa_tables.py
+#
+# Compares the POA table step on sample PDFs: Tabula (JVM, temp file per
+# call, as extract_power_of_attorney used to do) against the in-process
+# PyMuPDF table finder (scripts/utils/pdf_tables.py). Each engine runs in
+# its own fresh process so peak memory is not shared; the JVM shows up
+# either in the child peak (subprocess mode) or in the process peak (jpype).
+#
+#   python -m scripts.bench_poa_tables samples/poa/*.pdf --repeat 3
+#
+# Also reports how close the concatenated table strings are (1.0 = identical).
+# tabula-py is no longer in requirements.txt; install it (and a JVM) only to
+# run the comparison, or use --engine pymupdf.
+
+import argparse
+import difflib
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+PAGES = [1, 2, 3, 4]
+
+
+def _peak_rss_mb(who):
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _read_tabula(pdf_bytes):
+    import tabula
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_bytes)
+        path = tmp.name
+    try:
+        return tabula.read_pdf(path, pages=PAGES, multiple_tables=True)
+    finally:
+        os.remove(path)
+
+
+def _read_pymupdf(pdf_bytes):
+    from scripts.utils.pdf_tables import read_pdf_tables
+    return read_pdf_tables(pdf_bytes, pages=PAGES)
+
+
+ENGINES = {"tabula": _read_tabula, "pymupdf": _read_pymupdf}
+
+
+def _run_engine(engine, paths, repeat, queue):
+    """Runs in a fresh process: times `engine` on every file and reports peak RSS."""
+    from scripts.extractors.poa_extractor import _concatenate_tables_as_string
+    read = ENGINES[engine]
+    baseline = _peak_rss_mb(resource.RUSAGE_SELF)
+    timings, outputs, errors = [], {}, {}
+    for path in paths:
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                text = _concatenate_tables_as_string(read(pdf_bytes))
+            except Exception as e:
+                errors[path] = repr(e)
+                text = ""
+            timings.append(time.perf_counter() - start)
+        outputs[path] = text
+    queue.put({
+        "engine": engine,
+        "calls": len(timings),
+        "total_s": sum(timings),
+        "mean_s": sum(timings) / len(timings) if timings else None,
+        "first_s": timings[0] if timings else None,
+        "max_s": max(timings) if timings else None,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "errors": errors,
+        "outputs": outputs,
+    })
+
+
+def run_benchmark(paths, repeat=1, engines=("tabula", "pymupdf")):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for engine in engines:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_engine, args=(engine, paths, repeat, queue))
+        proc.start()
+        results[engine] = queue.get()
+        proc.join()
+    if "tabula" in results and "pymupdf" in results:
+        ratios = [
+            difflib.SequenceMatcher(None, results["tabula"]["outputs"][p], results["pymupdf"]["outputs"][p]).ratio()
+            for p in paths
+        ]
+        results["pymupdf"]["similarity_to_tabula"] = sum(ratios) / len(ratios) if ratios else None
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark POA table extraction: Tabula vs PyMuPDF.")
+    parser.add_argument("paths", nargs="+", help="POA PDF files or glob patterns")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per file")
+    parser.add_argument("--engine", choices=["both", "tabula", "pymupdf"], default="both")
+    parser.add_argument("--show-output", action="store_true", help="print the concatenated strings")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = sorted({p for pattern in args.paths for p in glob.glob(pattern)})
+    if not paths:
+        sys.exit("no PDF files matched")
+    engines = ("tabula", "pymupdf") if args.engine == "both" else (args.engine,)
+    if "tabula" in engines:
+        try:
+            import tabula
+        except ImportError:
+            sys.exit("tabula-py is not installed: pip install tabula-py, or run with --engine pymupdf")
+    results = run_benchmark(paths, repeat=args.repeat, engines=engines)
+    for engine, result in results.items():
+        outputs = result.pop("outputs")
+        print(json.dumps(result, indent=2))
+        if args.show_output:
+            for path, text in outputs.items():
+                print(f"--- {engine}: {path} ---\n{text}\n")
+
+
+if __name__ == "__main__":
+    main()
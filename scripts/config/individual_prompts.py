@@ -88,3 +88,33 @@ take care of those values 2033,2032,2022,2023
 Return the data in json format
 """
 
+
+## ID side detection prompt (front / back / both)
+SIDE_PROMPT = """
+Inspect the ID image. If you see the 3‑line machine‑readable zone (MRZ) at the bottom and don't have portrait photo, answer 'back'.
+If you see the portrait photo, name fields and no MRZ, answer 'front'.
+If both are visible, answer 'both'.
+Return exactly one word: 'front', 'back', or 'both'.
+"""
+
+## Passport fields the MRZ does not carry (the rest comes from the MRZ, see scripts/utils/mrz.py)
+PASSPORT_ISSUE_DATE_PROMPT = """
+You are given an image of a passport. Return only the Date of Issue in JSON format, as dd/mm/yyyy.
+If it is missing or unreadable, set it to "Not found". Do not include any additional text.
+{"Date of Issue": "dd/mm/yyyy"}
+"""
+
+## Emirates ID front fields the MRZ on the back does not carry (see scripts/utils/mrz.py)
+ID_FRONT_NON_MRZ_PROMPT = """
+Please extract the following information from the front side of the provided UAE ID image:
+   - **Name in Arabic**: the name written in Arabic, without the word 'الاسم' and without any non-Arabic characters.
+   - **Issuing Date**: the issuing date (in English, dd/mm/yyyy).
+If a field is not mentioned or is missing, return "not mentioned" for it.
+Return only JSON with this structure:
+{
+    "front": {
+        "name_arabic": "<name in Arabic or 'not mentioned'>",
+        "issuing_date": "<issuing date or 'not mentioned'>"
+    }
+}
+"""
@@ -0,0 +1,187 @@
+# prompt_registry.py
+#
+# Describes what each prompt is expected to return so call_vlm can size
+# max_tokens per prompt and stop the stream as soon as the answer is complete.
+#
+#   shape "label": a single word/phrase from `labels`
+#   shape "json":  one JSON object (or array)
+#   shape "text":  free text, no early stop
+#
+# `tier` picks the model (see route_model): "small" for label-only tasks,
+# "large" for extractions.
+
+from scripts.config.prompts import (
+    BROAD_CLASSIFICATION_PROMPT,
+    COMPANY_PROMPT,
+    LEGAL_PROMPT,
+    BANK_PROMPT,
+    PROPERTY_PROMPT,
+    PERSONAL_PROMPT,
+    POA_CHECK_PROMPT,
+    HIERARCHICAL_CLASSIFICATION_PROMPT,
+    MULTIPAGE_PROMPT_TEMPLATE,
+)
+from scripts.config.prompts_legal import *
+from scripts.config.individual_prompts import *
+from scripts.config.company_prompts import *
+from scripts.config.bank_documents_prompts import *
+from scripts.config.property_prompts import *
+from scripts.config.poa_prompts import *
+from scripts.config.vlm_settings import (
+    VLM_ROUTING_ENABLED,
+    VLM_SMALL_MODEL,
+    VLM_LARGE_MODEL,
+    VLM_MODEL_ROUTES,
+)
+
+DEFAULT_MAX_TOKENS = 1024
+MULTIPAGE_MAX_TOKENS = 4096
+LABEL_MAX_TOKENS = 24
+YES_NO_MAX_TOKENS = 8
+MRZ_FIELDS_MAX_TOKENS = 96
+
+MODEL_TIERS = {"small": VLM_SMALL_MODEL, "large": VLM_LARGE_MODEL}
+
+DEFAULT_PROMPT_SPEC = {"name": "adhoc", "shape": "text", "max_tokens": DEFAULT_MAX_TOKENS, "tier": "large"}
+
+
+def _label(name, labels, max_tokens=LABEL_MAX_TOKENS, tier="small"):
+    return {"name": name, "shape": "label", "labels": labels, "max_tokens": max_tokens, "tier": tier}
+
+
+def _json(name, max_tokens=DEFAULT_MAX_TOKENS, tier="large"):
+    return {"name": name, "shape": "json", "max_tokens": max_tokens, "tier": tier}
+
+
+def _text(name, max_tokens=DEFAULT_MAX_TOKENS, tier="large"):
+    return {"name": name, "shape": "text", "max_tokens": max_tokens, "tier": tier}
+
+
+PROMPT_REGISTRY = {
+    # ── classification ────────────────────────────────────────────────
+    BROAD_CLASSIFICATION_PROMPT: _label("broad_classification", [
+        "legal", "company", "bank", "property", "personal", "others",
+    ]),
+    COMPANY_PROMPT: _label("company_classification", [
+        "company noc", "moa memorandum of association", "commercial license",
+        "incorporation certificate", "company registration", "incumbency certificate",
+        "translation of legal document", "certificate of good standing", "company",
+    ]),
+    LEGAL_PROMPT: _label("legal_classification", [
+        "title deed", "usufruct right certificate", "title deed lease to own",
+        "title deed (lease to own)", "title deed lease finance", "title deed (lease finance)", "pre title deed", "restrain property certificate",
+        "property restrain procedure", "initial contract of sale",
+        "initial contract of usufruct", "donation contract", "contract f", "legal",
+    ]),
+    BANK_PROMPT: _label("bank_classification", [
+        "cheques", "mortgage contract", "mortgage letter", "release of mortgage",
+        "liability letter", "customer statement", "registration tax", "receipt", "bank",
+    ]),
+    PROPERTY_PROMPT: _label("property_classification", [
+        "company noc", "valuation report", "noc non objection certificate", "noc", "soa", "property",
+    ]),
+    PERSONAL_PROMPT: _label("personal_classification", [
+        "ids", "passport", "residence visa", "poa", "clearance certificate",
+        "acknowledgment", "personal",
+    ]),
+    # The prompt only spells out "poa"; anything else means "not a POA" and
+    # must not count as an off-label answer.
+    POA_CHECK_PROMPT: _label("poa_check", [
+        "poa", "not poa", "not a poa", "no", "legal", "property", "others",
+    ]),
+    HIERARCHICAL_CLASSIFICATION_PROMPT: _json("hierarchical_classification", max_tokens=64, tier="small"),
+    SIDE_PROMPT: _label("id_side", ["front", "back", "both"], max_tokens=YES_NO_MAX_TOKENS),
+    detect_parties_prompt: _label("detect_parties", ["yes", "no"], max_tokens=YES_NO_MAX_TOKENS),
+    LANGUAGE_PROMPT_IMAGE_DETECT: _label("poa_language", ["yes", "no"], max_tokens=YES_NO_MAX_TOKENS),
+    LANGUAGE_PROMPT_TABLE_DETECT: _label("poa_table_language", ["yes", "no"], max_tokens=YES_NO_MAX_TOKENS),
+
+    # ── extraction ────────────────────────────────────────────────────
+    Titledeed__prompt: _json("title_deed"),
+    preTitledeed__prompt: _json("pre_title_deed"),
+    TD_finance_vlm_prompt: _json("title_deed_lease_finance"),
+    TD_lease_vlm_prompt: _json("title_deed_lease_to_own"),
+    usufruct_right_certificate_prompt: _json("usufruct_right_certificate"),
+    # Contract F may answer with one JSON block per section, so no early stop.
+    CONTRACT_F_PROMPT: _text("contract_f"),
+    INITIAL_CONTRACT_OF_SALE_PROMPT: _json("initial_contract_of_sale"),
+    extract_parties_and_vouchers_prompt: _json("initial_contract_parties"),
+    ID_vlm_prompt: _json("emirates_id"),
+    passport_prompt: _json("passport"),
+    # Only the fields a valid MRZ does not carry.
+    PASSPORT_ISSUE_DATE_PROMPT: _json("passport_issue_date", max_tokens=MRZ_FIELDS_MAX_TOKENS),
+    ID_FRONT_NON_MRZ_PROMPT: _json("emirates_id_front_non_mrz", max_tokens=MRZ_FIELDS_MAX_TOKENS),
+    VISA_PROMPT: _json("residence_visa"),
+    company_license_prompt: _json("commercial_license"),
+    incumbency_prompt: _json("incumbency_certificate"),
+    Incorporation_Certificate_prompt: _json("incorporation_certificate"),
+    certificate_good_stand_prompt: _json("certificate_of_good_standing"),
+    cheque_vlm_prompt: _json("cheques"),
+    MORTGAGE_LETTER_EXTRACTION_PROMPT: _json("mortgage_letter"),
+    NOC_vlm_prompt: _json("noc"),
+    POA_PROMPT_ENG: _json("poa_english"),
+    POA_PROMPT_ARABIC: _json("poa_arabic"),
+}
+
+# Broad category -> detailed types, as listed in the per-category prompts.
+CATEGORY_TYPE_LABELS = {
+    "legal": PROMPT_REGISTRY[LEGAL_PROMPT]["labels"],
+    "company": PROMPT_REGISTRY[COMPANY_PROMPT]["labels"],
+    "bank": PROMPT_REGISTRY[BANK_PROMPT]["labels"],
+    "property": PROMPT_REGISTRY[PROPERTY_PROMPT]["labels"],
+    "personal": PROMPT_REGISTRY[PERSONAL_PROMPT]["labels"],
+}
+
+# The single-call classifier answers in JSON; its "category" field is what
+# decides whether the small model's answer is usable.
+PROMPT_REGISTRY[HIERARCHICAL_CLASSIFICATION_PROMPT].update(
+    labels=PROMPT_REGISTRY[BROAD_CLASSIFICATION_PROMPT]["labels"],
+    label_key="category",
+)
+
+
+def get_prompt_spec(messages):
+    """
+    Returns the registry entry for the text part of a message list, or the
+    default free-text spec for prompts that are not registered.
+    """
+    for part in messages:
+        if part.get("type") == "text":
+            spec = PROMPT_REGISTRY.get(part.get("text"))
+            if spec is not None:
+                return spec
+    return DEFAULT_PROMPT_SPEC
+
+
+def multipage_prompt(prompt, page_count):
+    """
+    Wraps `prompt` for a request carrying `page_count` images and registers the
+    wrapped text, so call_vlm gives it a budget of page_count answers and stops
+    once the per-page JSON object closes.
+    """
+    page_keys = ", ".join(f'"Page_{i+1}"' for i in range(page_count))
+    text = MULTIPAGE_PROMPT_TEMPLATE.format(page_count=page_count, page_keys=page_keys, prompt=prompt)
+    if text not in PROMPT_REGISTRY:
+        base = PROMPT_REGISTRY.get(prompt, DEFAULT_PROMPT_SPEC)
+        spec = _json(
+            f"{base['name']}_x{page_count}",
+            max_tokens=min(MULTIPAGE_MAX_TOKENS, base["max_tokens"] * page_count + 32),
+            tier=base["tier"],
+        )
+        if base["shape"] == "label":
+            # Each "Page_N" value must be one of the base prompt's labels.
+            spec["labels"] = base["labels"]
+        PROMPT_REGISTRY[text] = spec
+    return text
+
+
+def route_model(spec):
+    """
+    Returns the model for a prompt spec: a VLM_MODEL_ROUTES override by
+    prompt name, else the spec's tier. With routing off everything goes to
+    the large model.
+    """
+    if not VLM_ROUTING_ENABLED:
+        return VLM_LARGE_MODEL
+    name = spec["name"]
+    tier = VLM_MODEL_ROUTES.get(name) or VLM_MODEL_ROUTES.get(name.rsplit("_x", 1)[0]) or spec["tier"]
+    return MODEL_TIERS.get(tier, tier)
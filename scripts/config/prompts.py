@@ -134,4 +134,65 @@ This document has been identified as a personal document. Based on its visible s
 - clearance certificate: issued by a government agency confirming all obligations are fulfilled.
 - acknowledgment: An acknowledgment document containing words like "إقرار" and "بيانات المقر" , "بيانات ممثل المقر" ,"بيانات المقر له".
 If the document does not clearly match any of these, return "personal".
-"""
\ No newline at end of file
+"""
+# Re-check for legal/property results that may actually be a POA:
+POA_CHECK_PROMPT = """
+        - this document was classified as legal so i want to check if it is a POA or not.
+        - power of attorney (POA) is considered personal document; you will find key words like "بيانات الوكيل" or "بيانات الموكل"
+          and they may appear in tables or as a header with "توكيل".
+        - if this document is POA, return only 'poa in lower.
+        """
+
+# Single-call classifier: broad category + detailed type + POA flag in one answer.
+HIERARCHICAL_CLASSIFICATION_PROMPT = """
+Classify this document in one step. First pick its broad category, then its exact type inside that category, then say whether it is a power of attorney.
+
+Categories and their types (use the type names exactly as written, in lowercase):
+1. legal – issued by the Dubai government / land department, never by a bank or a developer.
+   - title deed: header "Title Deed" / "شهادة ملكية عقار", plot number, area, "owners numbers and their shares", no letter body.
+   - usufruct right certificate: header "شهادة حق منفعة", lessors and lessees with their shares.
+   - title deed lease to own: header "title deed lease to own" / "شهادة ملكية عقار مقيد بحق الإجازة" / "شهادة ملكية العقار (إجازة)", owners and lessees with their shares.
+   - title deed lease finance: like a title deed but the header contains "title deed lease finance".
+   - pre title deed: header contains "شهادة بيع مبدئي" with Dubai government and land department logos.
+   - restrain property certificate: header "Restrain Property Certificate" / "شهادة تقييد عقار".
+   - property restrain procedure: "PROPERTY RESTRAIN" in the header, a transactional procedure document.
+   - initial contract of sale: initial / property sale contract between seller and buyer from Dubai government.
+   - initial contract of usufruct: header includes "initial contract of usufruct".
+   - donation contract: "donation contract" in the header.
+   - contract f: "Unified Sell Contract(F)" or "عقد البيع الموحد" in the header.
+2. company – company related documents, including a company noc given by JAFZA, DMCC or another authority.
+   - company noc, moa memorandum of association, commercial license, incorporation certificate, company registration, incumbency certificate, translation of legal document, certificate of good standing.
+3. bank – any bank letter or bank document; if a bank name is in the header it is a bank document.
+   - cheques, mortgage contract, mortgage letter ("تسجيل رهن", "registration of mortgages"), release of mortgage ("فك رهن"), liability letter, customer statement, registration tax, receipt.
+4. property – documents from the developer or a valuer.
+   - valuation report, noc non objection certificate ("شهادة عدم ممانعة", "لا مانع", issued by the developer with old and new purchaser details, not by JAFZA), soa (statement of account from the developer), company noc.
+5. personal – personal documents.
+   - ids (UAE identity card, front or back with machine readable zone), passport, residence visa ("إقامة" in the header), poa, clearance certificate, acknowledgment ("إقرار", "بيانات المقر").
+6. others – anything that does not clearly match.
+
+Power of attorney: set is_poa to true if the document is a power of attorney, e.g. it contains "بيانات الوكيل" or "بيانات الموكل" (often repeated as tables), "وكالة", "وكالة خاصة بالعقارات" or "توكيل" in the header. A POA is a personal document.
+
+If the exact type is unclear, use the category name as doc_type.
+Return only this JSON object, no extra text:
+{"category": "<category>", "doc_type": "<type>", "is_poa": <true or false>}
+"""
+
+# Wrapper used when several pages are packed into one VLM request.
+MULTIPAGE_PROMPT_TEMPLATE = """
+You are given {page_count} page images in order: the first image is Page_1, the second is Page_2, and so on.
+Apply the instructions below to each page on its own, as if it were the only image.
+Return only one JSON object with the keys {page_keys}. The value for each key is the answer for that page:
+a JSON object when the instructions ask for JSON, otherwise a string with the exact answer.
+
+Instructions for each page:
+{prompt}
+"""
+
+
+# Text-layer fast path: replaces the page image(s) for born-digital PDFs.
+TEXT_LAYER_PROMPT_TEMPLATE = """
+Below is the text layer of the document, extracted from the PDF in reading order (pages separated by "--- Page N ---").
+Treat it exactly as you would the page image: apply the instructions that follow to this text.
+
+{text}
+"""
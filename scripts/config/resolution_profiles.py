@@ -0,0 +1,56 @@
+# resolution_profiles.py
+#
+# How many pixels each kind of document gets. Image tokens dominate VLM
+# latency (Qwen2.5-VL spends one token per 28x28 patch), so every profile
+# asks for the smallest image that still keeps the text legible:
+#
+#   long_edge   target length of the longer side, in pixels
+#   min_dpi     lower bound for PDF pages (ignored for photos, which are never upscaled)
+#   max_pixels  hard cap on width * height; wins over the two above
+
+import math
+
+RESOLUTION_PROFILES = {
+    # Classification only needs the layout and headings.
+    "classification": {"long_edge": 1024, "min_dpi": 0, "max_pixels": 1024 * 1024},
+    # Emirates IDs, passports and visas: small print, often a card copied onto A4.
+    "id_card": {"long_edge": 1600, "min_dpi": 200, "max_pixels": 2_400_000},
+    "cheque": {"long_edge": 1600, "min_dpi": 150, "max_pixels": 1_200_000},
+    # Title deeds, NOCs, letters, certificates (zoom 1.75 on A4).
+    "a4_document": {"long_edge": 1474, "min_dpi": 110, "max_pixels": 1_600_000},
+    # Dense, multi-column forms and contracts.
+    "multi_column": {"long_edge": 1600, "min_dpi": 130, "max_pixels": 2_000_000},
+}
+
+DOC_TYPE_PROFILES = {
+    "ids": "id_card",
+    "passport": "id_card",
+    "residence visa": "id_card",
+    "cheques": "cheque",
+    "contract f": "multi_column",
+    "initial contract of sale": "multi_column",
+    "mortgage contract": "multi_column",
+}
+
+DEFAULT_PROFILE = "a4_document"
+
+
+def profile_for(doc_type):
+    """Returns the resolution profile for a doc_type (or a profile name)."""
+    if doc_type in RESOLUTION_PROFILES:
+        return RESOLUTION_PROFILES[doc_type]
+    name = DOC_TYPE_PROFILES.get(str(doc_type).lower().strip(), DEFAULT_PROFILE)
+    return RESOLUTION_PROFILES[name]
+
+
+def profile_scale(width, height, profile, dpi=None, upscale=False):
+    """
+    Scale factor to apply to a width x height source so it matches `profile`.
+    For PDF pages pass the page size in points with dpi=72 (the result is
+    the fitz zoom); for photos leave dpi None and upscale False.
+    """
+    scale = profile["long_edge"] / max(width, height)
+    if dpi and profile["min_dpi"]:
+        scale = max(scale, profile["min_dpi"] / dpi)
+    scale = min(scale, math.sqrt(profile["max_pixels"] / (width * height)))
+    return scale if upscale else min(1.0, scale)
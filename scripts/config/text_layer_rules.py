@@ -0,0 +1,56 @@
+# text_layer_rules.py
+#
+# Keyword rules for classifying born-digital PDFs from their text layer
+# (see scripts/utils/text_layer.py). Markers are the header phrases the
+# classification prompts already rely on. Rules are tried in order and the
+# first match wins, so more specific types come first:
+#
+#   doc_type   the same doc_type string the VLM classifier returns
+#   any_of     at least one of these must appear
+#   all_of     every one of these must appear (optional)
+#   none_of    none of these may appear (optional)
+#   issuer     one of ISSUER_MARKERS[issuer] must appear (optional)
+#
+# Matching is done on NFKC-normalized, lowercased text with tatweel removed
+# and whitespace collapsed. Documents no rule matches go to the VLM.
+
+ISSUER_MARKERS = {
+    "dld": [
+        "dubai land department",
+        "land department",
+        "دائرة الأراضي والأملاك",
+        "دائرة الاراضي والاملاك",
+    ],
+    # Free zone authorities: their NOCs are company NOCs, not developer NOCs.
+    "authority": [
+        "jafza", "jebel ali free zone", "jabal ali free zone", "dmcc",
+        "dubai development authority", "جافزا", "المنطقة الحرة لجبل علي",
+    ],
+}
+
+NOC_MARKERS = [
+    "شهادة عدم ممانعة", "رسالة عدم ممانعة", "non objection certificate", "no objection certificate",
+    "لا مانع من تحويل", "لا مانع من بيع",
+]
+
+TEXT_CLASSIFICATION_RULES = [
+    {"doc_type": "contract f", "any_of": ["unified sell contract", "عقد البيع الموحد"]},
+    {"doc_type": "initial contract of sale", "issuer": "dld",
+     "any_of": ["initial contract of sale", "property sale contract", "عقد البيع المبدئي", "عقد بيع مبدئي"]},
+    {"doc_type": "title deed lease to own", "issuer": "dld",
+     "any_of": ["title deed lease to own", "title deed (lease to own)", "شهادة ملكية عقار مقيد بحق الإجارة",
+                "شهادة ملكية عقار مقيد بحق الإجازة"]},
+    {"doc_type": "title deed lease finance", "issuer": "dld",
+     "any_of": ["title deed lease finance", "title deed (lease finance)"]},
+    {"doc_type": "usufruct right certificate", "issuer": "dld",
+     "any_of": ["usufruct right certificate", "شهادة حق منفعة"]},
+    {"doc_type": "restrain property certificate", "issuer": "dld",
+     "any_of": ["restrain property certificate", "شهادة تقييد عقار"], "none_of": ["استمارة"]},
+    {"doc_type": "pre title deed", "issuer": "dld", "any_of": ["شهادة بيع مبدئي", "pre title deed"]},
+    {"doc_type": "title deed", "issuer": "dld",
+     "any_of": ["title deed", "شهادة ملكية عقار"], "none_of": ["الموضوع", "طلب"]},
+    {"doc_type": "poa", "any_of": ["بيانات الوكيل"], "all_of": ["بيانات الموكل"]},
+    {"doc_type": "company noc", "issuer": "authority", "any_of": NOC_MARKERS},
+    {"doc_type": "noc non objection certificate", "any_of": NOC_MARKERS,
+     "none_of": ISSUER_MARKERS["authority"]},
+]
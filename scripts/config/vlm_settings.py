@@ -0,0 +1,160 @@
+# vlm_settings.py
+#
+# Runtime knobs for the VLM layer. Everything can be overridden with an
+# environment variable so the same code runs in Streamlit, batch jobs and
+# load tests without touching the source.
+
+import os
+
+VLM_MODEL = os.getenv("VLM_MODEL", "Qwen/Qwen2.5-VL-7B-Instruct")
+
+# Task-based model routing (see prompt_registry.route_model). Label-only
+# prompts use the small model and are escalated to the large one when the
+# answer is not in the allowed label set or the backend does not serve the
+# small model; extractions use the large model. Off by default: only turn it
+# on once VLM_SMALL_MODEL is known to be deployed on the configured backends.
+VLM_ROUTING_ENABLED = os.getenv("VLM_ROUTING_ENABLED", "0") == "1"
+VLM_SMALL_MODEL = os.getenv("VLM_SMALL_MODEL", "Qwen/Qwen2.5-VL-3B-Instruct")
+VLM_LARGE_MODEL = os.getenv("VLM_LARGE_MODEL", VLM_MODEL)
+# Per-prompt overrides, e.g. "id_side=large,poa_check=small".
+VLM_MODEL_ROUTES = dict(
+    route.strip().split("=", 1)
+    for route in os.getenv("VLM_MODEL_ROUTES", "").split(",")
+    if "=" in route
+)
+
+# Max number of VLM requests a batch may have in flight at the same time.
+VLM_MAX_IN_FLIGHT = int(os.getenv("VLM_MAX_IN_FLIGHT", "4"))
+
+# Per-call timeout in seconds (applies to the HTTP request and to the
+# asyncio wait around it).
+VLM_CALL_TIMEOUT = float(os.getenv("VLM_CALL_TIMEOUT", "120"))
+
+# Persistent response cache (see scripts/utils/vlm_cache.py).
+VLM_CACHE_ENABLED = os.getenv("VLM_CACHE_ENABLED", "1") == "1"
+VLM_CACHE_PATH = os.getenv("VLM_CACHE_PATH", os.path.join(".cache", "vlm_cache.sqlite3"))
+VLM_CACHE_MAX_BYTES = int(os.getenv("VLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+VLM_CACHE_TTL = float(os.getenv("VLM_CACHE_TTL", str(7 * 24 * 3600)))
+# A call waiting on an identical in-flight request gives up after this many
+# seconds and sends its own.
+VLM_CACHE_WAIT_TIMEOUT = float(os.getenv("VLM_CACHE_WAIT_TIMEOUT", "120"))
+
+# Document classifier: "single" sends one hierarchical request per document,
+# "cascade" keeps the broad -> detailed -> POA re-check sequence.
+VLM_CLASSIFIER_MODE = os.getenv("VLM_CLASSIFIER_MODE", "single")
+
+# Shared HTTP client (see scripts/utils/vlm_clients.py).
+VLM_BASE_URL = os.getenv("VLM_BASE_URL", "https://router.huggingface.co/hyperbolic/v1")
+VLM_POOL_CONNECTIONS = int(os.getenv("VLM_POOL_CONNECTIONS", "16"))
+VLM_KEEPALIVE_EXPIRY = float(os.getenv("VLM_KEEPALIVE_EXPIRY", "90"))
+VLM_HTTP2 = os.getenv("VLM_HTTP2", "1") == "1"
+
+# Backend pool (see scripts/utils/vlm_backends.py): comma-separated base URLs,
+# e.g. the router plus the dedicated Inference Endpoint
+#   VLM_BACKENDS="https://router.huggingface.co/hyperbolic/v1,https://mf32siy1syuf3src.us-east-1.aws.endpoints.huggingface.cloud/v1/"
+# Each call goes to the fastest healthy one. Defaults to VLM_BASE_URL alone.
+VLM_BACKENDS = [url.strip() for url in os.getenv("VLM_BACKENDS", VLM_BASE_URL).split(",") if url.strip()]
+VLM_HEALTH_INTERVAL = float(os.getenv("VLM_HEALTH_INTERVAL", "30"))
+VLM_HEALTH_TIMEOUT = float(os.getenv("VLM_HEALTH_TIMEOUT", "5"))
+# A backend that fails is skipped for this long (doubling per failure, max 8x)
+# unless a health check finds it up again sooner.
+VLM_BACKEND_COOLDOWN = float(os.getenv("VLM_BACKEND_COOLDOWN", "30"))
+# Latency history older than this is dropped so a backend that was slow once
+# gets re-measured.
+VLM_BACKEND_STALE_AFTER = float(os.getenv("VLM_BACKEND_STALE_AFTER", "600"))
+# A backend that answered "model not found" for a model is not asked for that
+# model again for this long.
+VLM_MODEL_MISSING_TTL = float(os.getenv("VLM_MODEL_MISSING_TTL", "3600"))
+
+# Multi-image requests: pack up to this many pages (and at most this many
+# base64 bytes of images) into one VLM call. 1 disables packing.
+VLM_PAGES_PER_REQUEST = int(os.getenv("VLM_PAGES_PER_REQUEST", "3"))
+VLM_MULTI_IMAGE_MAX_BYTES = int(os.getenv("VLM_MULTI_IMAGE_MAX_BYTES", str(int(2.5 * 1024 * 1024))))
+
+# Image encoding (see scripts/utils/image_encoder.py): byte budget per page
+# image, formats to try in order, and the smallest acceptable short side.
+VLM_IMAGE_MAX_BYTES = int(os.getenv("VLM_IMAGE_MAX_BYTES", str(int(1.3 * 1024 * 1024))))
+VLM_IMAGE_FORMATS = [fmt.strip().upper() for fmt in os.getenv("VLM_IMAGE_FORMATS", "png,webp,jpeg").split(",") if fmt.strip()]
+VLM_IMAGE_MIN_SIDE = int(os.getenv("VLM_IMAGE_MIN_SIDE", "512"))
+
+# In-process page render cache (see scripts/utils/render_cache.py).
+VLM_RENDER_CACHE_MAX_BYTES = int(os.getenv("VLM_RENDER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Process-pool rasterization (see scripts/utils/raster_pool.py). 0 workers =
+# one per CPU; documents with fewer uncached pages than VLM_RASTER_MIN_PAGES
+# are rendered in-process.
+VLM_RASTER_WORKERS = int(os.getenv("VLM_RASTER_WORKERS", "0"))
+VLM_RASTER_MIN_PAGES = int(os.getenv("VLM_RASTER_MIN_PAGES", "4"))
+
+# Flow control (see scripts/utils/rate_limiter.py).
+VLM_RATE_PER_SEC = float(os.getenv("VLM_RATE_PER_SEC", "4"))
+VLM_RATE_BURST = int(os.getenv("VLM_RATE_BURST", "8"))
+VLM_AIMD_MAX = int(os.getenv("VLM_AIMD_MAX", "16"))
+VLM_MAX_RETRIES = int(os.getenv("VLM_MAX_RETRIES", "4"))
+VLM_RETRY_BASE = float(os.getenv("VLM_RETRY_BASE", "1"))
+VLM_RETRY_CAP = float(os.getenv("VLM_RETRY_CAP", "30"))
+VLM_BREAKER_FAILURES = int(os.getenv("VLM_BREAKER_FAILURES", "5"))
+VLM_BREAKER_COOLDOWN = float(os.getenv("VLM_BREAKER_COOLDOWN", "15"))
+# How long a call may wait in line (breaker open, rate or concurrency limit,
+# retries) before giving up with VLMUnavailableError.
+VLM_QUEUE_TIMEOUT = float(os.getenv("VLM_QUEUE_TIMEOUT", "300"))
+
+# Hedged requests (see scripts/utils/hedging.py). Off by default.
+VLM_HEDGE_ENABLED = os.getenv("VLM_HEDGE_ENABLED", "0") == "1"
+VLM_HEDGE_PERCENTILE = float(os.getenv("VLM_HEDGE_PERCENTILE", "95"))
+VLM_HEDGE_MIN_DELAY = float(os.getenv("VLM_HEDGE_MIN_DELAY", "1.0"))
+VLM_HEDGE_MIN_SAMPLES = int(os.getenv("VLM_HEDGE_MIN_SAMPLES", "20"))
+VLM_HEDGE_BUDGET_PER_MIN = int(os.getenv("VLM_HEDGE_BUDGET_PER_MIN", "10"))
+# Optional second endpoint for the duplicate request; empty = same endpoint.
+VLM_HEDGE_BASE_URL = os.getenv("VLM_HEDGE_BASE_URL", "")
+
+# Per-call telemetry (see scripts/utils/vlm_telemetry.py).
+VLM_TELEMETRY_ENABLED = os.getenv("VLM_TELEMETRY_ENABLED", "1") == "1"
+VLM_TELEMETRY_PATH = os.getenv("VLM_TELEMETRY_PATH", os.path.join(".cache", "vlm_telemetry.jsonl"))
+VLM_TELEMETRY_MAX_BYTES = int(os.getenv("VLM_TELEMETRY_MAX_BYTES", str(10 * 1024 * 1024)))
+VLM_TELEMETRY_BACKUPS = int(os.getenv("VLM_TELEMETRY_BACKUPS", "5"))
+VLM_TELEMETRY_RING = int(os.getenv("VLM_TELEMETRY_RING", "2000"))
+
+# Native text-layer fast path (see scripts/utils/text_layer.py): born-digital
+# PDFs are classified from their text and extracted with text-only prompts.
+VLM_TEXT_LAYER_ENABLED = os.getenv("VLM_TEXT_LAYER_ENABLED", "1") == "1"
+VLM_TEXT_LAYER_MIN_CHARS = int(os.getenv("VLM_TEXT_LAYER_MIN_CHARS", "200"))
+# Text-only extraction can be turned off separately (classification stays on).
+VLM_TEXT_EXTRACTION_ENABLED = os.getenv("VLM_TEXT_EXTRACTION_ENABLED", "1") == "1"
+
+# Local MRZ decoding for passports and Emirates ID backs (see scripts/utils/mrz.py):
+# read from the text layer, or from a Tesseract OCR of the page's bottom band
+# when PyMuPDF finds Tesseract (VLM_MRZ_OCR_ENABLED). Never a VLM call.
+VLM_MRZ_ENABLED = os.getenv("VLM_MRZ_ENABLED", "1") == "1"
+VLM_MRZ_OCR_ENABLED = os.getenv("VLM_MRZ_OCR_ENABLED", "1") == "1"
+
+# Documents of one appointment processed concurrently (see
+# scripts/utils/appointment_executor.py). 1 = one after another.
+VLM_DOCUMENT_WORKERS = int(os.getenv("VLM_DOCUMENT_WORKERS", "4"))
+
+# Durable job queue (see scripts/utils/job_queue.py and scripts/job_worker.py).
+# When enabled, Submit enqueues the appointment's documents and a separate
+# `python -m scripts.job_worker` process runs them; the UI polls for results.
+VLM_JOB_QUEUE_ENABLED = os.getenv("VLM_JOB_QUEUE_ENABLED", "0") == "1"
+VLM_JOB_DB_PATH = os.getenv("VLM_JOB_DB_PATH", os.path.join(".cache", "jobs.sqlite3"))
+VLM_JOB_POLL_INTERVAL = float(os.getenv("VLM_JOB_POLL_INTERVAL", "1.0"))
+# Running jobs whose worker has not sent a heartbeat for this long are
+# re-queued (worker crashed or was restarted); after VLM_JOB_MAX_ATTEMPTS
+# claims they fail instead.
+VLM_JOB_HEARTBEAT = float(os.getenv("VLM_JOB_HEARTBEAT", "5"))
+VLM_JOB_STALE_AFTER = float(os.getenv("VLM_JOB_STALE_AFTER", "60"))
+VLM_JOB_MAX_ATTEMPTS = int(os.getenv("VLM_JOB_MAX_ATTEMPTS", "2"))
+# Finished jobs (and their results) are deleted after this many seconds.
+VLM_JOB_RETENTION = float(os.getenv("VLM_JOB_RETENTION", str(7 * 24 * 3600)))
+
+# Pre-processing of pending appointments (see scripts/prefetch_scheduler.py).
+# Appointments whose time slot starts within the horizon (or started less
+# than the grace period ago) are downloaded and queued at low priority,
+# soonest first. At most VLM_PREFETCH_MAX_PENDING such documents wait in the
+# queue at once, and each worker runs at most VLM_PREFETCH_WORKERS of them
+# in parallel, leaving its other threads to CSR submissions.
+VLM_PREFETCH_INTERVAL = float(os.getenv("VLM_PREFETCH_INTERVAL", "60"))
+VLM_PREFETCH_HORIZON = float(os.getenv("VLM_PREFETCH_HORIZON", str(24 * 3600)))
+VLM_PREFETCH_GRACE = float(os.getenv("VLM_PREFETCH_GRACE", str(2 * 3600)))
+VLM_PREFETCH_MAX_PENDING = int(os.getenv("VLM_PREFETCH_MAX_PENDING", "4"))
+VLM_PREFETCH_WORKERS = int(os.getenv("VLM_PREFETCH_WORKERS", "1"))
@@ -3,25 +3,63 @@ import json
 import fitz  # PyMuPDF
 from openai import OpenAI
 import re
-import streamlit as st
+from scripts.utils.streamlit_compat import st
 from scripts.vlm_utils import safe_json_loads,create_pdf_from_pages
 from scripts.config.individual_prompts import *
 from scripts.config.prompts import PERSONAL_PROMPT
+from scripts.config.resolution_profiles import profile_for
 from scripts.vlm_utils import (
     call_vlm,
-    pdf_page_to_png,
-    downscale_until,
-    THRESHOLD_BYTES
+    call_vlm_batch,
+    call_vlm_pages,
+    encode_pdf_page,
+    open_cached_pdf,
 )
+from scripts.utils.page_triage import content_pages
+from scripts.utils.mrz import read_page_mrz, covers_identity, apply_id_mrz, apply_passport_mrz
+from scripts.config.vlm_settings import VLM_MRZ_ENABLED
+from scripts.utils.vlm_clients import current_vlm_client
 
 
-def get_data_uri_from_page(doc, page_num, zoom=1.75):
-    page_bytes = pdf_page_to_png(doc, page_num, zoom=zoom)
-    data_uri, image_bytes, _ = downscale_until(page_bytes)
-    return data_uri, image_bytes
+def get_data_uri_from_page(doc, page_num, profile="id_card"):
+    encoded = encode_pdf_page(doc, page_num, profile=profile)
+    return encoded.data_uri, encoded.data
 
 
 
+def read_sides_and_mrz(doc, rendered, detail_types, id_pages):
+    """
+    Finds the side of every ID page and the MRZ of ID and passport pages.
+    The MRZ is read locally (text layer or OCR of the bottom band, see
+    read_page_mrz), never by the VLM. An ID page with a valid MRZ is a back;
+    only the other ID pages go through the packed side prompt.
+    Returns (sides, mrz): mrz only holds pages whose check digits pass.
+    """
+    passport_pages = [i for i in rendered if detail_types[i] == "passport"]
+    mrz = {}
+    for i in id_pages + passport_pages:
+        found = read_page_mrz(doc, i)
+        if found is not None:
+            mrz[i] = found
+    sides = {i: "back" for i in id_pages if i in mrz}
+
+    ask = [i for i in id_pages if i not in sides]
+    with st.spinner("Determining ID sides..."):
+        side_responses = call_vlm_pages(
+            [rendered[i][0] for i in ask], SIDE_PROMPT,
+            current_vlm_client(), return_exceptions=False
+        )
+    sides.update({i: resp.lower().strip() for i, (resp, _) in zip(ask, side_responses)})
+    return sides, mrz
+
+
+def report_mrz(page_idx, changed):
+    if changed:
+        st.write(f"Page {page_idx+1}: MRZ check digits passed, corrected {', '.join(changed)}.")
+    else:
+        st.write(f"Page {page_idx+1}: MRZ check digits passed, extraction confirmed.")
+
+
 def merge_ids(front_extracted, back_extracted):
     st.write(front_extracted)
     st.write(back_extracted)
@@ -36,6 +74,17 @@ def merge_ids(front_extracted, back_extracted):
                 front_inner[key] = back_inner.get(key)
     return {"front": front_inner, "back": front_extracted.get("back", {})}
 
+def merge_non_mrz_front(front_extracted, back_extracted):
+    """
+    Merges a short front extraction (ID_FRONT_NON_MRZ_PROMPT) into the full
+    extraction of the back; the MRZ fields are filled in by apply_id_mrz.
+    """
+    merged = {"front": dict(back_extracted.get("front", {})), "back": dict(back_extracted.get("back", {}))}
+    for key, value in front_extracted.get("front", {}).items():
+        if str(value).strip().lower() != "not mentioned" or key not in merged["front"]:
+            merged["front"][key] = value
+    return merged
+
 def merge_ids_complete(front_extracted, back_extracted):
     merged_front = front_extracted.get("front", {}).copy()
     back_front = back_extracted.get("front", {})
@@ -56,45 +105,84 @@ def merge_ids_complete(front_extracted, back_extracted):
 
 # ---------- MULTI-DOCUMENT PROCESSING FUNCTION (for IDs, passports, and residence visas) ----------
 def process_multi_document_ids(file_data, filename):
-    SIDE_PROMPT = """
-Inspect the ID image. If you see the 3‑line machine‑readable zone (MRZ) at the bottom and don't have portrait photo, answer 'back'.
-If you see the portrait photo, name fields and no MRZ, answer 'front'.
-If both are visible, answer 'both'.
-Return exactly one word: 'front', 'back', or 'both'.
-"""
-
     groups = []
     pdf_bytes = file_data.read()
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    doc = open_cached_pdf(pdf_bytes)
     total_pages = doc.page_count
     st.write(f"Total pages in PDF: {total_pages}")
     
-    page_idx = 0
+    # Blank pages are skipped; every other page is classified, since
+    # photocopies of different IDs look alike at thumbnail size.
+    kept, blank = content_pages(doc)
+    for p in blank:
+        st.info(f"Skipping page {p+1}: blank")
+
+    # Render the pages once and classify them all in packed, concurrent requests.
+    doc.prefetch(kept, profile=profile_for("id_card"))
+    rendered = {i: get_data_uri_from_page(doc, i) for i in kept}
+    with st.spinner(f"Classifying {len(kept)} page(s)..."):
+        detail_responses = call_vlm_pages(
+            [rendered[i][0] for i in kept], PERSONAL_PROMPT,
+            current_vlm_client(), return_exceptions=False
+        )
+    detail_types = {i: resp.lower().strip() for i, (resp, _) in zip(kept, detail_responses)}
+
+    id_pages = [i for i in kept if detail_types[i] == "ids"]
+    if VLM_MRZ_ENABLED:
+        sides, mrz = read_sides_and_mrz(doc, rendered, detail_types, id_pages)
+    else:
+        # Side detection for every page classified as an ID, also packed.
+        with st.spinner("Determining ID sides..."):
+            side_responses = call_vlm_pages(
+                [rendered[i][0] for i in id_pages], SIDE_PROMPT,
+                current_vlm_client(), return_exceptions=False
+            )
+        sides = {i: resp.lower().strip() for i, (resp, _) in zip(id_pages, side_responses)}
+        mrz = {}
+
+    def pending_group(pending):
+        extracted = pending["extracted"]
+        page = pending["page"]
+        if page - 1 in mrz:
+            extracted, changed = apply_id_mrz(extracted, mrz[page - 1])
+            report_mrz(page - 1, changed)
+        return {
+            "filename": filename,
+            "doc_type": "ids",
+            "pages": [page],
+            "image_bytes": pending["image"],
+            "extracted_data": extracted,
+            "original_pdf_bytes": pdf_bytes,
+            "pdf_bytes": create_pdf_from_pages(pdf_bytes, [page]),
+        }
+
+    pos = 0
     pending_back = None
-    while page_idx < total_pages:
-        data_uri, current_image = get_data_uri_from_page(doc, page_idx)
-        messages_detail = [
-            {"type": "image_url", "image_url": {"url": data_uri}},
-            {"type": "text", "text": PERSONAL_PROMPT}
-        ]
-        with st.spinner(f"Classifying page {page_idx+1}..."):
-            detail_result, _ = call_vlm(messages_detail, st.session_state.client)
-        detail_type = detail_result.lower().strip()
+    while pos < len(kept):
+        page_idx = kept[pos]
+        data_uri, current_image = rendered[page_idx]
+        detail_type = detail_types[page_idx]
         st.write(f"Page {page_idx+1} detailed type: {detail_type}")
         
         if detail_type in ["passport", "residence visa"]:
             extraction_prompt = passport_prompt if detail_type == "passport" else VISA_PROMPT
+            if detail_type == "passport" and covers_identity(mrz.get(page_idx)):
+                # The MRZ holds everything but the issue date.
+                extraction_prompt = PASSPORT_ISSUE_DATE_PROMPT
             messages_extract = [
                 {"type": "image_url", "image_url": {"url": data_uri}},
                 {"type": "text", "text": extraction_prompt}
             ]
             with st.spinner(f"Extracting data from page {page_idx+1} ({detail_type})..."):
-                extraction_response, _ = call_vlm(messages_extract, st.session_state.client)
+                extraction_response, _ = call_vlm(messages_extract, current_vlm_client())
             try:
                 cleaned = extraction_response.replace("```json", "").replace("```", "").strip()
                 extracted = json.loads(cleaned)
             except json.JSONDecodeError:
                 extracted = {"raw_text": extraction_response}
+            if detail_type == "passport" and page_idx in mrz:
+                extracted, changed = apply_passport_mrz(extracted, mrz[page_idx])
+                report_mrz(page_idx, changed)
 
             pages = [page_idx + 1]
             sliced_pdf = create_pdf_from_pages(pdf_bytes, pages)
@@ -106,22 +194,18 @@ Return exactly one word: 'front', 'back', or 'both'.
                 "image_bytes": current_image,
                 "extracted_data": extracted,
                 "original_pdf_bytes": pdf_bytes,
-                "pdf_bytes": sliced_pdf        # ← use 'pages' not 'pages_used'
+                "pdf_bytes": sliced_pdf,        # ← use 'pages' not 'pages_used'
             }
             groups.append(group)
-            page_idx += 1
+            pos += 1
 
         elif detail_type == "ids":
-            messages_side = [
-                {"type": "image_url", "image_url": {"url": data_uri}},
-                {"type": "text", "text": SIDE_PROMPT}
-            ]
-            with st.spinner(f"Determining side for page {page_idx+1} (ids)..."):
-                side_response, _ = call_vlm(messages_side, st.session_state.client)
-            side = side_response.lower().strip()
+            side = sides[page_idx]
             st.write(f"Page {page_idx+1} side: {side}")
 
             if side == "back":
+                if pending_back is not None:
+                    groups.append(pending_group(pending_back))
                 st.info(f"Page {page_idx+1} is a back page (out-of-order). Storing as pending back.")
                 extraction_prompt = ID_vlm_prompt
                 messages_extract_back = [
@@ -129,7 +213,7 @@ Return exactly one word: 'front', 'back', or 'both'.
                     {"type": "text", "text": extraction_prompt}
                 ]
                 with st.spinner(f"Extracting data from pending back (page {page_idx+1})..."):
-                    back_response, _ = call_vlm(messages_extract_back, st.session_state.client)
+                    back_response, _ = call_vlm(messages_extract_back, current_vlm_client())
                 try:
                     cleaned_back = back_response.replace("```json", "").replace("```", "").strip()
                     pending_back = {
@@ -143,16 +227,25 @@ Return exactly one word: 'front', 'back', or 'both'.
                         "extracted": {"raw_text": back_response},
                         "image": current_image
                     }
-                page_idx += 1
+                pos += 1
                 continue
 
-            extraction_prompt = ID_vlm_prompt
+            # With a valid MRZ on the matching back, the front only has to
+            # give the fields the MRZ lacks.
+            if pending_back is not None:
+                partner = pending_back["page"] - 1
+            elif pos + 1 < len(kept) and sides.get(kept[pos+1]) == "back":
+                partner = kept[pos+1]
+            else:
+                partner = None
+            short_front = side != "both" and partner is not None and covers_identity(mrz.get(partner))
+            extraction_prompt = ID_FRONT_NON_MRZ_PROMPT if short_front else ID_vlm_prompt
             messages_extract_front = [
                 {"type": "image_url", "image_url": {"url": data_uri}},
                 {"type": "text", "text": extraction_prompt}
             ]
             with st.spinner(f"Extracting data from Emirates ID front (page {page_idx+1})..."):
-                front_response, _ = call_vlm(messages_extract_front, st.session_state.client)
+                front_response, _ = call_vlm(messages_extract_front, current_vlm_client())
             try:
                 cleaned_front = front_response.replace("```json", "").replace("```", "").strip()
                 front_extracted = json.loads(cleaned_front)
@@ -164,49 +257,71 @@ Return exactly one word: 'front', 'back', or 'both'.
 
             if pending_back is not None:
                 st.info(f"Merging pending back (page {pending_back['page']}) with current front (page {page_idx+1}).")
-                merged = merge_ids_complete(front_extracted, pending_back["extracted"])
+                if short_front:
+                    merged = merge_non_mrz_front(front_extracted, pending_back["extracted"])
+                else:
+                    merged = merge_ids_complete(front_extracted, pending_back["extracted"])
                 pending_page = pending_back["page"]
+                if pending_page - 1 in mrz:
+                    merged, changed = apply_id_mrz(merged, mrz[pending_page - 1])
+                    report_mrz(pending_page - 1, changed)
                 pending_back = None
                 combined_extracted = merged
                 pages_used = [pending_page, page_idx+1]
-                page_idx += 1
+                pos += 1
             else:
-                if page_idx + 1 < total_pages:
-                    next_data_uri, next_image = get_data_uri_from_page(doc, page_idx+1)
-                    messages_side_next = [
-                        {"type": "image_url", "image_url": {"url": next_data_uri}},
-                        {"type": "text", "text": SIDE_PROMPT}
-                    ]
-                    with st.spinner(f"Determining side for page {page_idx+2} (ids)..."):
-                        side_next, _ = call_vlm(messages_side_next, st.session_state.client)
-                    side_next = side_next.lower().strip()
-                    st.write(f"Page {page_idx+2} side: {side_next}")
+                if pos + 1 < len(kept):
+                    next_idx = kept[pos+1]
+                    next_data_uri, next_image = rendered[next_idx]
+                    if next_idx in sides:
+                        side_next = sides[next_idx]
+                    else:
+                        messages_side_next = [
+                            {"type": "image_url", "image_url": {"url": next_data_uri}},
+                            {"type": "text", "text": SIDE_PROMPT}
+                        ]
+                        with st.spinner(f"Determining side for page {next_idx+1} (ids)..."):
+                            side_next, _ = call_vlm(messages_side_next, current_vlm_client())
+                        side_next = side_next.lower().strip()
+                    st.write(f"Page {next_idx+1} side: {side_next}")
                     if side_next == "back":
-                        ids_group = [page_idx+1, page_idx+2]
+                        ids_group = [page_idx+1, next_idx+1]
                         messages_extract_back = [
                             {"type": "image_url", "image_url": {"url": next_data_uri}},
-                            {"type": "text", "text": extraction_prompt}
+                            {"type": "text", "text": ID_vlm_prompt}
                         ]
-                        with st.spinner(f"Extracting data from Emirates ID back (page {page_idx+2})..."):
-                            back_response, _ = call_vlm(messages_extract_back, st.session_state.client)
+                        with st.spinner(f"Extracting data from Emirates ID back (page {next_idx+1})..."):
+                            back_response, _ = call_vlm(messages_extract_back, current_vlm_client())
                         try:
                             cleaned_back = back_response.replace("```json", "").replace("```", "").strip()
                             back_extracted = json.loads(cleaned_back)
                         except json.JSONDecodeError:
                             back_extracted = {"raw_text": back_response}
-                        merged = merge_ids_complete(front_extracted, back_extracted)
+                        if short_front:
+                            merged = merge_non_mrz_front(front_extracted, back_extracted)
+                        else:
+                            merged = merge_ids_complete(front_extracted, back_extracted)
+                        # The MRZ on the back verifies the fields read from both sides.
+                        if next_idx in mrz:
+                            merged, changed = apply_id_mrz(merged, mrz[next_idx])
+                            report_mrz(next_idx, changed)
                         combined_extracted = merged
-                        pages_used = [page_idx+1, page_idx+2]
+                        pages_used = [page_idx+1, next_idx+1]
                         group_front_img = current_image
-                        page_idx += 2
+                        pos += 2
                     else:
                         combined_extracted = front_extracted
                         pages_used = [page_idx+1]
-                        page_idx += 1
+                        pos += 1
                 else:
                     combined_extracted = front_extracted
                     pages_used = [page_idx+1]
-                    page_idx += 1
+                    pos += 1
+
+            # A page showing both sides carries its own MRZ.
+            if page_idx in mrz:
+                combined_extracted, changed = apply_id_mrz(combined_extracted, mrz[page_idx])
+                report_mrz(page_idx, changed)
 
             group = {
                 "filename": filename,
@@ -215,14 +330,18 @@ Return exactly one word: 'front', 'back', or 'both'.
                 "image_bytes": group_front_img,
                 "extracted_data": combined_extracted,
                 "original_pdf_bytes": pdf_bytes,
-                "pdf_bytes": create_pdf_from_pages(pdf_bytes, pages_used)
+                "pdf_bytes": create_pdf_from_pages(pdf_bytes, pages_used),
             }
             groups.append(group)
         else:
             # For any other type (e.g., "personal" or any unrecognized type),
             # skip the page (or handle as desired) and advance the page index.
             st.info(f"Skipping page {page_idx+1} with unsupported type: {detail_type}")
-            page_idx += 1
+            pos += 1
 
+    # A back without a front (or a page showing both sides that was taken
+    # for a back) is still returned.
+    if pending_back is not None:
+        groups.append(pending_group(pending_back))
     doc.close()
     return groups
\ No newline at end of file
@@ -1,17 +1,17 @@
-import tabula
 import base64
 import json
 import fitz  # PyMuPDF
 from openai import OpenAI
 import re
-import streamlit as st
+from scripts.utils.streamlit_compat import st
 from scripts.vlm_utils import safe_json_loads
 from scripts.config.poa_prompts import *
+from scripts.utils.vlm_clients import current_vlm_client
+from scripts.utils.pdf_tables import read_pdf_tables
 from scripts.vlm_utils import (
     call_vlm,
-    pdf_page_to_png,
-    downscale_until,
-    THRESHOLD_BYTES
+    encode_pdf_page,
+    open_cached_pdf,
 )
 def unify_poa_data(raw_data) -> dict:
     """
@@ -138,15 +138,6 @@ def unify_poa_data(raw_data) -> dict:
 
 
 
-fb_raw   = st.secrets["huggingface"]
-fb_creds = fb_raw.to_dict()  
-# Initialize VLM client once
-_client = OpenAI(
-    
-    # base_url="https://mf32siy1syuf3src.us-east-1.aws.endpoints.huggingface.cloud/v1/",
-    base_url="https://router.huggingface.co/hyperbolic/v1",
-    api_key=fb_creds["token"]
-)
 
 
 def _concatenate_tables_as_string(tables):
@@ -163,19 +154,27 @@ def _concatenate_tables_as_string(tables):
 
 
 
-def extract_power_of_attorney(pdf_path: str, max_pages: int = None) -> dict:
+def extract_power_of_attorney(pdf_source, max_pages: int = None) -> dict:
     """
     Extract power-of-attorney data by:
-      1. Attempting table-based extraction via Tabula.
+      1. Attempting table-based extraction (PyMuPDF table finder, in-process).
       2. Falling back to VLM image-based extraction (English then Arabic).
       3. Ensuring valid JSON, converting if needed.
       4. Unifying and normalizing fields.
 
+    `pdf_source` is the PDF bytes or a path to the file.
     Returns a Python dict ready for downstream processing.
     """
+    client = current_vlm_client()
+    if isinstance(pdf_source, (bytes, bytearray)):
+        data = bytes(pdf_source)
+    else:
+        with open(pdf_source, 'rb') as f:
+            data = f.read()
+
     # 1) Table-based extraction
     try:
-        tables = tabula.read_pdf(pdf_path, pages=[1,2,3,4], multiple_tables=True)
+        tables = read_pdf_tables(data, pages=[1,2,3,4])
         concatenated = _concatenate_tables_as_string(tables)
     except Exception:
         concatenated = ""
@@ -188,46 +187,34 @@ def extract_power_of_attorney(pdf_path: str, max_pages: int = None) -> dict:
             "Return only the JSON object with keys principals, attorneys, virtue_attorneys."
             "don't include any reasoning or notes"
         )
-        resp, _ = call_vlm([{"type": "text", "text": prompt}], _client)
+        resp, _ = call_vlm([{"type": "text", "text": prompt}], client)
         extracted_raw = resp
     else:
         # 2) Image-based extraction
-        with open(pdf_path, 'rb') as f:
-            data = f.read()
-        doc = fitz.open(stream=data, filetype="pdf")
+        doc = open_cached_pdf(data)
         limit = doc.page_count if max_pages is None else min(doc.page_count, max_pages)
 
         for p in range(limit):
-            img_bytes = pdf_page_to_png(doc, p)
-            if len(img_bytes) > THRESHOLD_BYTES:
-                data_uri, img_bytes, _ = downscale_until(img_bytes)
-            else:
-                enc = base64.b64encode(img_bytes).decode('utf-8')
-                data_uri = f"data:image/png;base64,{enc}"
+            data_uri = encode_pdf_page(doc, p, profile="poa").data_uri
 
             lang_resp, _ = call_vlm([
                 {"type": "image_url", "image_url": {"url": data_uri}},
                 {"type": "text",       "text": LANGUAGE_PROMPT_IMAGE_DETECT}
-            ], _client)
+            ], client)
 
             if "yes" in lang_resp.lower():
                 extracted_raw, _ = call_vlm([
                     {"type": "image_url", "image_url": {"url": data_uri}},
                     {"type": "text",       "text": POA_PROMPT_ENG}
-                ], _client)
+                ], client)
                 break
         else:
             # fallback to Arabic extraction on page 0
-            img_bytes = pdf_page_to_png(doc, 0)
-            if len(img_bytes) > THRESHOLD_BYTES:
-                data_uri, img_bytes, _ = downscale_until(img_bytes)
-            else:
-                enc = base64.b64encode(img_bytes).decode('utf-8')
-                data_uri = f"data:image/png;base64,{enc}"
+            data_uri = encode_pdf_page(doc, 0, profile="poa").data_uri
             extracted_raw, _ = call_vlm([
                 {"type": "image_url", "image_url": {"url": data_uri}},
                 {"type": "text",       "text": POA_PROMPT_ARABIC}
-            ], _client)
+            ], client)
         doc.close()
 
     # 3) Parse and clean raw JSON output
@@ -253,7 +240,7 @@ def extract_power_of_attorney(pdf_path: str, max_pages: int = None) -> dict:
             "also for each person you should return emirates_id (empty if doesn't exist) and passport_no (empty if doesn't exists)"
             ""
         )
-        fixed, _ = call_vlm([{"type": "text", "text": conv}], _client)
+        fixed, _ = call_vlm([{"type": "text", "text": conv}], client)
 
         try:
             parsed = json.loads(fixed)
@@ -0,0 +1,138 @@
+# job_worker.py
+#
+# Worker process for the durable job queue (scripts/utils/job_queue.py).
+# Claims queued documents, runs them through process_document with the
+# shared VLM client and stores the results, independent of any Streamlit
+# session: jobs keep running while CSRs navigate or the app restarts.
+#
+#   python -m scripts.job_worker --workers 4
+#   python -m scripts.job_worker --once        # drain the queue and exit
+#
+# Run several workers (on the same machine / DB file) to scale out; jobs
+# of a crashed worker are re-queued after VLM_JOB_STALE_AFTER seconds.
+
+import argparse
+import io
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from scripts.config.vlm_settings import (
+    VLM_DOCUMENT_WORKERS,
+    VLM_JOB_DB_PATH,
+    VLM_JOB_POLL_INTERVAL,
+    VLM_JOB_HEARTBEAT,
+    VLM_PREFETCH_WORKERS,
+)
+from scripts.utils.job_queue import JobQueue, INTERACTIVE_PRIORITY
+
+
+def run_job(queue, job, worker):
+    from scripts.utils.ocr_utils import process_document
+
+    queue.set_progress(job["id"], worker, "processing")
+    start = time.perf_counter()
+    try:
+        result = process_document(io.BytesIO(job["payload"]), job["filename"])
+    except Exception as e:
+        traceback.print_exc()
+        queue.fail(job["id"], worker, f"{type(e).__name__}: {e}")
+        print(f"[{worker}] failed {job['filename']} ({job['id']}): {e}")
+        return
+    queue.complete(job["id"], worker, result)
+    print(f"[{worker}] done {job['filename']} ({job['id']}) in {time.perf_counter() - start:.1f}s")
+
+
+def serve(queue, workers=VLM_DOCUMENT_WORKERS, poll_interval=VLM_JOB_POLL_INTERVAL, once=False, stop=None,
+          prefetch_workers=VLM_PREFETCH_WORKERS):
+    """
+    Claims and runs jobs on up to `workers` threads until `stop` is set (or,
+    with once=True, until the queue is empty and every claimed job finished).
+    At most `prefetch_workers` threads run below-interactive-priority jobs, so
+    pre-processing never occupies every thread when a CSR submits.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+    running = set()
+    background = set()
+    running_lock = threading.Lock()
+    slots = threading.Semaphore(workers)
+
+    def keep_alive():
+        while not stop.wait(VLM_JOB_HEARTBEAT):
+            with running_lock:
+                ids = list(running)
+            queue.heartbeat(ids, worker)
+            queue.requeue_stale()
+
+    def run(job):
+        try:
+            run_job(queue, job, worker)
+        finally:
+            with running_lock:
+                running.discard(job["id"])
+                background.discard(job["id"])
+            slots.release()
+
+    threading.Thread(target=keep_alive, name="job-heartbeat", daemon=True).start()
+    queue.requeue_stale()
+    queue.purge()
+    print(f"[{worker}] serving {queue.path} with {workers} thread(s)")
+    threads = []
+    while not stop.is_set():
+        slots.acquire()
+        if stop.is_set():
+            slots.release()
+            break
+        with running_lock:
+            saturated = len(background) >= prefetch_workers
+        job = queue.claim(worker, min_priority=INTERACTIVE_PRIORITY if saturated else None)
+        if job is None:
+            slots.release()
+            if once:
+                with running_lock:
+                    idle = not running
+                if idle:
+                    break
+            stop.wait(poll_interval)
+            continue
+        with running_lock:
+            running.add(job["id"])
+            if job["priority"] < INTERACTIVE_PRIORITY:
+                background.add(job["id"])
+        thread = threading.Thread(target=run, args=(job,), name=f"job-{job['id'][:8]}")
+        thread.start()
+        threads = [t for t in threads if t.is_alive()] + [thread]
+
+    for thread in threads:
+        thread.join()
+    stop.set()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process queued documents outside the Streamlit app.")
+    parser.add_argument("--db", default=VLM_JOB_DB_PATH, help="job queue SQLite file")
+    parser.add_argument("--workers", type=int, default=VLM_DOCUMENT_WORKERS, help="documents processed at once")
+    parser.add_argument("--prefetch-workers", type=int, default=VLM_PREFETCH_WORKERS,
+                        help="threads that may run pre-processing (low-priority) jobs")
+    parser.add_argument("--poll", type=float, default=VLM_JOB_POLL_INTERVAL, help="seconds between queue polls")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stop = threading.Event()
+    # Finish the documents in hand on Ctrl-C / SIGTERM; anything killed
+    # harder is re-queued by the next worker's stale sweep.
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    serve(JobQueue(args.db), workers=max(1, args.workers), poll_interval=args.poll, once=args.once, stop=stop,
+          prefetch_workers=max(0, args.prefetch_workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# prefetch_scheduler.py
+#
+# Pre-processes pending appointments before a CSR opens them. Every cycle
+# it loads the pending appointments (as the app does), picks the ones whose
+# time slot is coming up, soonest first, downloads their documents and
+# queues them at PREFETCH_PRIORITY in the job queue. Workers
+# (scripts/job_worker.py) run them on their spare threads. When the CSR
+# opens the appointment, the app loads the finished batch right away.
+#
+#   python -m scripts.prefetch_scheduler            # run from the app directory
+#   python -m scripts.prefetch_scheduler --once --dry-run
+#
+# Needs the same .streamlit/secrets.toml as the app (Firestore credentials)
+# and VLM_JOB_QUEUE_ENABLED=1 in the app so it shows the results.
+
+import argparse
+import hashlib
+import re
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from scripts.config.vlm_settings import (
+    VLM_JOB_DB_PATH,
+    VLM_PREFETCH_INTERVAL,
+    VLM_PREFETCH_HORIZON,
+    VLM_PREFETCH_GRACE,
+    VLM_PREFETCH_MAX_PENDING,
+)
+from scripts.utils.document_input import download_appointment_documents, prepare_document, DocumentInputError
+from scripts.utils.job_queue import JobQueue, PREFETCH_PRIORITY
+
+_SLOT_TIME = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([AaPp]\.?[Mm]\.?)?")
+
+
+def slot_start(row):
+    """
+    Start of the appointment as a naive local datetime, from "Appointment
+    Date" and the first time in "Time Slot" ("10:30 AM - 11:00 AM",
+    "14:00-14:30", ...). None when the date is missing or unreadable.
+    """
+    day = pd.to_datetime(row.get("Appointment Date"), errors="coerce")
+    if day is None or pd.isna(day):
+        return None
+    day = day.to_pydatetime()
+    if day.tzinfo is not None:
+        day = day.astimezone().replace(tzinfo=None)
+    start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    match = _SLOT_TIME.search(str(row.get("Time Slot") or ""))
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        meridiem = (match.group(3) or "").lower().replace(".", "")
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+        if hour < 24 and minute < 60:
+            start = start.replace(hour=hour, minute=minute)
+    return start
+
+
+def document_urls(row):
+    urls = row.get("Document URLs", None)
+    return list(urls) if isinstance(urls, (list, tuple)) else []
+
+
+def prefetch_batch_id(row):
+    """Stable per appointment and document set, so a cycle never queues the same documents twice."""
+    digest = hashlib.sha256("\n".join([str(row["ID"]), *document_urls(row)]).encode("utf-8"))
+    return f"prefetch-{digest.hexdigest()[:24]}"
+
+
+def plan(appointments, queue, now=None, horizon=VLM_PREFETCH_HORIZON, grace=VLM_PREFETCH_GRACE):
+    """
+    Appointment rows worth pre-processing, soonest slot first: with
+    documents, starting between now - grace and now + horizon, and not yet
+    queued, neither by an earlier cycle nor by a CSR.
+    """
+    now = now or datetime.now()
+    earliest, latest = now - timedelta(seconds=grace), now + timedelta(seconds=horizon)
+    due = []
+    for _, row in appointments.iterrows():
+        start = slot_start(row)
+        if start is None or not earliest <= start <= latest or not document_urls(row):
+            continue
+        queued = queue.latest_batch(str(row["ID"]))
+        # A CSR already submitted it, or this document set is queued/done.
+        if queued is not None and (not queued.startswith("prefetch-") or queued == prefetch_batch_id(row)):
+            continue
+        due.append((start, row))
+    due.sort(key=lambda item: item[0])
+    return [row for _, row in due]
+
+
+def prefetch_appointment(queue, row):
+    """Downloads, unlocks and queues one appointment's documents. Returns how many were queued."""
+    documents = []
+    for name, raw in download_appointment_documents(row):
+        password = str(row.get("Contract Password", None) or "").strip()
+        try:
+            documents.append(prepare_document(name, raw, password))
+        except DocumentInputError as e:
+            # Left for the CSR (e.g. a password only the customer knows).
+            print(f"skip {name}: {e}")
+    if documents:
+        queue.enqueue(documents, batch_id=prefetch_batch_id(row),
+                      appointment_id=str(row["ID"]), priority=PREFETCH_PRIORITY)
+    return len(documents)
+
+
+def run_cycle(db, queue, max_pending=VLM_PREFETCH_MAX_PENDING, dry_run=False):
+    """One scheduling pass. Returns the ids of the appointments queued (or due, with dry_run)."""
+    from scripts.firebase_connectors.fire_base_connection import load_appointments
+
+    budget = max_pending - queue.active_by_priority().get(PREFETCH_PRIORITY, 0)
+    appointments = load_appointments(db)
+    if budget <= 0 or appointments.empty:
+        return []
+    picked = []
+    for row in plan(appointments, queue):
+        if budget <= 0:
+            break
+        if dry_run:
+            print(f"due {row['ID']} at {slot_start(row)}: {len(document_urls(row))} document(s)")
+            picked.append(row["ID"])
+            budget -= len(document_urls(row))
+            continue
+        try:
+            queued = prefetch_appointment(queue, row)
+        except Exception as e:
+            print(f"prefetch failed for {row['ID']}: {e}")
+            continue
+        if queued:
+            print(f"queued {queued} document(s) of {row['ID']} (slot {slot_start(row)})")
+            picked.append(row["ID"])
+            budget -= queued
+    return picked
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pre-process documents of upcoming pending appointments.")
+    parser.add_argument("--db", default=VLM_JOB_DB_PATH, help="job queue SQLite file")
+    parser.add_argument("--interval", type=float, default=VLM_PREFETCH_INTERVAL, help="seconds between cycles")
+    parser.add_argument("--max-pending", type=int, default=VLM_PREFETCH_MAX_PENDING,
+                        help="pre-processing documents allowed in the queue at once")
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    parser.add_argument("--dry-run", action="store_true", help="list due appointments without queueing")
+    return parser.parse_args()
+
+
+def main():
+    from scripts.firebase_connectors.fire_base_connection import init_db
+
+    args = parse_args()
+    db, queue = init_db(), JobQueue(args.db)
+    while True:
+        try:
+            run_cycle(db, queue, max_pending=args.max_pending, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"prefetch cycle failed: {e}")
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
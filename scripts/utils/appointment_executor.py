@@ -0,0 +1,64 @@
+# appointment_executor.py
+#
+# Processes the documents of one appointment concurrently. Each document
+# runs on a worker thread that carries the Streamlit script context (so
+# st.* calls and st.session_state work) and writes into its own
+# pre-created expander, so logs of different documents don't interleave.
+# Results are returned in upload order; on_result is called on the script
+# thread as soon as each document finishes.
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from scripts.config.vlm_settings import VLM_DOCUMENT_WORKERS
+
+
+def process_documents(items, process_one, labels, workers=VLM_DOCUMENT_WORKERS, on_result=None):
+    """
+    Runs process_one(item) for every item on up to `workers` threads and
+    returns the results in `items` order. Each item gets a status line and
+    a collapsed "details" expander (titled by `labels`) that receives
+    process_one's output; on_result(index, result, status) runs on the
+    calling thread as each item completes and may overwrite the status line.
+    An exception in process_one is returned in place of its result.
+    """
+    statuses, details = [], []
+    for label in labels:
+        slot = st.container()
+        status = slot.empty()
+        status.write(f"⏳ {label}")
+        statuses.append(status)
+        details.append(slot.expander(f"{label} — details", expanded=False))
+    results = [None] * len(items)
+
+    if workers <= 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            with details[i]:
+                try:
+                    results[i] = process_one(item)
+                except Exception as e:
+                    results[i] = e
+            if on_result:
+                on_result(i, results[i], statuses[i])
+        return results
+
+    ctx = get_script_run_ctx()
+
+    def run(i, item):
+        add_script_run_ctx(ctx=ctx)
+        with details[i]:
+            return process_one(item)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="appointment-doc") as executor:
+        futures = {executor.submit(run, i, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = e
+            if on_result:
+                on_result(i, results[i], statuses[i])
+    return results
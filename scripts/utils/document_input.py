@@ -0,0 +1,85 @@
+# document_input.py
+#
+# Turns an uploaded or downloaded file into what process_document expects:
+# images become a one-page PDF, encrypted PDFs are unlocked and rewritten
+# without encryption. Used by the Streamlit upload path and by the job
+# worker, so both feed the pipeline identical bytes. Appointment documents
+# are downloaded here too, so every path names them the same way.
+
+import io
+
+import fitz  # PyMuPDF
+import requests
+from PIL import Image, ImageOps
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class DocumentInputError(Exception):
+    """The file cannot be turned into a processable PDF; the message is user-facing."""
+
+
+def image_to_pdf(raw):
+    img = Image.open(io.BytesIO(raw))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    pdf_buf = io.BytesIO()
+    img.save(pdf_buf, format="PDF")
+    return pdf_buf.getvalue()
+
+
+def unlock_pdf(raw, filename, password=None):
+    """Returns the PDF bytes with encryption removed (unchanged if not encrypted)."""
+    try:
+        doc = fitz.open(stream=raw, filetype="pdf")
+    except Exception as e:
+        raise DocumentInputError(f"❌ Could not open `{filename}` at all: {e}") from e
+    try:
+        if not doc.needs_pass:
+            return raw
+        if not password:
+            raise DocumentInputError(f"❌ `{filename}` is encrypted but no password provided.")
+        if not doc.authenticate(password):
+            raise DocumentInputError(f"❌ Wrong password for `{filename}`.")
+        try:
+            return doc.tobytes(encryption=fitz.PDF_ENCRYPT_NONE)  # full rewrite, strips encryption
+        except Exception as e:
+            raise DocumentInputError(f"❌ Could not write decrypted PDF for `{filename}`: {e}") from e
+    finally:
+        doc.close()
+
+
+def prepare_document(filename, raw, password=None):
+    """
+    Returns (name, pdf_bytes) ready for process_document: images are
+    converted (name gets a .pdf extension), PDFs are unlocked with `password`
+    when needed. Raises DocumentInputError when the file is unusable.
+    """
+    if filename.lower().endswith(IMAGE_EXTENSIONS):
+        try:
+            return f"{filename.rsplit('.', 1)[0]}.pdf", image_to_pdf(raw)
+        except Exception as e:
+            raise DocumentInputError(f"Failed to convert image `{filename}` to PDF: {e}") from e
+    return filename, unlock_pdf(raw, filename, password)
+
+
+def download_appointment_documents(row):
+    """
+    Downloads an appointment's "Document URLs" and returns [(name, bytes)]
+    named like the app always has: First_Last_doc<i>.<ext>.
+    """
+    urls = row.get("Document URLs", None)
+    if not isinstance(urls, (list, tuple)):  # missing in Firestore -> NaN in the frame
+        urls = []
+    documents = []
+    for i, url in enumerate(urls, 1):
+        r = requests.get(url, timeout=60)
+        r.raise_for_status()
+        ext = url.split('.')[-1].lower()
+        if ext not in ("pdf", "png", "jpg", "jpeg"):
+            # fallback to content-type header
+            ct = r.headers.get("Content-Type", "")
+            ext = "pdf" if "pdf" in ct else "jpg"
+        documents.append((f"{row['First Name']}_{row['Last Name']}_doc{i}.{ext}", r.content))
+    return documents
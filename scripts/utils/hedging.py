@@ -0,0 +1,221 @@
+# hedging.py
+#
+# Hedged VLM requests: if a call has not produced its first token within a
+# percentile of recent time-to-first-token for the same prompt and model, a
+# duplicate is sent (to the same or an alternate endpoint). Whichever
+# finishes first wins, the other is cancelled and only the winner's TTFT is
+# recorded. A per-minute budget caps how many duplicates we pay for.
+
+import collections
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from scripts.config.vlm_settings import (
+    VLM_HEDGE_ENABLED,
+    VLM_HEDGE_PERCENTILE,
+    VLM_HEDGE_MIN_DELAY,
+    VLM_HEDGE_MIN_SAMPLES,
+    VLM_HEDGE_BUDGET_PER_MIN,
+)
+from scripts.utils.vlm_telemetry import percentile
+
+
+class HedgeCancelled(Exception):
+    """Raised inside the losing stream of a hedged pair once it is cancelled."""
+
+
+def _close(stream):
+    close = getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        pass
+
+
+class StreamCancel:
+    """
+    Cancel flag for one VLM attempt. set() also closes the stream attached to
+    it, so a reader blocked waiting for the next chunk stops right away
+    instead of holding the connection until the server finishes. Cancelling
+    a parent cancels its children.
+    """
+
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._streams = []
+        self._children = []
+        if parent is not None:
+            parent._adopt(self)
+
+    def _adopt(self, child):
+        with self._lock:
+            self._children.append(child)
+            cancelled = self._event.is_set()
+        if cancelled:
+            child.set()
+
+    def attach(self, stream):
+        with self._lock:
+            self._streams.append(stream)
+            cancelled = self._event.is_set()
+        if cancelled:
+            _close(stream)
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            streams, children = list(self._streams), list(self._children)
+        for stream in streams:
+            _close(stream)
+        for child in children:
+            child.set()
+
+    def is_set(self):
+        return self._event.is_set()
+
+
+class LatencyTracker:
+    """
+    Keeps the last `size` time-to-first-token samples per key (prompt and
+    model, like the AIMD limiter): a long extraction is not "late" next to a
+    one-word classification.
+    """
+
+    def __init__(self, size=200):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds, key=None):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = collections.deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, pct, key=None):
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        return percentile(samples, pct), len(samples)
+
+
+class HedgeBudget:
+    """Sliding one-minute window allowing at most `per_minute` hedges."""
+
+    def __init__(self, per_minute=VLM_HEDGE_BUDGET_PER_MIN):
+        self.per_minute = per_minute
+        self._spent = collections.deque()
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._spent and now - self._spent[0] > 60:
+                self._spent.popleft()
+            if len(self._spent) >= self.per_minute:
+                return False
+            self._spent.append(now)
+            return True
+
+
+class HedgingPolicy:
+    def __init__(self, enabled=VLM_HEDGE_ENABLED, pct=VLM_HEDGE_PERCENTILE,
+                 min_delay=VLM_HEDGE_MIN_DELAY, min_samples=VLM_HEDGE_MIN_SAMPLES,
+                 budget=None):
+        self.enabled = enabled
+        self.pct = pct
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget or HedgeBudget()
+        self.ttft = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="vlm-hedge")
+
+    def hedge_delay(self, key=None):
+        """Seconds to wait for a first token before hedging, or None if we lack history for key."""
+        value, count = self.ttft.percentile(self.pct, key)
+        if value is None or count < self.min_samples:
+            return None
+        return max(self.min_delay, value)
+
+    def run(self, attempt, primary_client, hedge_client=None, stats=None, cancel=None, key=None):
+        """
+        Runs attempt(client, on_first_token, cancel) and, if the first token is
+        late for `key` and the budget allows, a second attempt against
+        hedge_client. Returns the result of whichever attempt finishes
+        successfully first; the other one is cancelled and its stream closed.
+        The winner's TTFT goes into the history for `key` and stats["ttft"]
+        (counted from the start of the call). Setting `cancel` cancels both.
+        """
+        if stats is not None:
+            stats["hedged"] = False
+        delay = self.hedge_delay(key) if self.enabled else None
+
+        started = time.monotonic()
+        primary_first = threading.Event()
+        first_tokens = {}
+
+        def first_token(name, launched):
+            def mark():
+                first_tokens.setdefault(name, (launched, time.monotonic()))
+                if name == "primary":
+                    primary_first.set()
+            return mark
+
+        def won(name, result):
+            if name in first_tokens:
+                launched, at = first_tokens[name]
+                self.ttft.record(at - launched, key)
+                if stats is not None:
+                    stats["ttft"] = at - started
+            return result
+
+        if delay is None:
+            return won("primary", attempt(primary_client, first_token("primary", started), cancel))
+
+        primary_cancel = StreamCancel(cancel)
+        primary = self._executor.submit(attempt, primary_client, first_token("primary", started), primary_cancel)
+        # A primary that fails (or answers) before its first token is counted
+        # must not sit out the rest of the delay.
+        primary.add_done_callback(lambda _: primary_first.set())
+        primary_first.wait(delay)
+        if primary_first.is_set() or primary.done() or not self.budget.try_spend():
+            return won("primary", primary.result())
+
+        if stats is not None:
+            stats["hedged"] = True
+        hedge_cancel = StreamCancel(cancel)
+        hedge = self._executor.submit(
+            attempt, hedge_client or primary_client, first_token("hedge", time.monotonic()), hedge_cancel
+        )
+        cancels = {primary: primary_cancel, hedge: hedge_cancel}
+        names = {primary: "primary", hedge: "hedge"}
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        cancels[other].set()
+                    if stats is not None:
+                        stats["hedge_won"] = future is hedge
+                    return won(names[future], future.result())
+                error = error or future.exception()
+        raise error
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_hedging_policy():
+    """Returns the process-wide hedging policy (and its TTFT history)."""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = HedgingPolicy()
+        return _policy
@@ -0,0 +1,159 @@
+# image_encoder.py
+#
+# Encodes a page image for the VLM under a byte budget. One bounded search
+# picks the format (lossless PNG first, then WebP or JPEG), the quality and,
+# if needed, a smaller resolution estimated from the previous attempt, always
+# keeping the aspect ratio. The data URI is only built when asked for.
+
+import base64
+import io
+import math
+
+from PIL import Image, ImageOps, features
+
+from scripts.config.vlm_settings import (
+    VLM_IMAGE_MAX_BYTES,
+    VLM_IMAGE_FORMATS,
+    VLM_IMAGE_MIN_SIDE,
+)
+from scripts.config.resolution_profiles import profile_scale
+
+LOSSY_QUALITIES = (85, 70)
+MAX_ENCODE_ATTEMPTS = 8
+
+_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class EncodedImage:
+    """Encoded image bytes plus format and size; `data_uri` is built on first use."""
+
+    def __init__(self, data, fmt, width, height, downscaled=False):
+        self.data = data
+        self.format = fmt
+        self.width = width
+        self.height = height
+        self.downscaled = downscaled
+        self._data_uri = None
+
+    @property
+    def mime_type(self):
+        return _MIME_TYPES[self.format]
+
+    @property
+    def data_uri(self):
+        if self._data_uri is None:
+            encoded = base64.b64encode(self.data).decode("utf-8")
+            self._data_uri = f"data:{self.mime_type};base64,{encoded}"
+        return self._data_uri
+
+    def __len__(self):
+        return len(self.data)
+
+
+def _available_formats(formats):
+    available = []
+    for fmt in formats:
+        fmt = fmt.upper()
+        if fmt == "WEBP" and not features.check("webp"):
+            continue
+        if fmt in _MIME_TYPES:
+            available.append(fmt)
+    return available or ["JPEG"]
+
+
+def _save(image, fmt, quality=None):
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buffer, format="PNG", optimize=False, compress_level=6)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _resized(image, scale):
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def load_image(source):
+    """Opens bytes, a file-like object or a PIL image as an upright RGB image."""
+    if isinstance(source, Image.Image):
+        image = source
+    else:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image
+
+
+def encode_image(source, max_bytes=VLM_IMAGE_MAX_BYTES, max_side=None,
+                 formats=VLM_IMAGE_FORMATS, min_side=VLM_IMAGE_MIN_SIDE, profile=None):
+    """
+    Encodes `source` (bytes, file-like or PIL image) into at most `max_bytes`
+    (None: no budget, the first format is used as is).
+
+    The image is first fitted within `max_side` pixels and, if given, the
+    resolution `profile` (aspect ratio kept, never upscaled).
+    At each resolution PNG is tried, then the first available lossy format at
+    LOSSY_QUALITIES; if nothing fits, the next resolution is estimated from the
+    smallest result so far. The search stops after MAX_ENCODE_ATTEMPTS encodes
+    or once the shorter side would drop below `min_side`, returning the
+    smallest encoding found.
+    """
+    image = load_image(source)
+    if profile is not None:
+        profile_side = round(max(image.size) * profile_scale(image.width, image.height, profile))
+        max_side = min(max_side, profile_side) if max_side else profile_side
+    formats = _available_formats(formats)
+    lossless = "PNG" in formats
+    lossy = next((fmt for fmt in formats if fmt != "PNG"), None)
+
+    scale = 1.0
+    # One pixel of slack: pages rendered at max_side may round up.
+    if max_side and max(image.size) > max_side + 1:
+        scale = max_side / max(image.size)
+    fitted_scale = scale
+    min_scale = min(1.0, min_side / min(image.size)) if min_side else 0.0
+
+    best = None
+    attempts = 0
+    while attempts < MAX_ENCODE_ATTEMPTS:
+        current = _resized(image, scale)
+        smallest = None
+        candidates = [("PNG", None)] if lossless else []
+        if lossy:
+            candidates += [(lossy, quality) for quality in LOSSY_QUALITIES]
+        for fmt, quality in candidates:
+            if attempts >= MAX_ENCODE_ATTEMPTS:
+                break
+            data = _save(current, fmt, quality)
+            attempts += 1
+            encoded = EncodedImage(data, fmt, current.width, current.height, downscaled=scale < fitted_scale)
+            if max_bytes is None or len(data) <= max_bytes:
+                return encoded
+            if smallest is None or len(data) < len(smallest):
+                smallest = encoded
+            if fmt == "PNG" and lossy and len(data) > 3 * max_bytes:
+                # A PNG this far over budget won't fit at any size we would
+                # accept either; use the lossy format from now on.
+                lossless = False
+        if best is None or len(smallest) < len(best):
+            best = smallest
+        if scale <= min_scale:
+            break
+        # Encoded size scales roughly with pixel count.
+        scale = max(min_scale, scale * math.sqrt(max_bytes / len(smallest)) * 0.95)
+    return best
+
+
+def image_to_data_uri(source, **kwargs):
+    """Shortcut returning (data_uri, bytes) like the old PNG helpers."""
+    encoded = encode_image(source, **kwargs)
+    return encoded.data_uri, encoded.data
@@ -0,0 +1,269 @@
+# job_queue.py
+#
+# Durable document-processing queue in a local SQLite file. The app enqueues
+# the (already unlocked) PDFs of an appointment as one batch; a separate
+# worker process (scripts/job_worker.py) claims jobs, runs process_document
+# and stores the pickled result. Jobs survive app and worker restarts: a
+# running job whose worker stops sending heartbeats is re-queued.
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+from scripts.config.vlm_settings import (
+    VLM_JOB_DB_PATH,
+    VLM_JOB_STALE_AFTER,
+    VLM_JOB_MAX_ATTEMPTS,
+    VLM_JOB_RETENTION,
+)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+# Documents a CSR submitted outrank ones pre-processed ahead of an
+# appointment (scripts/prefetch_scheduler.py).
+INTERACTIVE_PRIORITY, PREFETCH_PRIORITY = 0, -1
+
+# Columns returned by status queries (payload and result can be large).
+_STATUS_COLUMNS = (
+    "id", "batch_id", "appointment_id", "position", "filename", "priority", "status",
+    "progress", "error", "attempts", "worker", "created", "started", "finished", "heartbeat",
+)
+
+
+def new_batch_id():
+    return uuid.uuid4().hex
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue shared by the app and the worker processes.
+    Claims run in an IMMEDIATE transaction, so two workers never take the
+    same job.
+    """
+
+    def __init__(self, path=VLM_JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " batch_id TEXT NOT NULL,"
+            " appointment_id TEXT,"
+            " position INTEGER NOT NULL,"
+            " filename TEXT NOT NULL,"
+            " payload BLOB NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT NOT NULL,"
+            " progress TEXT,"
+            " result BLOB,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " created REAL NOT NULL,"
+            " started REAL,"
+            " finished REAL,"
+            " heartbeat REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, priority, created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs(batch_id, position)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_appointment ON jobs(appointment_id, created)")
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def enqueue(self, documents, batch_id=None, appointment_id=None, priority=INTERACTIVE_PRIORITY):
+        """
+        Queues [(filename, pdf_bytes), ...] as one batch, keeping their order.
+        Returns the batch id.
+        """
+        batch_id = batch_id or new_batch_id()
+        now = time.time()
+        rows = [
+            (uuid.uuid4().hex, batch_id, appointment_id, position, filename, payload, priority, QUEUED, now)
+            for position, (filename, payload) in enumerate(documents)
+        ]
+
+        def insert():
+            self._conn.executemany(
+                "INSERT INTO jobs (id, batch_id, appointment_id, position, filename, payload,"
+                " priority, status, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._transaction(insert)
+        return batch_id
+
+    def claim(self, worker, min_priority=None):
+        """
+        Marks the next queued job (highest priority, oldest first) as running
+        for `worker` and returns it as a dict with its payload, or None.
+        With min_priority, only jobs of at least that priority are taken.
+        """
+        def take():
+            row = self._conn.execute(
+                "SELECT id, batch_id, appointment_id, position, filename, payload, attempts, priority"
+                " FROM jobs WHERE status = ? AND priority >= ?"
+                " ORDER BY priority DESC, created, position LIMIT 1",
+                (QUEUED, -(2 ** 62) if min_priority is None else min_priority),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started = ?, heartbeat = ?,"
+                " progress = NULL, attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, worker, now, now, row[0]),
+            )
+            keys = ("id", "batch_id", "appointment_id", "position", "filename", "payload", "attempts", "priority")
+            job = dict(zip(keys, row))
+            job["attempts"] += 1
+            return job
+        return self._transaction(take)
+
+    def heartbeat(self, job_ids, worker):
+        """Refreshes the heartbeat of `worker`'s running jobs."""
+        if not job_ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = ?",
+                [(now, job_id, worker, RUNNING) for job_id in job_ids],
+            )
+
+    def set_progress(self, job_id, worker, message):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ? AND worker = ? AND status = ?",
+                (message, now, job_id, worker, RUNNING),
+            )
+
+    def complete(self, job_id, worker, result):
+        """Stores the result; ignored if the job was re-queued to another worker meanwhile."""
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished = ?, progress = NULL"
+                " WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, blob, time.time(), job_id, worker, RUNNING),
+            )
+
+    def fail(self, job_id, worker, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?, progress = NULL"
+                " WHERE id = ? AND worker = ? AND status = ?",
+                (FAILED, str(error), time.time(), job_id, worker, RUNNING),
+            )
+
+    def requeue_stale(self, stale_after=VLM_JOB_STALE_AFTER, max_attempts=VLM_JOB_MAX_ATTEMPTS):
+        """
+        Running jobs without a heartbeat for `stale_after` seconds go back to
+        the queue, or fail once they have been claimed `max_attempts` times.
+        Returns the number of jobs touched.
+        """
+        cutoff = time.time() - stale_after
+
+        def sweep():
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?"
+                " WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                (FAILED, "worker stopped responding", time.time(), RUNNING, cutoff, max_attempts),
+            ).rowcount
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, progress = NULL"
+                " WHERE status = ? AND heartbeat < ?",
+                (QUEUED, RUNNING, cutoff),
+            ).rowcount
+            return failed + requeued
+        return self._transaction(sweep)
+
+    def purge(self, retention=VLM_JOB_RETENTION):
+        """Deletes finished jobs older than `retention` seconds."""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                (*FINISHED, time.time() - retention),
+            ).rowcount
+
+    def batch_jobs(self, batch_id):
+        """Status rows (no payload or result) of a batch, in enqueue order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_STATUS_COLUMNS)} FROM jobs WHERE batch_id = ? ORDER BY position",
+                (batch_id,),
+            ).fetchall()
+        return [dict(zip(_STATUS_COLUMNS, row)) for row in rows]
+
+    def batch_results(self, batch_id):
+        """The unpickled results of a batch in enqueue order; None for jobs that are not done."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, result FROM jobs WHERE batch_id = ? ORDER BY position",
+                (batch_id,),
+            ).fetchall()
+        return [pickle.loads(result) if status == DONE and result is not None else None
+                for status, result in rows]
+
+    def latest_batch(self, appointment_id):
+        """The most recently enqueued batch id for an appointment, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT batch_id FROM jobs WHERE appointment_id = ? ORDER BY created DESC LIMIT 1",
+                (appointment_id,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def has_batch(self, batch_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM jobs WHERE batch_id = ? LIMIT 1", (batch_id,)).fetchone()
+        return row is not None
+
+    def active_by_priority(self):
+        """{priority: number of queued or running jobs}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT priority, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY priority",
+                (QUEUED, RUNNING),
+            ).fetchall()
+        return dict(rows)
+
+    def counts(self):
+        """{status: number of jobs}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def batch_finished(jobs):
+    return bool(jobs) and all(job["status"] in FINISHED for job in jobs)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Process-wide JobQueue on VLM_JOB_DB_PATH."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
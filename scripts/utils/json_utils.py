@@ -35,6 +35,31 @@ def _auto_close(txt: str) -> str:
         txt += closers[opener]
     return txt
 
+class JsonEndDetector:
+    """
+    Incremental scanner for streamed output: feed() returns True once the
+    first top-level JSON object/array has been closed.
+    """
+    def __init__(self):
+        self.depth, self.in_str, self.esc, self.started = 0, False, False, False
+
+    def feed(self, chunk: str) -> bool:
+        for ch in chunk:
+            if self.in_str:
+                if self.esc: self.esc = False
+                elif ch == "\\": self.esc = True
+                elif ch == '"': self.in_str = False
+            elif ch == '"' and self.started:
+                self.in_str = True
+            elif ch in "{[":
+                self.depth += 1
+                self.started = True
+            elif ch in "}]" and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
 def _clean_and_parse_string(txt: str) -> Any:
     txt = clean_json_string(txt)
     txt = re.sub(r"[\u4e00-\u9fff]+", "", txt)               # strip Chinese
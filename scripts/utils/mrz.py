@@ -0,0 +1,351 @@
+# mrz.py
+#
+# Local parsing and validation of ICAO 9303 machine-readable zones: TD1
+# (3 x 30, ID cards such as the Emirates ID back), TD2 (2 x 36) and TD3
+# (2 x 44, passports). The MRZ text comes from the page's text layer or a
+# local Tesseract OCR of its bottom band, never from a VLM call. A valid MRZ
+# (all check digits pass) lets the extraction ask only for the fields the
+# MRZ does not carry (issue date, Arabic name, ...), and verifies and
+# overwrites the fields it holds in the VLM extraction.
+
+import re
+from datetime import date
+
+from scripts.config.vlm_settings import VLM_MRZ_OCR_ENABLED
+
+_WEIGHTS = (7, 3, 1)
+_MRZ_LINE = re.compile(r"^[A-Z0-9<]+$")
+# Transcription slips in fields that can only hold digits.
+_DIGIT_FIXES = str.maketrans({"O": "0", "Q": "0", "D": "0", "I": "1", "L": "1",
+                              "Z": "2", "S": "5", "G": "6", "B": "8"})
+# Line count, line length and index of the name line per format. Lines
+# missing a few trailing '<' are padded; the name line may lose all of them.
+_FORMATS = (("TD1", 3, 30, 2), ("TD3", 2, 44, 0), ("TD2", 2, 36, 0))
+_MAX_PADDING = 3
+_MIN_LINE = 8
+# The MRZ sits in the bottom part of the page; only that band is OCRed.
+MRZ_BAND_TOP = 0.55
+
+
+def check_digit(value):
+    """ICAO 9303 check digit (weights 7-3-1; A-Z = 10-35, '<' = 0)."""
+    total = 0
+    for i, char in enumerate(value):
+        if char.isdigit():
+            number = int(char)
+        elif "A" <= char <= "Z":
+            number = ord(char) - 55
+        else:
+            number = 0
+        total += number * _WEIGHTS[i % 3]
+    return str(total % 10)
+
+
+def _digits(value):
+    return value.translate(_DIGIT_FIXES)
+
+
+def _check(value, digit, numeric=False):
+    if numeric:
+        value = _digits(value)
+    return check_digit(value) == _digits(digit)
+
+
+def _date(yymmdd, future=False):
+    """YYMMDD -> dd/mm/yyyy. Birth dates are in the past, expiry dates after 2000."""
+    yymmdd = _digits(yymmdd)
+    if not yymmdd.isdigit():
+        return None
+    yy, mm, dd = int(yymmdd[:2]), int(yymmdd[2:4]), int(yymmdd[4:])
+    if future:
+        year = 2000 + yy
+    else:
+        year = 2000 + yy if 2000 + yy <= date.today().year else 1900 + yy
+    try:
+        return date(year, mm, dd).strftime("%d/%m/%Y")
+    except ValueError:
+        return None
+
+
+def _names(field):
+    surname, _, given = field.strip("<").partition("<<")
+    return surname.replace("<", " ").strip(), given.replace("<", " ").strip()
+
+
+def _clean(field):
+    return field.replace("<", " ").strip()
+
+
+def _normalize_line(line):
+    return line.strip().upper().replace(" ", "").replace("«", "<")
+
+
+def _parse_td1(l1, l2, l3):
+    surname, given = _names(l3)
+    checks = {
+        "document_number": _check(l1[5:14], l1[14]),
+        "birth_date": _check(l2[0:6], l2[6], numeric=True),
+        "expiry_date": _check(l2[8:14], l2[14], numeric=True),
+        "composite": _check(l1[5:30] + _digits(l2[0:7]) + _digits(l2[8:15]) + l2[18:29], l2[29]),
+    }
+    return {
+        "format": "TD1",
+        "document_code": _clean(l1[0:2]),
+        "issuing_state": _clean(l1[2:5]),
+        "document_number": _clean(l1[5:14]),
+        "optional_data": _clean(l1[15:30]),
+        "birth_date": _date(l2[0:6]),
+        "sex": l2[7],
+        "expiry_date": _date(l2[8:14], future=True),
+        "nationality": _clean(l2[15:18]),
+        "surname": surname,
+        "given_names": given,
+        # No filler at the end of the name field: the name may be cut off.
+        "name_truncated": not l3.endswith("<"),
+        "checks": checks,
+    }
+
+
+def _parse_two_line(fmt, l1, l2):
+    surname, given = _names(l1[5:])
+    length = len(l2)
+    code = _clean(l1[0:2])
+    checks = {
+        "document_number": _check(l2[0:9], l2[9]),
+        "birth_date": _check(l2[13:19], l2[19], numeric=True),
+        "expiry_date": _check(l2[21:27], l2[27], numeric=True),
+    }
+    # Visas (MRV-A/B) have no composite check digit.
+    if not code.startswith("V"):
+        composite_data = l2[0:10] + _digits(l2[13:20]) + _digits(l2[21:28]) + l2[28:length - 1]
+        checks["composite"] = _check(composite_data, l2[length - 1])
+    return {
+        "format": fmt,
+        "document_code": code,
+        "issuing_state": _clean(l1[2:5]),
+        "document_number": _clean(l2[0:9]),
+        "optional_data": _clean(l2[28:length - 1]),
+        "birth_date": _date(l2[13:19]),
+        "sex": l2[20],
+        "expiry_date": _date(l2[21:27], future=True),
+        "nationality": _clean(l2[10:13]),
+        "surname": surname,
+        "given_names": given,
+        "name_truncated": not l1.endswith("<"),
+        "checks": checks,
+    }
+
+
+def parse_mrz(lines):
+    """
+    Parses normalized MRZ lines of one format. Returns a dict of fields plus
+    "checks" (per check digit) and "valid" (all of them pass), or None if the
+    lines do not have a known MRZ shape.
+    """
+    for fmt, count, length, name_line in _FORMATS:
+        if len(lines) != count:
+            continue
+        shortest = [_MIN_LINE if i == name_line else length - _MAX_PADDING for i in range(count)]
+        if not all(low <= len(line) <= length for low, line in zip(shortest, lines)):
+            continue
+        padded = [line.ljust(length, "<") for line in lines]
+        parsed = _parse_td1(*padded) if fmt == "TD1" else _parse_two_line(fmt, *padded)
+        parsed["valid"] = all(parsed["checks"].values())
+        return parsed
+    return None
+
+
+def find_mrz(text):
+    """
+    Finds an MRZ in free text (a page's text layer or a transcription) and
+    parses it. Returns the best candidate (a valid one if any) or None.
+    """
+    if not text:
+        return None
+    lines = [_normalize_line(line) for line in text.splitlines()]
+    candidates = [line if _MRZ_LINE.match(line) and len(line) >= _MIN_LINE else None
+                  for line in lines]
+    best = None
+    for i in range(len(candidates)):
+        for count in (3, 2):
+            group = candidates[i:i + count]
+            if len(group) != count or None in group or not any("<" in line for line in group):
+                continue
+            parsed = parse_mrz(group)
+            if parsed is None:
+                continue
+            if parsed["valid"]:
+                return parsed
+            best = best or parsed
+    return best
+
+
+def read_page_mrz(doc, page_num):
+    """
+    The valid MRZ of a CachedDocument page, from its text layer or else from
+    an OCR of its bottom band (when Tesseract is available). None otherwise.
+    """
+    found = find_mrz(doc.text(page_num))
+    if (found is None or not found["valid"]) and VLM_MRZ_OCR_ENABLED:
+        found = find_mrz(doc.ocr_text(page_num, top=MRZ_BAND_TOP))
+    return found if found is not None and found["valid"] else None
+
+
+def covers_identity(mrz):
+    """True when the MRZ alone gives the full name, so only non-MRZ fields need the VLM."""
+    return mrz is not None and mrz["valid"] and not mrz["name_truncated"] and bool(mrz["surname"])
+
+
+def full_name(mrz):
+    return " ".join(part for part in (mrz["given_names"], mrz["surname"]) if part)
+
+
+def emirates_id_number(mrz):
+    """The 15-digit Emirates ID number from a UAE TD1 MRZ, as 784-YYYY-NNNNNNN-C."""
+    digits = _digits(mrz.get("optional_data", "").replace(" ", ""))
+    if mrz.get("issuing_state") != "ARE" or not re.fullmatch(r"784\d{12}", digits):
+        return None
+    return f"{digits[:3]}-{digits[3:7]}-{digits[7:14]}-{digits[14]}"
+
+
+# ICAO 9303 nationality codes (ISO 3166-1 alpha-3 plus ICAO additions) ->
+# English country name, the form the extraction prompts return.
+COUNTRY_NAMES = {
+    "AFG": "Afghanistan", "ALB": "Albania", "DZA": "Algeria", "AND": "Andorra", "AGO": "Angola",
+    "ATG": "Antigua and Barbuda", "ARG": "Argentina", "ARM": "Armenia", "AUS": "Australia",
+    "AUT": "Austria", "AZE": "Azerbaijan", "BHS": "Bahamas", "BHR": "Bahrain", "BGD": "Bangladesh",
+    "BRB": "Barbados", "BLR": "Belarus", "BEL": "Belgium", "BLZ": "Belize", "BEN": "Benin",
+    "BTN": "Bhutan", "BOL": "Bolivia", "BIH": "Bosnia and Herzegovina", "BWA": "Botswana",
+    "BRA": "Brazil", "BRN": "Brunei", "BGR": "Bulgaria", "BFA": "Burkina Faso", "BDI": "Burundi",
+    "CPV": "Cape Verde", "KHM": "Cambodia", "CMR": "Cameroon", "CAN": "Canada",
+    "CAF": "Central African Republic", "TCD": "Chad", "CHL": "Chile", "CHN": "China",
+    "COL": "Colombia", "COM": "Comoros", "COG": "Congo", "COD": "Democratic Republic of the Congo",
+    "CRI": "Costa Rica", "CIV": "Ivory Coast", "HRV": "Croatia", "CUB": "Cuba", "CYP": "Cyprus",
+    "CZE": "Czech Republic", "DNK": "Denmark", "DJI": "Djibouti", "DMA": "Dominica",
+    "DOM": "Dominican Republic", "ECU": "Ecuador", "EGY": "Egypt", "SLV": "El Salvador",
+    "GNQ": "Equatorial Guinea", "ERI": "Eritrea", "EST": "Estonia", "SWZ": "Eswatini",
+    "ETH": "Ethiopia", "FJI": "Fiji", "FIN": "Finland", "FRA": "France", "GAB": "Gabon",
+    "GMB": "Gambia", "GEO": "Georgia", "D": "Germany", "DEU": "Germany", "GHA": "Ghana",
+    "GRC": "Greece", "GRD": "Grenada", "GTM": "Guatemala", "GIN": "Guinea", "GNB": "Guinea-Bissau",
+    "GUY": "Guyana", "HTI": "Haiti", "HND": "Honduras", "HKG": "Hong Kong", "HUN": "Hungary",
+    "ISL": "Iceland", "IND": "India", "IDN": "Indonesia", "IRN": "Iran", "IRQ": "Iraq",
+    "IRL": "Ireland", "ISR": "Israel", "ITA": "Italy", "JAM": "Jamaica", "JPN": "Japan",
+    "JOR": "Jordan", "KAZ": "Kazakhstan", "KEN": "Kenya", "KIR": "Kiribati", "PRK": "North Korea",
+    "KOR": "South Korea", "RKS": "Kosovo", "KWT": "Kuwait", "KGZ": "Kyrgyzstan", "LAO": "Laos",
+    "LVA": "Latvia", "LBN": "Lebanon", "LSO": "Lesotho", "LBR": "Liberia", "LBY": "Libya",
+    "LIE": "Liechtenstein", "LTU": "Lithuania", "LUX": "Luxembourg", "MAC": "Macao",
+    "MDG": "Madagascar", "MWI": "Malawi", "MYS": "Malaysia", "MDV": "Maldives", "MLI": "Mali",
+    "MLT": "Malta", "MHL": "Marshall Islands", "MRT": "Mauritania", "MUS": "Mauritius",
+    "MEX": "Mexico", "FSM": "Micronesia", "MDA": "Moldova", "MCO": "Monaco", "MNG": "Mongolia",
+    "MNE": "Montenegro", "MAR": "Morocco", "MOZ": "Mozambique", "MMR": "Myanmar", "NAM": "Namibia",
+    "NRU": "Nauru", "NPL": "Nepal", "NLD": "Netherlands", "NZL": "New Zealand", "NIC": "Nicaragua",
+    "NER": "Niger", "NGA": "Nigeria", "MKD": "North Macedonia", "NOR": "Norway", "OMN": "Oman",
+    "PAK": "Pakistan", "PLW": "Palau", "PSE": "Palestine", "PAN": "Panama",
+    "PNG": "Papua New Guinea", "PRY": "Paraguay", "PER": "Peru", "PHL": "Philippines",
+    "POL": "Poland", "PRT": "Portugal", "QAT": "Qatar", "ROU": "Romania", "RUS": "Russia",
+    "RWA": "Rwanda", "KNA": "Saint Kitts and Nevis", "LCA": "Saint Lucia",
+    "VCT": "Saint Vincent and the Grenadines", "WSM": "Samoa", "SMR": "San Marino",
+    "STP": "Sao Tome and Principe", "SAU": "Saudi Arabia", "SEN": "Senegal", "SRB": "Serbia",
+    "SYC": "Seychelles", "SLE": "Sierra Leone", "SGP": "Singapore", "SVK": "Slovakia",
+    "SVN": "Slovenia", "SLB": "Solomon Islands", "SOM": "Somalia", "ZAF": "South Africa",
+    "SSD": "South Sudan", "ESP": "Spain", "LKA": "Sri Lanka", "SDN": "Sudan", "SUR": "Suriname",
+    "SWE": "Sweden", "CHE": "Switzerland", "SYR": "Syria", "TWN": "Taiwan", "TJK": "Tajikistan",
+    "TZA": "Tanzania", "THA": "Thailand", "TLS": "Timor-Leste", "TGO": "Togo", "TON": "Tonga",
+    "TTO": "Trinidad and Tobago", "TUN": "Tunisia", "TUR": "Turkey", "TKM": "Turkmenistan",
+    "TUV": "Tuvalu", "UGA": "Uganda", "UKR": "Ukraine", "ARE": "United Arab Emirates",
+    "GBR": "United Kingdom", "GBD": "United Kingdom", "GBN": "United Kingdom",
+    "GBO": "United Kingdom", "GBP": "United Kingdom", "GBS": "United Kingdom",
+    "USA": "United States", "URY": "Uruguay", "UZB": "Uzbekistan", "VUT": "Vanuatu",
+    "VAT": "Vatican City", "VEN": "Venezuela", "VNM": "Vietnam", "YEM": "Yemen", "ZMB": "Zambia",
+    "ZWE": "Zimbabwe",
+}
+
+
+def nationality_name(code):
+    """English country name for an MRZ nationality code, None if unknown."""
+    return COUNTRY_NAMES.get(code.replace(" ", "")) if code else None
+
+
+def _letters(name):
+    return sorted(re.sub(r"[^A-Z ]", " ", str(name).upper()).split())
+
+
+def _mrz_name(mrz, current):
+    """
+    The MRZ name unless the extracted one already spells the same words
+    (it keeps its casing) or the MRZ name field was full and may be cut off.
+    """
+    name = full_name(mrz)
+    if not name or mrz.get("name_truncated") or _letters(current) == _letters(name):
+        return current
+    return name.title()
+
+
+def _mrz_sex(value, current, long_form):
+    """The MRZ sex (M/F) in the form of the current value: "M"/"F" or "Male"/"Female"."""
+    if value not in ("M", "F"):
+        return current
+    if str(current).strip()[:1].upper() == value:
+        return current
+    return {"M": "Male", "F": "Female"}[value] if long_form else value
+
+
+def _overwrite(fields, values):
+    """Copies the MRZ values that were read; returns the names of fields that changed."""
+    changed = []
+    for key, value in values.items():
+        if value and fields.get(key) != value:
+            changed.append(key)
+            fields[key] = value
+    return changed
+
+
+def apply_passport_mrz(extracted, mrz, missing="Not found"):
+    """
+    passport_prompt's extraction with the fields the (valid) MRZ holds
+    replaced by the MRZ values: name, nationality, birth and expiry dates,
+    gender and passport number. Everything else (issue date, ...) is kept.
+    Returns (fields, changed keys).
+    """
+    fields = dict(extracted) if isinstance(extracted, dict) else {}
+    for key in ("fullname", "Nationality or Place of Birth", "Date of Birth", "Gender",
+                "Date of Issue", "Date of Expiry"):
+        fields.setdefault(key, missing)
+    changed = _overwrite(fields, {
+        "fullname": _mrz_name(mrz, fields["fullname"]),
+        "Nationality or Place of Birth": nationality_name(mrz["nationality"]),
+        "Date of Birth": mrz["birth_date"],
+        "Gender": _mrz_sex(mrz["sex"], fields["Gender"], long_form=False),
+        "Date of Expiry": mrz["expiry_date"],
+        "Passport Number": mrz["document_number"],
+    })
+    return fields, changed
+
+
+def apply_id_mrz(extracted, mrz, missing="not mentioned"):
+    """
+    ID_vlm_prompt's {"front", "back"} extraction with the front fields the
+    (valid) MRZ holds replaced: English name, Emirates ID number,
+    nationality, gender, birth and expiry dates. The Arabic name, issuing
+    date and the back (occupation, issuing place) are kept.
+    Returns (fields, changed keys).
+    """
+    extracted = extracted if isinstance(extracted, dict) else {}
+    front = dict(extracted.get("front") or {})
+    for key in ("name_arabic", "name_english", "emirates_id", "nationality", "gender",
+                "issuing_date", "expiry_date", "date_of_birth"):
+        front.setdefault(key, missing)
+    back = dict(extracted.get("back") or {})
+    for key in ("occupation", "issuing_place"):
+        back.setdefault(key, missing)
+    changed = _overwrite(front, {
+        "name_english": _mrz_name(mrz, front["name_english"]),
+        "emirates_id": emirates_id_number(mrz),
+        "nationality": nationality_name(mrz["nationality"]),
+        "gender": _mrz_sex(mrz["sex"], front["gender"], long_form=True),
+        "expiry_date": mrz["expiry_date"],
+        "date_of_birth": mrz["birth_date"],
+    })
+    fields = {key: value for key, value in extracted.items() if key not in ("front", "back")}
+    fields.update({"front": front, "back": back})
+    return fields, changed
@@ -1,4 +1,3 @@
-import streamlit as st
 import time
 import fitz  # PyMuPDF
 import base64
@@ -9,63 +8,39 @@ import json
 import zipfile
 from datetime import datetime
 from PIL import Image, ImageOps
-from scripts.validation import *    
 from scripts.vlm_utils import *      
 from openai import OpenAI
 from scripts.config import *
 from scripts.extractors.poa_extractor import *
 from scripts.extractors.id_extractor import *
-from scripts.ui_helpers.ui_functions import *
-from scripts.ui_helpers.ui_render import *
-from scripts.unifiers import *
-from scripts.procedure_recognition import suggest_procedure
-import streamlit.components.v1 as components
 from openai import APIStatusError
-# ---------- SINGLE DOCUMENT PROCESSING FUNCTION ----------
-THRESHOLD_BYTES = int(1.3 * 1024 * 1024)
-def process_document(file_data, filename):
-    if filename.lower().endswith("pdf"):
-        file_data.seek(0)
-        original_pdf_bytes = file_data.read()
-        file_data.seek(0)
-        data_uri, image_bytes = process_pdf_file(io.BytesIO(original_pdf_bytes))
-    elif filename.lower().endswith(("jpg", "jpeg")):
-        file_data.seek(0)
-        original_bytes = file_data.read()
-        image = Image.open(io.BytesIO(original_bytes))
-        image = ImageOps.exif_transpose(image)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image = image.resize((1024, 1024))
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG")
-        resized_bytes = buffer.getvalue()
-        encoded_image = base64.b64encode(resized_bytes).decode("utf-8")
-        data_uri = f"data:image/jpeg;base64,{encoded_image}"
-        image_bytes = resized_bytes
-        original_pdf_bytes = None
-    else:
-        data_uri, image_bytes = process_image_file(file_data)
-        original_pdf_bytes = None
-
-    if not filename.lower().endswith("pdf"):
-        if len(image_bytes) > THRESHOLD_BYTES:
-            adjusted_data_uri, adjusted_image_bytes, downsized_flag = downscale_until(image_bytes)
-        else:
-            adjusted_data_uri, adjusted_image_bytes = data_uri, image_bytes
-            downsized_flag = False
-    else:
-        adjusted_data_uri, adjusted_image_bytes = data_uri, image_bytes
-        downsized_flag = False
+from scripts.config.vlm_settings import VLM_CLASSIFIER_MODE
+from scripts.config.prompt_registry import CATEGORY_TYPE_LABELS
+from scripts.utils.rate_limiter import VLMUnavailableError
+from scripts.utils.image_encoder import encode_image
+from scripts.config.resolution_profiles import profile_for
+from scripts.config.vlm_settings import VLM_TEXT_EXTRACTION_ENABLED
+from scripts.utils.text_layer import document_text, classify_text, text_messages
+from scripts.utils.vlm_telemetry import record_input_path
+from scripts.utils.vlm_clients import current_vlm_client
+from scripts.utils.streamlit_compat import st
 
+def classify_document_cascade(data_uri, client):
+    """
+    Original three-step classifier: broad category, then detailed type, then a
+    POA re-check for anything that stayed "legal" or "property".
+    Returns the detailed type as returned by the VLM.
+    """
     messages = [
-        {"type": "image_url", "image_url": {"url": adjusted_data_uri}},
+        {"type": "image_url", "image_url": {"url": data_uri}},
         {"type": "text", "text": BROAD_CLASSIFICATION_PROMPT}
     ]
     with st.spinner("Performing broad classification..."):
         try:
-            broad_result, _ = call_vlm(messages, st.session_state.client)
+            broad_result, _ = call_vlm(messages, client)
             st.write("Broad classification result:", broad_result)
+        except VLMUnavailableError:
+            raise
         except Exception as e:
             st.write(e)
             broad_result = "others"
@@ -86,13 +61,15 @@ def process_document(file_data, filename):
 
     if second_prompt:
         messages_second = [
-            {"type": "image_url", "image_url": {"url": adjusted_data_uri}},
+            {"type": "image_url", "image_url": {"url": data_uri}},
             {"type": "text", "text": second_prompt}
         ]
         with st.spinner("Performing detailed classification..."):
             try:
-                detailed_result, _ = call_vlm(messages_second, st.session_state.client)
+                detailed_result, _ = call_vlm(messages_second, client)
                 st.write("Detailed classification result:", detailed_result)
+            except VLMUnavailableError:
+                raise
             except Exception as e:
                 st.write(e)
                 detailed_result = "others"
@@ -100,29 +77,99 @@ def process_document(file_data, filename):
         detailed_result = "others"
         
     if detailed_result.lower().strip() in ["legal",'property']:
-        second_prompt = """
-        - this document was classified as legal so i want to check if it is a POA or not.
-        - power of attorney (POA) is considered personal document; you will find key words like "بيانات الوكيل" or "بيانات الموكل"
-          and they may appear in tables or as a header with "توكيل".
-        - if this document is POA, return only 'poa in lower.
-        """
+        second_prompt = POA_CHECK_PROMPT
         messages_second = [
-            {"type": "image_url", "image_url": {"url": adjusted_data_uri}},
+            {"type": "image_url", "image_url": {"url": data_uri}},
             {"type": "text", "text": second_prompt}
         ]
         with st.spinner("Performing detailed classification for POA check..."):
             try:
-                detailed_result, _ = call_vlm(messages_second, st.session_state.client)
+                detailed_result, _ = call_vlm(messages_second, client)
                 st.write("Detailed classification result:", detailed_result)
+            except VLMUnavailableError:
+                raise
             except Exception as e:
                 detailed_result = "others"
+    return detailed_result
+
+
+def classify_document(data_uri, client):
+    """
+    Single-call classifier: one request returns the broad category, the detailed
+    type and a POA flag. The answer is mapped onto the same doc_type strings the
+    cascade produces, so extraction dispatch is unchanged.
+    """
+    messages = [
+        {"type": "image_url", "image_url": {"url": data_uri}},
+        {"type": "text", "text": HIERARCHICAL_CLASSIFICATION_PROMPT}
+    ]
+    with st.spinner("Classifying document..."):
+        try:
+            raw, _ = call_vlm(messages, client)
+        except VLMUnavailableError:
+            # Don't turn an overloaded endpoint into an empty "others" result.
+            raise
+        except Exception as e:
+            st.write(e)
+            return "others"
+    parsed = post_processing(raw)
+    if not isinstance(parsed, dict):
+        parsed = {}
+    category = str(parsed.get("category", "")).lower().strip()
+    doc_type = str(parsed.get("doc_type", "")).lower().strip().strip("*").strip()
+    is_poa = parsed.get("is_poa") in (True, "true", "yes")
+    st.write("Classification result:", parsed)
+
+    if is_poa or doc_type == "poa":
+        return "poa"
+    if category not in CATEGORY_TYPE_LABELS:
+        return "others"
+    if doc_type in CATEGORY_TYPE_LABELS[category]:
+        return doc_type
+    # The type may have been filed under a neighbouring category
+    # (e.g. "company noc" is listed under both company and property).
+    for labels in CATEGORY_TYPE_LABELS.values():
+        if doc_type in labels:
+            return doc_type
+    return category
+
+
+# ---------- SINGLE DOCUMENT PROCESSING FUNCTION ----------
+def process_document(file_data, filename):
+    if filename.lower().endswith("pdf"):
+        file_data.seek(0)
+        original_pdf_bytes = file_data.read()
+        file_data.seek(0)
+        data_uri, image_bytes = process_pdf_file(io.BytesIO(original_pdf_bytes))
+        # Born-digital PDFs: first-page text layer, None for scans.
+        with open_cached_pdf(original_pdf_bytes) as text_doc:
+            first_page_text = document_text(text_doc, [0])
+    else:
+        file_data.seek(0)
+        original_image_bytes = file_data.read()
+        data_uri, image_bytes = process_image_file(io.BytesIO(original_image_bytes))
+        original_pdf_bytes = None
+        first_page_text = None
+
+    adjusted_data_uri, adjusted_image_bytes = data_uri, image_bytes
+
+    text_doc_type = classify_text(first_page_text) if first_page_text else None
+    if text_doc_type:
+        detailed_result = text_doc_type
+        st.write("Classification result (text layer):", detailed_result)
+        record_input_path("classification", "text", detailed_result)
+    else:
+        if VLM_CLASSIFIER_MODE == "cascade":
+            detailed_result = classify_document_cascade(adjusted_data_uri, current_vlm_client())
+        else:
+            detailed_result = classify_document(adjusted_data_uri, current_vlm_client())
+        record_input_path("classification", "image", detailed_result.lower().strip())
     doc_type = detailed_result.lower().strip()
     if filename.lower().endswith("pdf"):
         file_data.seek(0)
         pdf_bytes = file_data.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        total_pages = doc.page_count
-        doc.close()
+        with open_cached_pdf(pdf_bytes) as page_doc:
+            total_pages = page_doc.page_count
         if total_pages > 1 and doc_type in ["ids", "passport", "residence visa"]:
             file_data.seek(0)
             groups = process_multi_document_ids(file_data, filename)
@@ -165,7 +212,7 @@ def process_document(file_data, filename):
         file_data.seek(0)
         pdf_bytes = file_data.read()
         # Extract multi-page contract
-        extracted = process_initial_contract(pdf_bytes, st.session_state.client)
+        extracted = process_initial_contract(pdf_bytes, current_vlm_client())
         # Build result dict
         result = {
             'filename': filename,
@@ -196,50 +243,40 @@ def process_document(file_data, filename):
             result["original_pdf_bytes"] = original_pdf_bytes
         return result
     if extraction_prompt and doc_type not in ['contract f','**contract f**','POA','poa']:
-        if filename.lower().endswith("pdf"):
-            zoom_factors = [1.75, 1, 0.75, 0.4]
-            extraction_data_uri = None
-            last_error = None
-            for z in zoom_factors:
+        use_text = bool(first_page_text) and VLM_TEXT_EXTRACTION_ENABLED
+        if use_text:
+            # Text-only prompt: no image tokens for born-digital PDFs.
+            messages_extraction = text_messages(first_page_text, extraction_prompt)
+        else:
+            if filename.lower().endswith("pdf"):
+                extraction_data_uri = None
                 try:
                     file_data.seek(0)
-                    pdf_bytes = file_data.read()
-                    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-                    page = doc.load_page(0)
-                    matrix = fitz.Matrix(z, z)
-                    pix = page.get_pixmap(matrix=matrix)
-                    highres_image_bytes = pix.tobytes("png")
-                    encoded_image = base64.b64encode(highres_image_bytes).decode("utf-8")
-                    extraction_data_uri = f"data:image/png;base64,{encoded_image}"
-                    break
+                    with open_cached_pdf(file_data.read()) as doc:
+                        extraction_data_uri = encode_pdf_page(doc, 0, profile=doc_type).data_uri
                 except Exception as e:
-                    last_error = e
-            if extraction_data_uri is None:
-                extraction_data_uri = adjusted_data_uri
-        else:
-            extraction_data_uri = adjusted_data_uri
-            if doc_type == "ids" and not downsized_flag:
-                new_data_uri, new_image_bytes = upscale_image(adjusted_image_bytes, zoom=1.75, filetype="png")
-                if new_data_uri is not None:
-                    extraction_data_uri = new_data_uri
+                    st.write("Page rendering error:", e)
+                if extraction_data_uri is None:
+                    extraction_data_uri = adjusted_data_uri
+            else:
+                # Re-encode the upload at the document type's resolution profile
+                # (photos are never upscaled).
+                extraction_data_uri = encode_image(
+                    original_image_bytes, max_bytes=THRESHOLD_BYTES, profile=profile_for(doc_type)
+                ).data_uri
 
-        extraction_image_data = extraction_data_uri.split(",")[1]
-        extraction_bytes = base64.b64decode(extraction_image_data)
-        EXTRACTION_MAX_BYTES = int(1.3 * 1024 * 1024)
-        if len(extraction_bytes) > EXTRACTION_MAX_BYTES:
-            st.info("Extraction image is too large; downscaling further for extraction.")
-            new_data_uri, extraction_bytes, _ = downscale_until(extraction_bytes, threshold=EXTRACTION_MAX_BYTES)
-            extraction_data_uri = new_data_uri
-
-        messages_extraction = [
-            {"type": "image_url", "image_url": {"url": extraction_data_uri}},
-            {"type": "text", "text": extraction_prompt}
-        ]
+            messages_extraction = [
+                {"type": "image_url", "image_url": {"url": extraction_data_uri}},
+                {"type": "text", "text": extraction_prompt}
+            ]
+        record_input_path("extraction", "text" if use_text else "image", doc_type)
         with st.spinner("Extracting document data..."):
             try:
-                extracted_data, _ = call_vlm(messages_extraction, st.session_state.client)
+                extracted_data, _ = call_vlm(messages_extraction, current_vlm_client())
                 extracted_data = extracted_data.replace("```json", "").replace("```", "").strip()
                 extracted_data = post_processing(extracted_data)
+            except VLMUnavailableError:
+                raise
             except Exception as e:
                 st.error(f"VLM extraction error: {e}")
                 extracted_data = "{}"
@@ -263,11 +300,7 @@ def process_document(file_data, filename):
         file_data.seek(0)
         pdf_bytes = file_data.read()
 
-        # write to a temporary file so our extractor can read via path
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            tmp.write(pdf_bytes)
-            tmp.flush()
-            poa_json = extract_power_of_attorney(tmp.name, max_pages=4)
+        poa_json = extract_power_of_attorney(pdf_bytes, max_pages=4)
 
         result = {
             "filename": filename,
@@ -289,14 +322,8 @@ def process_document(file_data, filename):
     if filename.lower().endswith("pdf"):
         result["original_pdf_bytes"] = original_pdf_bytes
         # build a PDF containing all pages
-        all_pages = list(
-            range(
-                1,
-                fitz.open(stream=original_pdf_bytes, filetype="pdf")
-                   .page_count
-                + 1
-            )
-        )
+        with open_cached_pdf(original_pdf_bytes) as page_doc:
+            all_pages = list(range(1, page_doc.page_count + 1))
         result["pdf_bytes"] = create_pdf_from_pages(original_pdf_bytes, all_pages)
     
     return result
@@ -0,0 +1,140 @@
+# page_triage.py
+#
+# Cheap NumPy checks on small grayscale renders: blank separator pages are
+# detected and identical pages (e.g. the three copies of a mortgage
+# contract) are collapsed onto the first occurrence. Blank pages are
+# skipped before extraction (content_pages); duplicates are only used where
+# a repeated copy is truly redundant (the mortgage copy count). Page
+# numbers are never renumbered; results refer to pages of the original PDF.
+
+import numpy as np
+from PIL import Image
+
+# Thumbnail size for all checks (long side, pixels).
+TRIAGE_SIDE = 256
+
+# Blank page: almost no contrast, or (scanner noise) almost no ink.
+BLANK_MAX_STD = 4.0
+BLANK_INK_LEVEL = 160
+BLANK_MAX_INK_FRACTION = 0.002
+
+# Duplicates must be effectively identical renders: pHash Hamming distance,
+# mean absolute difference (0-255) AND no pixel changed by more than
+# DUPLICATE_PIXEL_LEVEL. Hash and mean mostly see page layout, so different
+# ID photocopies or party pages on one template can pass them; the names
+# that differ still show up as a few changed pixels.
+DUPLICATE_MAX_HASH_DISTANCE = 2
+DUPLICATE_MAX_MEAN_DIFF = 1.0
+DUPLICATE_PIXEL_LEVEL = 48
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def perceptual_hash(image):
+    """64-bit DCT perceptual hash of a PIL image, as a flat boolean array."""
+    small = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ small @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    # The DC term only encodes overall brightness.
+    return low > np.median(low[1:])
+
+
+def hash_distance(a, b):
+    return int(np.count_nonzero(a != b))
+
+
+def is_blank(gray):
+    """True for a page with (almost) nothing on it. `gray` is a uint8 array."""
+    if gray.std() < BLANK_MAX_STD:
+        return True
+    return np.count_nonzero(gray < BLANK_INK_LEVEL) / gray.size < BLANK_MAX_INK_FRACTION
+
+
+def _duplicate(a, b):
+    if hash_distance(a["hash"], b["hash"]) > DUPLICATE_MAX_HASH_DISTANCE:
+        return False
+    if a["gray"].shape != b["gray"].shape:
+        return False
+    diff = np.abs(a["gray"] - b["gray"])
+    return float(diff.mean()) <= DUPLICATE_MAX_MEAN_DIFF and not (diff > DUPLICATE_PIXEL_LEVEL).any()
+
+
+def triage_images(images):
+    """
+    Triage a list of page images (PIL, any mode; triage_document passes
+    TRIAGE_SIDE renders). Returns
+        {"page_count", "keep": [page indexes to process],
+         "blank": [...], "duplicates": {page: representative page},
+         "copies": n if the document is one page sequence repeated n times, else None}
+    with 0-based page indexes.
+    """
+    keep, blank, duplicates = [], [], {}
+    features = {}
+    for page, image in enumerate(images):
+        gray = np.asarray(image.convert("L"))
+        if is_blank(gray):
+            blank.append(page)
+            continue
+        feature = {"hash": perceptual_hash(image), "gray": gray.astype(np.int16)}
+        representative = next((p for p in keep if _duplicate(features[p], feature)), None)
+        if representative is None:
+            keep.append(page)
+            features[page] = feature
+        else:
+            duplicates[page] = representative
+    return {
+        "page_count": len(images),
+        "keep": keep,
+        "blank": blank,
+        "duplicates": duplicates,
+        "copies": _count_copies(len(images), keep, blank, duplicates),
+    }
+
+
+def _count_copies(page_count, keep, blank, duplicates):
+    """n when the non-blank pages are the kept pages repeated n times in order."""
+    content = [p for p in range(page_count) if p not in blank]
+    if not keep or len(content) % len(keep):
+        return None
+    copies = len(content) // len(keep)
+    for i, page in enumerate(content):
+        if duplicates.get(page, page) != keep[i % len(keep)]:
+            return None
+    return copies
+
+
+def triage_document(doc, pages=None):
+    """Triage the pages of a CachedDocument using small grayscale renders."""
+    pages = list(range(doc.page_count)) if pages is None else list(pages)
+    doc.prefetch(pages, colorspace="gray", max_side=TRIAGE_SIDE, encoded=False)
+    images = [doc.image(p, colorspace="gray", max_side=TRIAGE_SIDE) for p in pages]
+    result = triage_images(images)
+    # Map positions back to the requested page numbers.
+    result["keep"] = [pages[i] for i in result["keep"]]
+    result["blank"] = [pages[i] for i in result["blank"]]
+    result["duplicates"] = {pages[i]: pages[r] for i, r in result["duplicates"].items()}
+    return result
+
+
+
+def content_pages(doc, pages=None):
+    """
+    Splits the pages of a CachedDocument into (non-blank, blank) page
+    numbers, from small grayscale renders. No duplicate check: pages that
+    only look alike (different ID photocopies, party pages) are all kept.
+    """
+    pages = list(range(doc.page_count)) if pages is None else list(pages)
+    doc.prefetch(pages, colorspace="gray", max_side=TRIAGE_SIDE, encoded=False)
+    blank = [p for p in pages
+             if is_blank(np.asarray(doc.image(p, colorspace="gray", max_side=TRIAGE_SIDE).convert("L")))]
+    return [p for p in pages if p not in blank], blank
@@ -0,0 +1,83 @@
+# pdf_tables.py
+#
+# In-process table extraction with PyMuPDF's table finder, as a drop-in
+# for tabula.read_pdf in the POA path: no JVM, no temporary file. Tables
+# come back as DataFrames shaped like Tabula's (first row as header, empty
+# cells as NaN, unnamed columns as "Unnamed: i"), so the downstream string
+# building and keyword checks see the same text. Tables guessed from text
+# alignment alone (no ruling lines) are kept only when they look like a
+# real table, so multi-column POA prose is not turned into rows.
+
+import re
+
+import fitz  # PyMuPDF
+import numpy as np
+
+_PLACEHOLDER_COLUMN = re.compile(r"^Col(\d+)$")
+
+# Minimum shape of a table found by the "text" strategy.
+MIN_TEXT_TABLE_ROWS = 2
+MIN_TEXT_TABLE_COLS = 2
+
+
+def _clean_cell(value):
+    if not isinstance(value, str):
+        return np.nan
+    value = " ".join(value.split())
+    return value if value else np.nan
+
+
+def _tabula_columns(columns):
+    names = []
+    for i, name in enumerate(columns):
+        name = " ".join(str(name).split()) if name is not None else ""
+        if not name or _PLACEHOLDER_COLUMN.match(name):
+            name = f"Unnamed: {i}"
+        names.append(name)
+    return names
+
+
+def _looks_like_table(page, table):
+    """
+    True for a text-strategy table with at least MIN_TEXT_TABLE_ROWS non-empty
+    body rows, MIN_TEXT_TABLE_COLS columns, a header cell in every column and
+    no column boundary running through a word. Columns of running text get
+    split mid-word, real tables are split between words.
+    """
+    rows = [row for row in table.extract() if any(cell and cell.strip() for cell in row)]
+    if len(rows) < MIN_TEXT_TABLE_ROWS + 1 or table.col_count < MIN_TEXT_TABLE_COLS:
+        return False
+    if not all(cell and cell.strip() for cell in rows[0]):
+        return False
+    bounds = {cell[0] for row in table.rows for cell in row.cells[1:] if cell}
+    for word in page.get_text("words", clip=table.bbox):
+        if any(word[0] + 1 < x < word[2] - 1 for x in bounds):
+            return False
+    return True
+
+
+def _page_tables(page):
+    # Ruled tables first; pages without ruling lines fall back to text
+    # alignment, like Tabula's default lattice/stream guess, but only for
+    # tables that pass _looks_like_table.
+    tables = page.find_tables(strategy="lines").tables
+    if not tables:
+        tables = [t for t in page.find_tables(strategy="text").tables if _looks_like_table(page, t)]
+    return tables
+
+
+def read_pdf_tables(pdf_bytes, pages=(1, 2, 3, 4)):
+    """
+    DataFrames for every table on `pages` (1-based, like tabula's `pages`),
+    in page and reading order. Pages past the end of the document are skipped.
+    """
+    frames = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page_num in pages:
+            if not 1 <= page_num <= doc.page_count:
+                continue
+            for table in _page_tables(doc.load_page(page_num - 1)):
+                frame = table.to_pandas()
+                frame.columns = _tabula_columns(frame.columns)
+                frames.append(frame.map(_clean_cell))
+    return frames
@@ -0,0 +1,164 @@
+# raster_pool.py
+#
+# Process pool for the CPU-bound part of page handling: rasterizing with
+# PyMuPDF and encoding for the VLM. The PDF is copied into shared memory
+# once per batch, each worker opens it once and keeps it open for later
+# pages, and results come back through parent-allocated shared memory
+# blocks instead of pickled bytes. Used through CachedDocument.prefetch().
+
+import atexit
+import collections
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from scripts.config.vlm_settings import VLM_RASTER_WORKERS
+from scripts.utils.image_encoder import EncodedImage, encode_image
+
+# Room for MuPDF rounding the pixmap size up, and for encodings that come
+# out larger than the raw pixels.
+_SIZE_MARGIN = 64 * 1024
+
+_COLORSPACES = {"rgb": (fitz.csRGB, "RGB", 3), "gray": (fitz.csGRAY, "L", 1)}
+
+# Worker-side: documents already opened in this process, by document key.
+_worker_docs = collections.OrderedDict()
+_WORKER_MAX_DOCS = 4
+
+
+def _worker_document(doc_key, pdf_name, pdf_size):
+    doc = _worker_docs.get(doc_key)
+    if doc is None:
+        shm = SharedMemory(name=pdf_name)
+        try:
+            doc = fitz.open(stream=bytes(shm.buf[:pdf_size]), filetype="pdf")
+        finally:
+            shm.close()
+        _worker_docs[doc_key] = doc
+        while len(_worker_docs) > _WORKER_MAX_DOCS:
+            _, old = _worker_docs.popitem(last=False)
+            old.close()
+    else:
+        _worker_docs.move_to_end(doc_key)
+    return doc
+
+
+def _render_job(doc_key, pdf_name, pdf_size, page_num, zoom, colorspace, out_name, encode):
+    """
+    Runs in a worker: renders one page and writes the pixels (or, with
+    `encode`, the encoded image) into the `out_name` block. Returns the
+    metadata needed to rebuild the result, plus the bytes themselves only if
+    they did not fit the block.
+    """
+    fitz_cs, mode, _ = _COLORSPACES[colorspace]
+    page = _worker_document(doc_key, pdf_name, pdf_size).load_page(page_num)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz_cs, alpha=False)
+    # Our own view on the pixmap memory, released before the pixmap is freed.
+    samples = memoryview(pix.samples_mv)
+    try:
+        if encode is None:
+            data = samples
+            meta = {"mode": mode, "width": pix.width, "height": pix.height, "stride": pix.stride}
+        else:
+            image = Image.frombytes(mode, (pix.width, pix.height), samples, "raw", mode, pix.stride)
+            encoded = encode_image(image, **encode)
+            data = encoded.data
+            meta = {"format": encoded.format, "width": encoded.width, "height": encoded.height,
+                    "downscaled": encoded.downscaled}
+        meta["size"] = len(data)
+
+        out = SharedMemory(name=out_name)
+        try:
+            if len(data) <= out.size:
+                out.buf[:len(data)] = data
+            else:
+                meta["data"] = bytes(data)
+        finally:
+            out.close()
+    finally:
+        samples.release()
+    return meta
+
+
+def _result_from_block(meta, block):
+    data = meta.get("data")
+    if data is None:
+        data = bytes(block.buf[:meta["size"]])
+    if "format" in meta:
+        return EncodedImage(data, meta["format"], meta["width"], meta["height"], meta["downscaled"])
+    return Image.frombuffer(meta["mode"], (meta["width"], meta["height"]), data,
+                            "raw", meta["mode"], meta["stride"], 1)
+
+
+def _output_size(page, zoom, colorspace):
+    rect = page.rect * fitz.Matrix(zoom, zoom)
+    channels = _COLORSPACES[colorspace][2]
+    return (int(rect.width) + 2) * (int(rect.height) + 2) * channels + _SIZE_MARGIN
+
+
+class RasterPool:
+    def __init__(self, workers=None):
+        self.workers = workers or VLM_RASTER_WORKERS or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a multi-threaded Streamlit process is unsafe.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def render(self, doc_key, pdf_bytes, jobs, fitz_doc, encode=None):
+        """
+        Renders jobs [(page_num, zoom, colorspace), ...] of one document in
+        parallel. `fitz_doc` (the caller's open document) is only used to size
+        the output blocks. Returns PIL images, or EncodedImages when `encode`
+        holds encode_image() keyword arguments, in job order.
+        """
+        executor = self._get_executor()
+        pdf_block = SharedMemory(create=True, size=max(1, len(pdf_bytes)))
+        blocks = []
+        try:
+            pdf_block.buf[:len(pdf_bytes)] = pdf_bytes
+            futures = []
+            for page_num, zoom, colorspace in jobs:
+                size = _output_size(fitz_doc.load_page(page_num), zoom, colorspace)
+                block = SharedMemory(create=True, size=size)
+                blocks.append(block)
+                futures.append(executor.submit(
+                    _render_job, doc_key, pdf_block.name, len(pdf_bytes),
+                    page_num, zoom, colorspace, block.name, encode,
+                ))
+            return [_result_from_block(f.result(), block) for f, block in zip(futures, blocks)]
+        finally:
+            for block in blocks + [pdf_block]:
+                block.close()
+                block.unlink()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_raster_pool():
+    """Returns the process-wide rasterization pool (workers start on first use)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RasterPool()
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,328 @@
+# rate_limiter.py
+#
+# Flow control for the VLM endpoint: a token bucket for request rate, an
+# AIMD limiter for concurrency, a circuit breaker with half-open probing and
+# jittered retries that honour Retry-After. When the endpoint is throttling
+# or down, callers wait in line instead of failing straight away.
+
+import email.utils
+import random
+import threading
+import time
+
+from scripts.config.vlm_settings import (
+    VLM_MAX_IN_FLIGHT,
+    VLM_RATE_PER_SEC,
+    VLM_RATE_BURST,
+    VLM_AIMD_MAX,
+    VLM_MAX_RETRIES,
+    VLM_RETRY_BASE,
+    VLM_RETRY_CAP,
+    VLM_BREAKER_FAILURES,
+    VLM_BREAKER_COOLDOWN,
+    VLM_QUEUE_TIMEOUT,
+)
+
+
+class VLMUnavailableError(Exception):
+    """Raised when a VLM call could not be served before its queue deadline."""
+
+
+class ModelUnavailableError(Exception):
+    """Raised when no backend serves the requested model."""
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` stored."""
+
+    def __init__(self, rate=VLM_RATE_PER_SEC, burst=VLM_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if wait > _remaining(deadline):
+                raise VLMUnavailableError("VLM rate limit queue timed out")
+            time.sleep(wait)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase / multiplicative decrease:
+    +1 per window of successful calls, halved on 429/5xx, cut by 20% when a
+    call is much slower than the running latency average of calls with the
+    same key (prompt and model): a long extraction is not "slow" next to a
+    one-word classification.
+    """
+
+    def __init__(self, initial=VLM_MAX_IN_FLIGHT, minimum=1, maximum=VLM_AIMD_MAX):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.latency_ewma = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = _remaining(deadline)
+                if remaining <= 0:
+                    raise VLMUnavailableError("VLM concurrency queue timed out")
+                self._cond.wait(remaining)
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self, latency, key=None):
+        with self._cond:
+            average = self.latency_ewma.get(key)
+            slow = average is not None and latency > 2 * average
+            self.latency_ewma[key] = latency if average is None else 0.8 * average + 0.2 * latency
+            if slow:
+                self.limit = max(self.minimum, self.limit * 0.8)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(self.minimum, self.limit * 0.5)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive upstream failures. While open, callers
+    wait; after `cooldown` seconds a single probe is let through (half-open).
+    A successful probe closes the breaker, a failed one re-opens it with a
+    doubled cooldown (capped at 8x).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures=VLM_BREAKER_FAILURES, cooldown=VLM_BREAKER_COOLDOWN):
+        self.failure_threshold = failures
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self._cond = threading.Condition()
+
+    def wait_until_allowed(self, deadline):
+        """Blocks while the breaker is open. Returns True if this call is the half-open probe."""
+        with self._cond:
+            while True:
+                if self.state == self.CLOSED:
+                    return False
+                now = time.monotonic()
+                if self.state == self.OPEN and now - self.opened_at >= self.cooldown:
+                    self.state = self.HALF_OPEN
+                if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                    self.probe_in_flight = True
+                    return True
+                if self.state == self.OPEN:
+                    wait = self.cooldown - (now - self.opened_at)
+                else:
+                    wait = self.cooldown
+                wait = min(wait, _remaining(deadline))
+                if wait <= 0:
+                    raise VLMUnavailableError("VLM endpoint unavailable (circuit open)")
+                self._cond.wait(wait)
+
+    def record_success(self):
+        with self._cond:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.cooldown = self.base_cooldown
+            self.probe_in_flight = False
+            self._cond.notify_all()
+
+    def record_failure(self):
+        with self._cond:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.base_cooldown * 8)
+                self._open()
+            elif self.consecutive_failures >= self.failure_threshold:
+                self._open()
+            self.probe_in_flight = False
+            self._cond.notify_all()
+
+    def release_probe(self):
+        """Gives the half-open probe slot back without recording an outcome."""
+        with self._cond:
+            self.probe_in_flight = False
+            self._cond.notify_all()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+
+def is_retryable(exc):
+    """
+    True for errors that say the endpoint is overloaded or unreachable:
+    HTTP 429/5xx, timeouts and connection errors. Client errors such as
+    "length limit exceeded" are not retried.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return type(exc).__name__ in ("APITimeoutError", "APIConnectionError")
+
+
+_MODEL_MISSING_HINTS = (
+    "not found",
+    "does not exist",
+    "not supported",
+    "unsupported",
+    "unknown",
+    "not available",
+    "no such",
+    "invalid model",
+)
+
+
+def is_model_unavailable(exc):
+    """
+    True when the backend does not serve the requested model: 404, or a
+    400/422 whose message says the model is unknown or unsupported (vLLM and
+    TGI answer "model ... does not exist" with 400/404, the HF router with 422).
+    """
+    if isinstance(exc, ModelUnavailableError):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status == 404:
+        return True
+    if status not in (400, 422):
+        return False
+    message = str(exc).lower()
+    return "model" in message and any(hint in message for hint in _MODEL_MISSING_HINTS)
+
+
+def retry_after_seconds(exc):
+    """Reads a Retry-After header (seconds or HTTP date) from an API error."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt, base=VLM_RETRY_BASE, cap=VLM_RETRY_CAP):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class VLMGuard:
+    """Runs VLM calls through the token bucket, AIMD limiter, breaker and retries."""
+
+    def __init__(self, bucket=None, limiter=None, breaker=None,
+                 max_retries=VLM_MAX_RETRIES, queue_timeout=VLM_QUEUE_TIMEOUT):
+        self.bucket = bucket or TokenBucket()
+        self.limiter = limiter or AIMDLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+
+    def call(self, fn, stats=None, key=None):
+        """
+        Calls fn() and returns its result. `stats`, if given, receives
+        "retries" and "queued_seconds" for telemetry. `key` groups calls of
+        similar cost for the limiter's latency average.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        attempt = 0
+        queued = 0.0
+        while True:
+            wait_start = time.monotonic()
+            probe = self.breaker.wait_until_allowed(deadline)
+            try:
+                self.bucket.acquire(deadline)
+                self.limiter.acquire(deadline)
+            except VLMUnavailableError:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            queued += time.monotonic() - wait_start
+            if stats is not None:
+                stats["retries"] = attempt
+                stats["queued_seconds"] = queued
+
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as exc:
+                error = exc
+            else:
+                error = None
+            finally:
+                self.limiter.release()
+
+            if error is None:
+                self.limiter.on_success(time.monotonic() - start, key=key)
+                self.breaker.record_success()
+                return result
+            if not is_retryable(error):
+                # The endpoint answered; it is healthy even if the request was bad.
+                self.breaker.record_success()
+                raise error
+            self.limiter.on_throttle()
+            self.breaker.record_failure()
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            delay = retry_after_seconds(error)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            else:
+                # Spread out callers that were all given the same Retry-After.
+                delay *= random.uniform(1.0, 1.1)
+            if delay > _remaining(deadline):
+                raise error
+            time.sleep(delay)
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_vlm_guard():
+    """Returns the process-wide guard shared by every session."""
+    global _guard
+    with _guard_lock:
+        if _guard is None:
+            _guard = VLMGuard()
+        return _guard
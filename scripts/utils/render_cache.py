@@ -0,0 +1,308 @@
+# render_cache.py
+#
+# Process-wide cache of rasterized PDF pages, keyed by (document hash, page,
+# zoom, colorspace), plus the budget-encoded images built from them. Entries
+# are evicted least-recently-used once VLM_RENDER_CACHE_MAX_BYTES is reached,
+# so classification, extraction, the ID/POA/contract paths and the app
+# preview all share one rasterization per page and resolution.
+
+import collections
+import functools
+import hashlib
+import threading
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from scripts.config.vlm_settings import (
+    VLM_RENDER_CACHE_MAX_BYTES,
+    VLM_IMAGE_MAX_BYTES,
+    VLM_RASTER_MIN_PAGES,
+)
+from scripts.utils.image_encoder import encode_image
+from scripts.utils.raster_pool import get_raster_pool
+from scripts.config.resolution_profiles import profile_scale
+
+_COLORSPACES = {"rgb": (fitz.csRGB, "RGB"), "gray": (fitz.csGRAY, "L")}
+
+
+def zoom_for_size(page, max_side=None, zoom=1.75):
+    """
+    Zoom that renders `page` with its longer side at `max_side` pixels,
+    computed from the page rect; never more than `zoom`.
+    """
+    if not max_side:
+        return zoom
+    rect = page.rect
+    return min(zoom, max_side / max(rect.width, rect.height))
+
+
+def pixmap_to_image(pix):
+    """
+    Copies the pixmap's samples into a PIL image, without encoding. The view
+    on the pixmap memory is released right away, so the pixmap can be freed
+    independently of the image.
+    """
+    mode = "L" if pix.n == 1 else "RGB"
+    # Our own view, released on exit; the pixmap manages samples_mv itself.
+    with memoryview(pix.samples_mv) as samples:
+        return Image.frombytes(mode, (pix.width, pix.height), samples, "raw", mode, pix.stride)
+
+
+def render_page_image(page, zoom=1.75, colorspace="rgb", max_side=None):
+    """
+    Renders a fitz page straight into a PIL image ("rgb" or "gray"). With
+    `max_side` the page is rendered directly at that size instead of being
+    rendered at `zoom` and resized afterwards.
+    """
+    fitz_cs, _ = _COLORSPACES[colorspace]
+    zoom = zoom_for_size(page, max_side, zoom)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz_cs, alpha=False)
+    return pixmap_to_image(pix)
+
+
+@functools.lru_cache(maxsize=1)
+def tesseract_available():
+    """True when PyMuPDF can find a Tesseract installation for OCR."""
+    try:
+        fitz.get_tessdata()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _entry_size(value):
+    if isinstance(value, str):
+        return len(value) * 2
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    data = getattr(value, "data", None)
+    if data is not None:
+        # Encoded bytes plus the base64 data URI built from them.
+        return len(data) * 7 // 3
+    return 64
+
+
+class PageRenderCache:
+    """Thread-safe LRU of rendered pages and encoded images, capped in bytes."""
+
+    def __init__(self, max_bytes=VLM_RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = _entry_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+    def get_or_create(self, key, create):
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.total_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Returns the process-wide render cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageRenderCache()
+        return _cache
+
+
+def document_key(pdf_bytes):
+    return hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+
+
+class CachedDocument:
+    """
+    A PDF whose page renders go through the render cache. The underlying
+    fitz document is only opened when something is not cached yet.
+    """
+
+    def __init__(self, pdf_bytes, cache=None):
+        self.pdf_bytes = pdf_bytes
+        self.key = document_key(pdf_bytes)
+        self.cache = cache or get_render_cache()
+        self._doc = None
+        self._lock = threading.Lock()
+
+    def _fitz(self):
+        if self._doc is None:
+            self._doc = fitz.open(stream=self.pdf_bytes, filetype="pdf")
+        return self._doc
+
+    @property
+    def page_count(self):
+        def count():
+            with self._lock:
+                return self._fitz().page_count
+        return self.cache.get_or_create(("pages", self.key), count)
+
+    def __len__(self):
+        return self.page_count
+
+    def page_rect(self, page_num):
+        """(width, height) of a page in points."""
+        def rect():
+            with self._lock:
+                page_rect = self._fitz().load_page(page_num).rect
+                return (page_rect.width, page_rect.height)
+        return self.cache.get_or_create(("rect", self.key, page_num), rect)
+
+    def text(self, page_num):
+        """The page's native text layer in reading order ("" for scans)."""
+        def extract():
+            with self._lock:
+                return self._fitz().load_page(page_num).get_text("text", sort=True)
+        return self.cache.get_or_create(("text", self.key, page_num), extract)
+
+    def ocr_text(self, page_num, top=0.0, dpi=300):
+        """
+        Tesseract OCR (through PyMuPDF) of the page from `top` (a fraction of
+        its height) down to the bottom; "" when Tesseract is not installed.
+        """
+        def ocr():
+            if not tesseract_available():
+                return ""
+            with self._lock:
+                page = self._fitz().load_page(page_num)
+                rect = page.rect
+                clip = fitz.Rect(rect.x0, rect.y0 + rect.height * top, rect.x1, rect.y1)
+                pix = page.get_pixmap(dpi=dpi, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+            ocr_pdf = fitz.open("pdf", pix.pdfocr_tobytes(language="eng"))
+            try:
+                return "\n".join(ocr_page.get_text("text", sort=True) for ocr_page in ocr_pdf)
+            finally:
+                ocr_pdf.close()
+        return self.cache.get_or_create(("ocr", self.key, page_num, top, dpi), ocr)
+
+    def profile_zoom(self, page_num, profile):
+        """The fitz zoom that renders a page at its resolution profile."""
+        width, height = self.page_rect(page_num)
+        return profile_scale(width, height, profile, dpi=72, upscale=True)
+
+    def image(self, page_num, zoom=1.75, colorspace="rgb", max_side=None):
+        """
+        The page rendered at `zoom`, or straight at `max_side` pixels if that
+        is smaller, as a read-only PIL image.
+        """
+        def render():
+            # fitz documents are not thread-safe.
+            with self._lock:
+                return render_page_image(self._fitz().load_page(page_num), zoom, colorspace, max_side)
+        return self.cache.get_or_create(self._image_key(page_num, zoom, colorspace, max_side), render)
+
+    def encoded(self, page_num, zoom=1.75, max_bytes=VLM_IMAGE_MAX_BYTES, max_side=None,
+                colorspace="rgb", formats=None, profile=None):
+        """
+        The page rendered at `zoom` (or at the zoom of a resolution `profile`)
+        and encoded under max_bytes (EncodedImage).
+        """
+        if profile is not None:
+            zoom = self.profile_zoom(page_num, profile)
+
+        def encode():
+            return encode_image(self.image(page_num, zoom, colorspace, max_side),
+                                **self._encode_kwargs(max_bytes, max_side, formats))
+        key = self._encoded_key(page_num, zoom, colorspace, max_bytes, max_side, formats)
+        return self.cache.get_or_create(key, encode)
+
+    def prefetch(self, pages, zoom=1.75, colorspace="rgb", max_side=None, encoded=True,
+                 max_bytes=VLM_IMAGE_MAX_BYTES, formats=None, profile=None):
+        """
+        Renders (and, with `encoded`, encodes) `pages` ahead of use. When at
+        least VLM_RASTER_MIN_PAGES of them are not cached yet they are done in
+        parallel on the raster process pool; later image()/encoded() calls with
+        the same arguments are then cache hits.
+        """
+        zooms = {p: self.profile_zoom(p, profile) if profile is not None else zoom for p in pages}
+        if encoded:
+            keys = [self._encoded_key(p, zooms[p], colorspace, max_bytes, max_side, formats) for p in pages]
+        else:
+            keys = [self._image_key(p, zooms[p], colorspace, max_side) for p in pages]
+        missing = [(p, key) for p, key in zip(pages, keys) if key not in self.cache]
+        pool = get_raster_pool()
+        if len(missing) < VLM_RASTER_MIN_PAGES or pool.workers < 2:
+            for p, _ in missing:
+                if encoded:
+                    self.encoded(p, zooms[p], max_bytes, max_side, colorspace, formats)
+                else:
+                    self.image(p, zooms[p], colorspace, max_side)
+            return
+        encode = self._encode_kwargs(max_bytes, max_side, formats) if encoded else None
+        with self._lock:
+            doc = self._fitz()
+            jobs = [(p, zoom_for_size(doc.load_page(p), max_side, zooms[p]), colorspace) for p, _ in missing]
+            results = pool.render(self.key, self.pdf_bytes, jobs, doc, encode=encode)
+        for (_, key), result in zip(missing, results):
+            self.cache.put(key, result)
+
+    def _image_key(self, page_num, zoom, colorspace, max_side):
+        return ("page", self.key, page_num, zoom, colorspace, max_side)
+
+    def _encoded_key(self, page_num, zoom, colorspace, max_bytes, max_side, formats):
+        return ("encoded", self.key, page_num, zoom, colorspace, max_bytes, max_side,
+                tuple(formats) if formats else None)
+
+    @staticmethod
+    def _encode_kwargs(max_bytes, max_side, formats):
+        kwargs = {"max_bytes": max_bytes, "max_side": max_side}
+        if formats:
+            kwargs["formats"] = formats
+        return kwargs
+
+    def close(self):
+        with self._lock:
+            if self._doc is not None:
+                self._doc.close()
+                self._doc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_cached_pdf(pdf_bytes):
+    """Opens pdf_bytes for cached rendering (see CachedDocument)."""
+    return CachedDocument(pdf_bytes)
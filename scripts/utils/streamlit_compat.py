@@ -0,0 +1,74 @@
+# streamlit_compat.py
+#
+# `st` for the processing pipeline (ocr_utils, vlm_utils, extractors). Inside
+# a Streamlit script run it is streamlit itself, so spinners and progress
+# lines show up in the app as before. Anywhere else (job worker, batch CLI,
+# benchmarks, or an environment without streamlit installed) the same calls
+# go to the "scripts.pipeline" logger, and spinners become plain context managers.
+
+import contextlib
+import importlib.util
+import logging
+
+log = logging.getLogger("scripts.pipeline")
+
+_HAS_STREAMLIT = importlib.util.find_spec("streamlit") is not None
+
+
+def _in_script_run():
+    if not _HAS_STREAMLIT:
+        return False
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+
+def _text(args):
+    return " ".join(str(arg) for arg in args)
+
+
+class _Console:
+    """The subset of the streamlit API the pipeline uses, logging instead of rendering."""
+
+    def __init__(self):
+        self.session_state = {}
+
+    def write(self, *args, **kwargs):
+        log.info(_text(args))
+
+    def info(self, body, *args, **kwargs):
+        log.info(body)
+
+    def success(self, body, *args, **kwargs):
+        log.info(body)
+
+    def warning(self, body, *args, **kwargs):
+        log.warning(body)
+
+    def error(self, body, *args, **kwargs):
+        log.error(body)
+
+    def json(self, body, *args, **kwargs):
+        log.info(body)
+
+    @contextlib.contextmanager
+    def spinner(self, text="", *args, **kwargs):
+        log.info(text)
+        yield
+
+    def __getattr__(self, name):
+        # Anything purely visual (image, markdown, ...) is dropped.
+        return lambda *args, **kwargs: None
+
+
+class _StreamlitOrConsole:
+    def __init__(self):
+        self._console = _Console()
+
+    def __getattr__(self, name):
+        if _in_script_run():
+            import streamlit
+            return getattr(streamlit, name)
+        return getattr(self._console, name)
+
+
+st = _StreamlitOrConsole()
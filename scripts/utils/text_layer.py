@@ -0,0 +1,87 @@
+# text_layer.py
+#
+# Fast path for born-digital PDFs (DLD contracts, title deeds, NOCs...):
+# when a page carries a usable text layer the document is classified from
+# keyword rules (scripts/config/text_layer_rules.py) and extracted with a
+# text-only prompt, skipping image tokens entirely. Scans, photos and PDFs
+# with a broken font encoding fall back to the image path.
+
+import re
+import unicodedata
+
+from scripts.config.vlm_settings import (
+    VLM_TEXT_LAYER_ENABLED,
+    VLM_TEXT_LAYER_MIN_CHARS,
+)
+from scripts.config.prompts import TEXT_LAYER_PROMPT_TEMPLATE
+from scripts.config.text_layer_rules import ISSUER_MARKERS, TEXT_CLASSIFICATION_RULES
+
+# A text layer is unusable when too few of its characters are letters or
+# digits (glyph soup from unmapped fonts) or too many are U+FFFD.
+MIN_ALNUM_RATIO = 0.5
+MAX_REPLACEMENT_RATIO = 0.02
+
+_TATWEEL = "\u0640"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def is_usable_text(text, min_chars=VLM_TEXT_LAYER_MIN_CHARS):
+    """True when `text` looks like a real text layer rather than a scan."""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < min_chars:
+        return False
+    alnum = sum(1 for c in chars if c.isalnum())
+    replacement = chars.count("\ufffd")
+    return alnum / len(chars) >= MIN_ALNUM_RATIO and replacement / len(chars) <= MAX_REPLACEMENT_RATIO
+
+
+def document_text(doc, pages):
+    """
+    Returns the joined text of `pages` (0-based) if every one of them has a
+    usable text layer, else None. Pages are separated by "--- Page N ---".
+    """
+    if not VLM_TEXT_LAYER_ENABLED:
+        return None
+    parts = []
+    for page_num in pages:
+        text = doc.text(page_num)
+        if not is_usable_text(text):
+            return None
+        parts.append(f"--- Page {page_num + 1} ---\n{text.strip()}")
+    return "\n\n".join(parts) if parts else None
+
+
+def normalize_text(text):
+    """NFKC (folds Arabic presentation forms), lowercase, no tatweel, single spaces."""
+    text = unicodedata.normalize("NFKC", text).replace(_TATWEEL, "").lower()
+    return _WHITESPACE.sub(" ", text)
+
+
+def _matches(rule, text):
+    if not any(marker in text for marker in rule["any_of"]):
+        return False
+    if not all(marker in text for marker in rule.get("all_of", [])):
+        return False
+    if any(marker in text for marker in rule.get("none_of", [])):
+        return False
+    issuer = rule.get("issuer")
+    if issuer and not any(marker in text for marker in ISSUER_MARKERS[issuer]):
+        return False
+    return True
+
+
+def classify_text(text):
+    """doc_type for a page text per TEXT_CLASSIFICATION_RULES, or None."""
+    normalized = normalize_text(text)
+    for rule in TEXT_CLASSIFICATION_RULES:
+        if _matches(rule, normalized):
+            return rule["doc_type"]
+    return None
+
+
+def text_messages(text, prompt):
+    """Text-only message list: the document text, then the unchanged prompt."""
+    return [
+        {"type": "text", "text": TEXT_LAYER_PROMPT_TEMPLATE.format(text=text)},
+        {"type": "text", "text": prompt},
+    ]
@@ -0,0 +1,224 @@
+# vlm_backends.py
+#
+# Pool of OpenAI-compatible VLM backends (HF router, dedicated Inference
+# Endpoint, local stub, ...). Every call goes to the healthy backend with the
+# lowest recent time to first token; a backend that throttles, errors or is
+# still cold is skipped and the call fails over to the next one. A background
+# thread polls GET {base_url}/models to bring skipped backends back.
+
+import threading
+import time
+
+import httpx
+
+from scripts.config.vlm_settings import (
+    VLM_BACKENDS,
+    VLM_HEDGE_BASE_URL,
+    VLM_HEALTH_INTERVAL,
+    VLM_HEALTH_TIMEOUT,
+    VLM_BACKEND_COOLDOWN,
+    VLM_BACKEND_STALE_AFTER,
+    VLM_MODEL_MISSING_TTL,
+)
+from scripts.utils.vlm_clients import get_vlm_client, default_api_key
+from scripts.utils.rate_limiter import is_retryable, is_model_unavailable, ModelUnavailableError
+from scripts.utils.hedging import HedgeCancelled
+
+
+def _normalize_url(url):
+    return str(url).rstrip("/")
+
+
+def configured_backend_urls():
+    """The base URLs call_vlm may send a request to: VLM_BACKENDS and VLM_HEDGE_BASE_URL."""
+    urls = list(VLM_BACKENDS) + ([VLM_HEDGE_BASE_URL] if VLM_HEDGE_BASE_URL else [])
+    return sorted({_normalize_url(url) for url in urls})
+
+
+class Backend:
+    """Health and latency state of one base URL."""
+
+    def __init__(self, base_url, index=0):
+        self.base_url = _normalize_url(base_url)
+        self.index = index
+        self.ttft_ewma = None
+        self.last_sample = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+        self.missing_models = {}
+        self._lock = threading.Lock()
+
+    def is_up(self, now=None):
+        return (now or time.monotonic()) >= self.down_until
+
+    def serves(self, model, now=None):
+        """False while the backend is remembered as not serving model."""
+        return (now or time.monotonic()) >= self.missing_models.get(model, 0.0)
+
+    def record_missing_model(self, model):
+        with self._lock:
+            self.missing_models[model] = time.monotonic() + VLM_MODEL_MISSING_TTL
+
+    def score(self):
+        # Unmeasured backends rank first so each one gets sampled.
+        return 0.0 if self.ttft_ewma is None else self.ttft_ewma
+
+    def record_success(self, ttft):
+        with self._lock:
+            self.failures = 0
+            self.down_until = 0.0
+            if ttft is not None:
+                self.ttft_ewma = ttft if self.ttft_ewma is None else 0.7 * self.ttft_ewma + 0.3 * ttft
+                self.last_sample = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            cooldown = min(VLM_BACKEND_COOLDOWN * 2 ** (self.failures - 1), VLM_BACKEND_COOLDOWN * 8)
+            self.down_until = time.monotonic() + cooldown
+
+    def record_health(self, ok):
+        with self._lock:
+            if ok:
+                self.down_until = 0.0
+                if self.ttft_ewma is not None and time.monotonic() - self.last_sample > VLM_BACKEND_STALE_AFTER:
+                    self.ttft_ewma = None
+            elif self.is_up():
+                self.failures += 1
+                self.down_until = time.monotonic() + VLM_BACKEND_COOLDOWN
+
+    def snapshot(self):
+        return {
+            "base_url": self.base_url,
+            "up": self.is_up(),
+            "ttft_ewma": self.ttft_ewma,
+            "failures": self.failures,
+            "missing_models": [model for model in self.missing_models if not self.serves(model)],
+        }
+
+
+class BackendPool:
+    def __init__(self, base_urls=VLM_BACKENDS, health_interval=VLM_HEALTH_INTERVAL):
+        self.backends = [Backend(url, i) for i, url in enumerate(base_urls)]
+        self.health_interval = health_interval
+        self._health_thread = None
+        self._lock = threading.Lock()
+
+    def backend(self, base_url):
+        """Returns the pool entry for base_url, adding it if it is not configured."""
+        base_url = _normalize_url(base_url)
+        with self._lock:
+            for backend in self.backends:
+                if backend.base_url == base_url:
+                    return backend
+            backend = Backend(base_url, len(self.backends))
+            self.backends.append(backend)
+            return backend
+
+    def ranked(self):
+        """Backends that are up, fastest first, followed by those that are down (soonest back first)."""
+        self._ensure_health_checks()
+        now = time.monotonic()
+        up = [b for b in self.backends if b.is_up(now)]
+        down = [b for b in self.backends if not b.is_up(now)]
+        up.sort(key=lambda b: (b.score(), b.index))
+        down.sort(key=lambda b: b.down_until)
+        return up + down
+
+    def client_for(self, backend, client=None):
+        """The caller's client when it already points at backend, else the shared one (same API key)."""
+        if client is not None and _normalize_url(client.base_url) == backend.base_url:
+            return client
+        api_key = getattr(client, "api_key", None) if client is not None else None
+        return get_vlm_client(backend.base_url, api_key=api_key)
+
+    def call(self, send, client=None, first=None, stats=None, model=None):
+        """
+        Calls send(target_client, timing) on the best backend, failing over to
+        the next one on throttling, 5xx, timeouts and connection errors.
+        `send` fills timing["ttft"]; the backend used is stored in stats["backend"].
+        With `model`, backends known not to serve it are skipped, and one that
+        answers "model not found" is remembered as such and failed over.
+        """
+        order = self.ranked()
+        if first is not None:
+            order = [first] + [b for b in order if b is not first]
+        if model is not None:
+            now = time.monotonic()
+            order = [b for b in order if b.serves(model, now)]
+            if not order:
+                raise ModelUnavailableError(f"No VLM backend serves {model}")
+        error = None
+        for backend in order:
+            timing = {}
+            try:
+                result = send(self.client_for(backend, client), timing)
+            except HedgeCancelled:
+                raise
+            except Exception as exc:
+                if model is not None and is_model_unavailable(exc):
+                    backend.record_missing_model(model)
+                    error = exc
+                    continue
+                if not is_retryable(exc):
+                    raise
+                backend.record_failure()
+                if stats is not None:
+                    stats["failovers"] = stats.get("failovers", 0) + 1
+                error = exc
+                continue
+            backend.record_success(timing.get("ttft"))
+            if stats is not None:
+                stats.update(timing)
+                stats["backend"] = backend.base_url
+            return result
+        raise error
+
+    def check_health(self):
+        """Polls every backend's /models endpoint once."""
+        headers = {}
+        api_key = default_api_key()
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        for backend in list(self.backends):
+            try:
+                response = httpx.get(f"{backend.base_url}/models", headers=headers, timeout=VLM_HEALTH_TIMEOUT)
+                # A scaled-to-zero endpoint answers 503 while it warms up.
+                ok = response.status_code < 500 and response.status_code != 429
+            except httpx.HTTPError:
+                ok = False
+            backend.record_health(ok)
+
+    def _ensure_health_checks(self):
+        if len(self.backends) < 2 or self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(
+                    target=self._health_loop, name="vlm-health", daemon=True
+                )
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            try:
+                self.check_health()
+            except Exception:
+                pass
+            time.sleep(self.health_interval)
+
+    def status(self):
+        return [backend.snapshot() for backend in self.ranked()]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool():
+    """Returns the process-wide backend pool built from VLM_BACKENDS."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BackendPool()
+        return _pool
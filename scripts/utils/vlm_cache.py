@@ -0,0 +1,189 @@
+# vlm_cache.py
+#
+# Content-addressed, persistent cache for VLM responses. call_vlm runs with
+# temperature=0 and a fixed seed, so the same image + prompt + model +
+# sampling parameters always produce the same answer and can be served
+# locally instead of going back to the endpoint. The backends a call can
+# reach are part of the key, so answers from one endpoint (e.g. the local
+# stub server) are never served for another.
+
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from scripts.config.vlm_settings import (
+    VLM_CACHE_ENABLED,
+    VLM_CACHE_PATH,
+    VLM_CACHE_MAX_BYTES,
+    VLM_CACHE_TTL,
+    VLM_CACHE_WAIT_TIMEOUT,
+)
+
+
+def make_cache_key(messages, model, params, backends=()):
+    """
+    Builds a SHA-256 key from the decoded image bytes and text of every message
+    part, the model name, the sampling parameters and the backend base URLs.
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(json.dumps(sorted(backends)).encode("utf-8"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for part in messages:
+        if part.get("type") == "image_url":
+            url = part["image_url"]["url"]
+            header, _, payload = url.partition(",")
+            digest.update(b"image:")
+            if header.endswith(";base64"):
+                digest.update(hashlib.sha256(base64.b64decode(payload)).digest())
+            else:
+                digest.update(url.encode("utf-8"))
+        else:
+            digest.update(b"text:")
+            digest.update(str(part.get("text", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class VLMCache:
+    """
+    SQLite-backed response cache with a TTL and size-based LRU eviction.
+    Concurrent requests for the same key are coalesced: only the first caller
+    computes the value, the others wait for its result.
+    """
+
+    def __init__(self, path=VLM_CACHE_PATH, max_bytes=VLM_CACHE_MAX_BYTES, ttl=VLM_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inflight = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+
+    def get(self, key):
+        """Returns the cached value for key, or None if missing or expired."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        # Caller holds self._lock.
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if self.ttl and now - created > self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key, value):
+        """Stores value under key, then evicts least recently used rows over max_bytes."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC")
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def get_or_compute(self, key, compute, retry_on=(), wait_timeout=VLM_CACHE_WAIT_TIMEOUT):
+        """
+        Returns (value, hit). On a miss, `compute()` is called once per key even
+        if several threads ask at the same time; its result is cached.
+        A waiting caller computes the value itself when the first caller fails
+        with one of `retry_on` (its own cancellation or queue timeout) or has not
+        answered within `wait_timeout` seconds.
+        """
+        while True:
+            with self._lock:
+                value = self._get(key)
+                if value is not None:
+                    return value, True
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._inflight[key] = future
+            if owner:
+                break
+            try:
+                return future.result(timeout=wait_timeout), True
+            except FutureTimeout:
+                value = compute()
+                if value:
+                    self.set(key, value)
+                return value, False
+            except retry_on:
+                continue
+
+        try:
+            value = compute()
+            if value:
+                self.set(key, value)
+        except BaseException as exc:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_vlm_cache():
+    """Returns the process-wide cache, or None when caching is disabled."""
+    global _cache
+    if not VLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VLMCache()
+        return _cache
@@ -0,0 +1,93 @@
+# vlm_clients.py
+#
+# One process-wide OpenAI client per (base_url, api_key), backed by a
+# keep-alive httpx connection pool, so every page call and every Streamlit
+# session reuses warm TLS connections instead of building its own client.
+
+import importlib.util
+import os
+import threading
+
+import httpx
+from openai import OpenAI
+
+from scripts.config.vlm_settings import (
+    VLM_BASE_URL,
+    VLM_CALL_TIMEOUT,
+    VLM_POOL_CONNECTIONS,
+    VLM_KEEPALIVE_EXPIRY,
+    VLM_HTTP2,
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def default_api_key():
+    """
+    Returns the VLM token from VLM_API_KEY / HF_TOKEN, falling back to
+    st.secrets["huggingface"]["token"] when running inside Streamlit.
+    """
+    token = os.getenv("VLM_API_KEY") or os.getenv("HF_TOKEN")
+    if token:
+        return token
+    try:
+        import streamlit as st
+        return st.secrets["huggingface"].to_dict()["token"]
+    except Exception:
+        return None
+
+
+def _http2_enabled():
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed;
+    # the protocol itself is negotiated per endpoint via ALPN.
+    return VLM_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def build_vlm_client(base_url=VLM_BASE_URL, api_key=None):
+    """
+    Builds an OpenAI client on a pooled, keep-alive httpx.Client.
+    Prefer get_vlm_client(), which shares one instance per endpoint.
+    """
+    http_client = httpx.Client(
+        http2=_http2_enabled(),
+        limits=httpx.Limits(
+            max_connections=VLM_POOL_CONNECTIONS,
+            max_keepalive_connections=VLM_POOL_CONNECTIONS,
+            keepalive_expiry=VLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(VLM_CALL_TIMEOUT, connect=10.0),
+    )
+    return OpenAI(
+        base_url=base_url,
+        api_key=api_key or default_api_key(),
+        http_client=http_client,
+        # Retries, backoff and Retry-After are handled by rate_limiter.VLMGuard.
+        max_retries=0,
+    )
+
+
+def get_vlm_client(base_url=None, api_key=None):
+    """
+    Returns the shared client for base_url (default VLM_BASE_URL), creating
+    it on first use. Safe to call from any thread.
+    """
+    base_url = base_url or VLM_BASE_URL
+    api_key = api_key or default_api_key()
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = build_vlm_client(base_url, api_key)
+            _clients[key] = client
+        return client
+
+
+def current_vlm_client():
+    """
+    The client of the current Streamlit session (st.session_state.client)
+    when there is one, else the shared default client. Lets the pipeline run
+    unchanged in the app, the job worker and other scripts.
+    """
+    from scripts.utils.streamlit_compat import st
+    return st.session_state.get("client") or get_vlm_client()
@@ -0,0 +1,225 @@
+# vlm_telemetry.py
+#
+# One structured record per VLM call: prompt identity, model, payload size,
+# image dimensions, time to first token, total latency, output tokens,
+# retries and outcome. Records go to a rotating JSONL file and to an
+# in-process ring buffer; latency_summary() gives p50/p95/p99 per prompt.
+# Which input a stage used (native text layer or page image) is counted
+# separately; input_path_summary() gives the text/image hit ratio, for the
+# whole process or for the counts one submission collected with
+# count_input_paths().
+
+import base64
+import collections
+import contextlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from scripts.config.vlm_settings import (
+    VLM_TELEMETRY_ENABLED,
+    VLM_TELEMETRY_PATH,
+    VLM_TELEMETRY_MAX_BYTES,
+    VLM_TELEMETRY_BACKUPS,
+    VLM_TELEMETRY_RING,
+)
+
+_ring = collections.deque(maxlen=VLM_TELEMETRY_RING)
+_ring_lock = threading.Lock()
+_logger = None
+_logger_lock = threading.Lock()
+_path_counts = collections.Counter()
+_local = threading.local()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def image_dimensions(data_uri):
+    """
+    Reads (width, height) from the header of a base64 PNG, JPEG or WebP data
+    URI without decoding the whole image. Returns None if unknown.
+    """
+    header, _, payload = data_uri.partition(",")
+    if not header.endswith(";base64"):
+        return None
+    try:
+        head = base64.b64decode(payload[:64])
+        if head.startswith(b"\x89PNG"):
+            return struct.unpack(">II", head[16:24])
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            kind = head[12:16]
+            if kind == b"VP8 ":
+                w, h = struct.unpack("<HH", head[26:30])
+                return w & 0x3FFF, h & 0x3FFF
+            if kind == b"VP8L":
+                bits = int.from_bytes(head[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if kind == b"VP8X":
+                return (int.from_bytes(head[24:27], "little") + 1,
+                        int.from_bytes(head[27:30], "little") + 1)
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_dimensions(base64.b64decode(payload))
+    except Exception:
+        return None
+    return None
+
+
+def _jpeg_dimensions(data):
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def describe_payload(messages):
+    """Returns (payload_bytes, [(width, height), ...]) for a message list."""
+    size, dims = 0, []
+    for part in messages:
+        if part.get("type") == "image_url":
+            url = part["image_url"]["url"]
+            size += len(url)
+            dims.append(image_dimensions(url))
+        else:
+            size += len(str(part.get("text", "")).encode("utf-8"))
+    return size, dims
+
+
+def _get_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            directory = os.path.dirname(VLM_TELEMETRY_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = RotatingFileHandler(
+                VLM_TELEMETRY_PATH,
+                maxBytes=VLM_TELEMETRY_MAX_BYTES,
+                backupCount=VLM_TELEMETRY_BACKUPS,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("vlm_telemetry")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+
+def record_vlm_call(record):
+    """Adds one call record to the ring buffer and the JSONL log."""
+    if not VLM_TELEMETRY_ENABLED:
+        return
+    record.setdefault("ts", time.time())
+    with _ring_lock:
+        _ring.append(record)
+    try:
+        _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+    except Exception:
+        # Telemetry must never break a VLM call.
+        pass
+
+
+def recent_calls(limit=None):
+    """Returns the most recent records from the in-process ring buffer."""
+    with _ring_lock:
+        records = list(_ring)
+    return records[-limit:] if limit else records
+
+
+def latency_summary(field="latency", by="prompt", records=None):
+    """
+    Returns {group: {"count", "p50", "p95", "p99", "total"}} for `field`
+    (e.g. "latency" or "ttft") grouped by a record key (default: prompt),
+    plus an "_all" group.
+    """
+    records = recent_calls() if records is None else records
+    groups = collections.defaultdict(list)
+    for record in records:
+        value = record.get(field)
+        if value is None:
+            continue
+        groups[record.get(by)].append(value)
+        groups["_all"].append(value)
+    return {
+        group: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "total": sum(values),
+        }
+        for group, values in groups.items()
+    }
+
+
+def record_input_path(stage, path, doc_type=None):
+    """
+    Counts one document handled by `stage` ("classification", "extraction")
+    through `path` ("text" or "image").
+    """
+    with _ring_lock:
+        _path_counts[(stage, path)] += 1
+        for counter in getattr(_local, "path_counters", ()):
+            counter[(stage, path)] += 1
+    if not VLM_TELEMETRY_ENABLED:
+        return
+    try:
+        _get_logger().info(json.dumps({"ts": time.time(), "event": "input_path", "stage": stage,
+                                       "path": path, "doc_type": doc_type}, ensure_ascii=False))
+    except Exception:
+        pass
+
+
+@contextlib.contextmanager
+def count_input_paths(counter):
+    """
+    Also counts the record_input_path calls made on this thread into
+    `counter` (a Counter keyed by (stage, path)), e.g. one per submission
+    shared by its document threads.
+    """
+    counters = getattr(_local, "path_counters", ())
+    _local.path_counters = counters + (counter,)
+    try:
+        yield counter
+    finally:
+        _local.path_counters = counters
+
+
+def input_path_summary(counts=None):
+    """
+    Returns {stage: {"text", "image", "text_ratio"}} plus an "_all" group for
+    `counts` (default: every document this process handled); text_ratio is
+    text hits / all hits (None before the first document).
+    """
+    with _ring_lock:
+        counts = dict(_path_counts if counts is None else counts)
+    summary = collections.defaultdict(lambda: {"text": 0, "image": 0})
+    for (stage, path), count in counts.items():
+        summary[stage][path] += count
+        summary["_all"][path] += count
+    for group in summary.values():
+        total = group["text"] + group["image"]
+        group["text_ratio"] = group["text"] / total if total else None
+    return dict(summary)
@@ -6,7 +6,8 @@ from PIL import Image, ImageOps
 import io
 import fitz
 from io import BytesIO
-from scripts.vlm_utils import create_pdf_from_pages
+from scripts.vlm_utils import create_pdf_from_pages, open_cached_pdf
+from scripts.utils.page_triage import triage_document
 import re
 from dateutil.relativedelta import relativedelta
 
@@ -407,12 +408,21 @@ def validate_documents(results):
         if doc["doc_type"].lower() == "mortgage contract" and doc["filename"].lower().endswith("pdf"):
             try:
                 pdf_bytes = doc.get("original_pdf_bytes")
-                pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-                pages = pdf_doc.page_count
-                mortgage_msgs.append(
-                    f"Mortgage contract {'valid: 3 copies exist' if pages % 3 == 0 else f'invalid: {pages % 3} copies exist'}."
-                )
-                pdf_doc.close()
+                with open_cached_pdf(pdf_bytes) as pdf_doc:
+                    triage = triage_document(pdf_doc)
+                copies = triage["copies"]
+                # A single copy usually means the copies are rescans that do
+                # not match pixel for pixel; count them by pages instead.
+                if copies is not None and copies > 1:
+                    # Counted from the page contents (blank pages ignored).
+                    mortgage_msgs.append(
+                        f"Mortgage contract {'valid: 3 copies exist' if copies == 3 else f'invalid: {copies} copies exist'}."
+                    )
+                else:
+                    pages = triage["page_count"]
+                    mortgage_msgs.append(
+                        f"Mortgage contract {'valid: 3 copies exist' if pages % 3 == 0 else f'invalid: {pages % 3} copies exist'}."
+                    )
             except Exception as e:
                 mortgage_msgs.append(f"Error checking mortgage contract pages: {e}")
     if mortgage_msgs:
@@ -0,0 +1,255 @@
+# vlm_stub_server.py
+#
+# Local stand-in for the OpenAI-compatible VLM endpoint, for offline load
+# testing. Implements streaming and non-streaming POST /v1/chat/completions,
+# picks a canned answer from the prompt registry, and can inject latency,
+# 429/5xx errors and "length limit exceeded" rejections.
+#
+#   python -m scripts.vlm_stub_server --port 8089 --ttft-median 0.8 --rate-429 0.05
+#   VLM_BASE_URL=http://127.0.0.1:8089/v1 VLM_CACHE_ENABLED=0 streamlit run app.py
+#
+# Run the app with the response cache off (or on its own VLM_CACHE_PATH,
+# e.g. .cache/vlm_cache_stub.sqlite3): a load test should hit the stub on
+# every call, and canned answers must never end up in the production cache.
+# Cache keys also include the backend URLs, so stub answers are not served
+# to a real endpoint even when the cache is left on.
+#
+# app.py, poa_extractor and process_multipage_document all get their client
+# from scripts.utils.vlm_clients, so VLM_BASE_URL is the only switch needed.
+# Two stubs with different --ttft-median behind VLM_BACKENDS exercise failover.
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scripts.config.prompt_registry import get_prompt_spec
+
+# Canned answers keyed by prompt registry name. Label prompts that are not
+# listed answer with their first allowed label; JSON prompts with a stub object.
+CANNED_RESPONSES = {
+    "broad_classification": "legal",
+    "legal_classification": "title deed",
+    "company_classification": "commercial license",
+    "bank_classification": "cheques",
+    "property_classification": "noc non objection certificate",
+    "personal_classification": "ids",
+    "poa_check": "no",
+    "id_side": "front",
+    "detect_parties": "yes",
+    "poa_language": "yes",
+    "hierarchical_classification": {"category": "legal", "doc_type": "title deed", "is_poa": False},
+    "title_deed": {
+        "Title Deed": {"Issue Date": "01-01-2024", "Mortgage Status": "Not Mortgaged",
+                       "Property Type": "Unit", "Community": "Business Bay",
+                       "Plot No": "123", "Municipality No": "345-678",
+                       "Building No": "1", "Building Name": "Stub Tower",
+                       "Property No": "1204", "Area Sq Meter": "85.5", "Area Sq Feet": "920.3"},
+        "Owners": [{"Owner ID": "100001", "Owner Name (English)": "John Stub",
+                    "Owner Name (Arabic)": "جون ستب", "Share (Sq Meter)": "85.5"}],
+    },
+    "emirates_id": {
+        "front": {"name_arabic": "جون ستب", "name_english": "John Stub",
+                  "emirates_id": "784-1990-1234567-1", "nationality": "United Kingdom",
+                  "gender": "M", "issuing_date": "01/01/2023", "expiry_date": "01/01/2028",
+                  "date_of_birth": "01/01/1990"},
+        "back": {"occupation": "Manager", "issuing_place": "Dubai"},
+    },
+    "passport": {"fullname": "John Stub", "passport_number": "123456789",
+                 "nationality": "United Kingdom", "date_of_birth": "01/01/1990",
+                 "Date of Issue": "01/01/2020", "Date of Expiry": "01/01/2030"},
+    "contract_f": {"Contract Information": {"Contract Number": "CF-0001", "Contract Date": "01/01/2024"}},
+    "initial_contract_of_sale": {"contract_number": "ICS-0001", "contract_date": "01/01/2024",
+                                 "sellers": [{"name": "Stub Developer", "type": "Company"}],
+                                 "buyers": [{"name": "John Stub", "type": "Person"}]},
+    "initial_contract_parties": {"sellers": [], "buyers": [{"name": "Jane Stub", "type": "Person"}],
+                                 "voucher_list": []},
+    "poa_english": {"principals": [{"name": "John Stub", "emirates_id": "784199012345671"}],
+                    "attorneys": [{"name": "Jane Stub", "passport_no": "P1234567"}]},
+}
+
+
+def canned_answer(messages):
+    """Returns the canned response text for a chat message list."""
+    content = messages[-1].get("content") if messages else None
+    parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+    spec = get_prompt_spec(parts)
+    name = spec["name"]
+
+    packed = re.match(r"(.+)_x(\d+)$", name)
+    if packed:
+        base, count = packed.group(1), int(packed.group(2))
+        answer = {f"Page_{i+1}": _answer_for(base, spec.get("labels"), "json") for i in range(count)}
+        return json.dumps(answer, ensure_ascii=False)
+    answer = _answer_for(name, spec.get("labels"), spec["shape"])
+    return answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+
+
+def _answer_for(name, labels, shape):
+    if name in CANNED_RESPONSES:
+        return CANNED_RESPONSES[name]
+    if labels:
+        return labels[0]
+    if shape == "json":
+        return {"stub": name}
+    return "stub response"
+
+
+def split_tokens(text):
+    """Roughly token-sized pieces (words and punctuation with their spacing)."""
+    return re.findall(r"\s*\S{1,4}", text) or [text]
+
+
+class StubConfig:
+    def __init__(self, args):
+        self.ttft_median = args.ttft_median
+        self.ttft_sigma = args.ttft_sigma
+        self.tokens_per_sec = args.tokens_per_sec
+        self.rate_429 = args.rate_429
+        self.rate_5xx = args.rate_5xx
+        self.rate_length = args.rate_length
+        self.max_body_bytes = args.max_body_bytes
+        self.retry_after = args.retry_after
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+
+    def ttft(self):
+        with self.lock:
+            return self.random.lognormvariate(0, self.ttft_sigma) * self.ttft_median
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/health"):
+            self._send_json(200, {"status": "ok"})
+        elif self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        cfg = self.config
+
+        if (cfg.max_body_bytes and length > cfg.max_body_bytes) or cfg.roll(cfg.rate_length):
+            self._send_json(413, {"error": {"message": "length limit exceeded", "type": "invalid_request_error"}})
+            return
+        if cfg.roll(cfg.rate_429):
+            self._send_json(429, {"error": {"message": "rate limit exceeded", "type": "rate_limit"}},
+                            headers={"Retry-After": str(cfg.retry_after)})
+            return
+        if cfg.roll(cfg.rate_5xx):
+            self._send_json(503, {"error": {"message": "upstream unavailable", "type": "server_error"}})
+            return
+
+        request = json.loads(body or b"{}")
+        model = request.get("model", "stub")
+        tokens = split_tokens(canned_answer(request.get("messages", [])))
+        tokens = tokens[:request.get("max_tokens") or len(tokens)]
+        time.sleep(cfg.ttft())
+
+        if not request.get("stream"):
+            time.sleep(len(tokens) / cfg.tokens_per_sec)
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion",
+                "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"completion_tokens": len(tokens)},
+            })
+            return
+        self._stream(model, tokens)
+
+    def _stream(self, model, tokens):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                delta = {"content": token}
+                if i == 0:
+                    delta["role"] = "assistant"
+                self._event(completion_id, model, delta, None)
+                time.sleep(1.0 / self.config.tokens_per_sec)
+            self._event(completion_id, model, {}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client closed the stream early (early stop or hedge cancel).
+            pass
+        self.close_connection = True
+
+    def _event(self, completion_id, model, delta, finish_reason):
+        chunk = {
+            "id": completion_id, "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible VLM stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft-median", type=float, default=0.8, help="median time to first token (s)")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5, help="lognormal sigma of time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="streaming throughput")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-length", type=float, default=0.0,
+                        help="fraction of requests rejected with 'length limit exceeded'")
+    parser.add_argument("--max-body-bytes", type=int, default=0,
+                        help="reject bodies larger than this with 'length limit exceeded' (0 = off)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def serve(args):
+    StubHandler.config = StubConfig(args)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"VLM stub listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve(parse_args())
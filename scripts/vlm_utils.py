@@ -3,64 +3,435 @@
 import time
 import base64
 import io
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from openai import OpenAI
 from PIL import Image, ImageOps
 import json
-import streamlit as st
+from scripts.utils.streamlit_compat import st
 import fitz  # PyMuPDF
 from scripts.config.prompts_legal import *
 from scripts.utils.json_utils import *
-
-THRESHOLD_BYTES = int(1.3 * 1024 * 1024)
-
-def call_vlm(messages, client):
+from scripts.config.vlm_settings import (
+    VLM_MODEL,
+    VLM_MAX_IN_FLIGHT,
+    VLM_CALL_TIMEOUT,
+    VLM_PAGES_PER_REQUEST,
+    VLM_MULTI_IMAGE_MAX_BYTES,
+    VLM_QUEUE_TIMEOUT,
+    VLM_HEDGE_BASE_URL,
+    VLM_LARGE_MODEL,
+    VLM_IMAGE_MAX_BYTES,
+    VLM_TEXT_EXTRACTION_ENABLED,
+)
+from scripts.config.prompt_registry import get_prompt_spec, multipage_prompt, route_model
+from scripts.utils.vlm_cache import get_vlm_cache, make_cache_key
+from scripts.utils.vlm_clients import get_vlm_client
+from scripts.utils.rate_limiter import get_vlm_guard, VLMUnavailableError, is_model_unavailable
+from scripts.utils.hedging import get_hedging_policy, HedgeCancelled, StreamCancel
+from scripts.utils.vlm_backends import get_backend_pool, configured_backend_urls
+from scripts.utils.vlm_telemetry import record_vlm_call, describe_payload, record_input_path
+from scripts.utils.image_encoder import encode_image, load_image
+from scripts.utils.render_cache import open_cached_pdf, render_page_image
+from scripts.utils.text_layer import document_text, text_messages
+from scripts.utils.page_triage import content_pages
+from scripts.config.resolution_profiles import profile_for
+
+THRESHOLD_BYTES = VLM_IMAGE_MAX_BYTES
+VLM_SAMPLING = {"temperature": 0, "seed": 2025}
+
+def _normalize_label(text):
+    return text.strip().strip("*'\"`.").strip().lower()
+
+def _match_label(text, labels):
     """
-    Calls the VLM with the provided messages and returns the streamed response text and processing time.
+    Returns the label once `text` spells out a complete label that cannot still
+    grow into a longer one (e.g. "title deed" vs "title deed lease to own").
     """
-    start_time = time.time()
+    candidate = _normalize_label(text)
+    if candidate not in labels:
+        return None
+    if any(other != candidate and other.startswith(candidate) for other in labels):
+        return None
+    return candidate
+
+def _stream_vlm(messages, client, spec, timeout=None, on_first_token=None, cancel=None, stats=None,
+                model=VLM_MODEL):
+    """
+    Sends one streaming chat completion and returns the stripped response text.
+    The stream is closed early once a label prompt has produced a valid label
+    or a JSON prompt has closed its top-level object.
+    `on_first_token` is called when the first chunk arrives; setting
+    `cancel` (a StreamCancel) closes and abandons the stream. `stats`
+    receives "ttft" and "output_tokens" of a completed stream.
+    """
+    request_kwargs = {}
+    if timeout is not None:
+        request_kwargs["timeout"] = timeout
+    started = time.time()
+    first_token_at = None
+    if cancel is not None and cancel.is_set():
+        raise HedgeCancelled()
     chat_completion = client.chat.completions.create(
 #         model="tgi",
-        model='Qwen/Qwen2.5-VL-7B-Instruct',
+        model=model,
         messages=[{"role": "user", "content": messages}],
-        temperature=0,
-        max_tokens=1024,
         stream=True,
-        seed=2025
+        max_tokens=spec["max_tokens"],
+        **VLM_SAMPLING,
+        **request_kwargs
     )
-    response_text = ""
-    for message in chat_completion:
-        chunk = message.choices[0].delta.content
-        response_text += chunk
+    if cancel is not None:
+        # Cancelling closes the stream, even while waiting for the next chunk.
+        cancel.attach(chat_completion)
+    shape = spec["shape"]
+    json_end = JsonEndDetector() if shape == "json" else None
+    chunks = []
+    try:
+        for message in chat_completion:
+            if cancel is not None and cancel.is_set():
+                raise HedgeCancelled()
+            if first_token_at is None:
+                first_token_at = time.time()
+                if on_first_token is not None:
+                    on_first_token()
+            if not message.choices:
+                continue
+            chunk = message.choices[0].delta.content
+            if not chunk:
+                continue
+            chunks.append(chunk)
+            if shape == "label":
+                label = _match_label("".join(chunks), spec["labels"])
+                if label is not None:
+                    break
+            elif json_end is not None and json_end.feed(chunk):
+                break
+        else:
+            label = None
+    except Exception:
+        if cancel is not None and cancel.is_set():
+            raise HedgeCancelled()
+        raise
+    finally:
+        close = getattr(chat_completion, "close", None)
+        if close is not None:
+            close()
+    if cancel is not None and cancel.is_set():
+        # Closed from outside: the text so far is incomplete.
+        raise HedgeCancelled()
+    if stats is not None:
+        stats["ttft"] = None if first_token_at is None else first_token_at - started
+        # One streamed chunk is one generated token on TGI/vLLM-style servers.
+        stats["output_tokens"] = len(chunks)
+    if shape == "label" and label is not None:
+        return label
+    return "".join(chunks).strip()
+
+def answer_in_label_set(spec, text):
+    """
+    True if a response respects the prompt's label set: a label prompt's
+    answer is one of its labels, a JSON answer's `label_key` field (or, for
+    packed label prompts, every "Page_N" value) is. Prompts without labels
+    always pass.
+    """
+    labels = spec.get("labels")
+    if not labels:
+        return True
+    if spec["shape"] == "label":
+        return _normalize_label(text) in labels
+    parsed = post_processing(text)
+    if not isinstance(parsed, dict) or not parsed:
+        return False
+    values = [parsed.get(spec["label_key"])] if "label_key" in spec else list(parsed.values())
+    return all(isinstance(v, str) and _normalize_label(v) in labels for v in values)
+
+def call_vlm(messages, client, timeout=None, use_cache=True, cancel=None):
+    """
+    Calls the VLM with the provided messages and returns the streamed response text and processing time.
+    The request goes to the fastest healthy backend in VLM_BACKENDS (using the API key of
+    `client`) and fails over to the next one if that backend is throttled or down.
+    An optional timeout (seconds) is applied to each underlying HTTP request; throttled
+    or failed requests are queued and retried by the shared VLMGuard.
+    max_tokens and early stopping come from the prompt registry.
+    Responses are served from the persistent cache when the same images, prompt,
+    model, sampling parameters and backends were already answered.
+    The model is chosen per prompt (route_model); small-model answers outside the
+    prompt's label set are re-asked of VLM_LARGE_MODEL.
+    Setting `cancel` (a StreamCancel) closes the open stream and makes the call
+    raise HedgeCancelled.
+    """
+    start_time = time.time()
+    spec = get_prompt_spec(messages)
+    model = route_model(spec)
+    stats = {"retries": 0, "model": model}
+
+    pool = get_backend_pool()
+
+    def hedged(model):
+        def attempt(first, on_first_token, cancel):
+            def send(target, timing):
+                return _stream_vlm(messages, target, spec, timeout=timeout,
+                                   on_first_token=on_first_token, cancel=cancel, stats=timing,
+                                   model=model)
+            # Only the small model is remembered as missing per backend; a 404
+            # for the large one is a plain error.
+            served = model if model != VLM_LARGE_MODEL else None
+            return pool.call(send, client, first=first, stats=stats, model=served)
+
+        # The duplicate goes to VLM_HEDGE_BASE_URL, else the runner-up backend.
+        ranked = pool.ranked()
+        if VLM_HEDGE_BASE_URL:
+            alternate = pool.backend(VLM_HEDGE_BASE_URL)
+        else:
+            alternate = ranked[1] if len(ranked) > 1 else None
+        return get_hedging_policy().run(attempt, ranked[0], alternate, stats=stats, cancel=cancel,
+                                        key=(spec["name"], model))
+
+    def upstream():
+        # Rate limiting, circuit breaking and retries for the real request,
+        # failover across backends and an optional hedged duplicate when the
+        # first token is late.
+        guard = get_vlm_guard()
+        if model == VLM_LARGE_MODEL:
+            return guard.call(lambda: hedged(model), stats=stats, key=(spec["name"], model))
+        try:
+            text = guard.call(lambda: hedged(model), stats=stats, key=(spec["name"], model))
+        except Exception as exc:
+            # The provider may not serve the small model at all (404, or a
+            # 400/422 "model not found"); the pool remembers that per backend.
+            if not is_model_unavailable(exc):
+                raise
+            text = None
+        if text is not None and answer_in_label_set(spec, text):
+            return text
+        stats["escalated"] = True
+        stats["model"] = VLM_LARGE_MODEL
+        return guard.call(lambda: hedged(VLM_LARGE_MODEL), stats=stats,
+                          key=(spec["name"], VLM_LARGE_MODEL))
+
+    outcome = "ok"
+    try:
+        cache = get_vlm_cache() if use_cache else None
+        if cache is None:
+            response_text = upstream()
+        else:
+            params = dict(VLM_SAMPLING, max_tokens=spec["max_tokens"])
+            key = make_cache_key(messages, model, params, backends=configured_backend_urls())
+            # A waiter sends its own request when the first caller was cancelled
+            # or timed out in the queue rather than failing with it.
+            response_text, hit = cache.get_or_compute(
+                key, upstream, retry_on=(HedgeCancelled, VLMUnavailableError)
+            )
+            if hit:
+                outcome = "cache_hit"
+    except Exception as exc:
+        outcome = f"error:{type(exc).__name__}"
+        stats["status_code"] = getattr(exc, "status_code", None)
+        raise
+    finally:
+        payload_bytes, image_sizes = describe_payload(messages)
+        record_vlm_call(dict(
+            stats,
+            prompt=spec["name"],
+            payload_bytes=payload_bytes,
+            image_sizes=image_sizes,
+            latency=time.time() - start_time,
+            outcome=outcome,
+        ))
     end_time = time.time()
-    return response_text.strip(), end_time - start_time
+    return response_text, end_time - start_time
+
+
+async def call_vlm_async(messages, client, timeout=None, executor=None):
+    """
+    Awaitable version of call_vlm with the same arguments and return value.
+    The blocking stream runs on `executor` (default loop executor if None) so
+    many calls can be awaited side by side. A call that times out or is
+    cancelled has its stream closed.
+    """
+    loop = asyncio.get_running_loop()
+    cancel = StreamCancel()
+    call = functools.partial(call_vlm, messages, client, timeout=timeout, cancel=cancel)
+    future = loop.run_in_executor(executor, call)
+    try:
+        if timeout is None:
+            return await future
+        # `timeout` bounds each HTTP request; the call may also wait in the
+        # VLMGuard queue and retry for up to VLM_QUEUE_TIMEOUT.
+        return await asyncio.wait_for(future, timeout + VLM_QUEUE_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # The worker thread cannot be interrupted; closing its stream ends it.
+        cancel.set()
+        raise
+
+
+async def gather_vlm(message_lists, client, max_in_flight=VLM_MAX_IN_FLIGHT,
+                     timeout=VLM_CALL_TIMEOUT, return_exceptions=True):
+    """
+    Sends every message list in `message_lists` to the VLM with at most
+    `max_in_flight` requests open at once. Results come back in input order;
+    with return_exceptions=True a failed call yields its exception in place
+    of the (text, seconds) tuple.
+    """
+    if not message_lists:
+        return []
+    max_in_flight = max(1, min(max_in_flight, len(message_lists)))
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="vlm")
+
+    async def _bounded(messages):
+        async with semaphore:
+            return await call_vlm_async(messages, client, timeout=timeout, executor=pool)
+
+    try:
+        return await asyncio.gather(
+            *(_bounded(messages) for messages in message_lists),
+            return_exceptions=return_exceptions
+        )
+    finally:
+        # Not `with pool:`, whose exit would join threads still streaming a
+        # timed-out call; those were cancelled and finish on their own.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def call_vlm_batch(message_lists, client, max_in_flight=VLM_MAX_IN_FLIGHT,
+                   timeout=VLM_CALL_TIMEOUT, return_exceptions=True):
+    """
+    Blocking entry point for gather_vlm, usable from the Streamlit script thread.
+    Returns a list aligned with `message_lists`.
+    """
+    def _run():
+        return asyncio.run(gather_vlm(
+            message_lists, client,
+            max_in_flight=max_in_flight,
+            timeout=timeout,
+            return_exceptions=return_exceptions
+        ))
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return _run()
+    # Already inside an event loop (e.g. a notebook): run on a helper thread.
+    with ThreadPoolExecutor(max_workers=1) as helper:
+        return helper.submit(_run).result()
+
+def build_page_requests(page_uris, prompt, max_pages=VLM_PAGES_PER_REQUEST,
+                        max_bytes=VLM_MULTI_IMAGE_MAX_BYTES):
+    """
+    Packs consecutive page images into as few requests as the page and byte
+    budgets allow. Each request is a dict with the VLM `messages` and the
+    0-based `pages` it covers. Single-page requests use `prompt` unchanged.
+    """
+    groups, current, current_bytes = [], [], 0
+    for idx, uri in enumerate(page_uris):
+        size = len(uri)
+        if current and (len(current) >= max_pages or current_bytes + size > max_bytes):
+            groups.append(current)
+            current, current_bytes = [], 0
+        current.append(idx)
+        current_bytes += size
+    if current:
+        groups.append(current)
+
+    requests = []
+    for pages in groups:
+        text = prompt if len(pages) == 1 else multipage_prompt(prompt, len(pages))
+        messages = [{"type": "image_url", "image_url": {"url": page_uris[i]}} for i in pages]
+        messages.append({"type": "text", "text": text})
+        requests.append({"messages": messages, "pages": pages, "prompt": prompt})
+    return requests
+
+
+def _split_multipage_answer(raw, page_count):
+    """Returns the per-page answers of a packed request, or None if unusable."""
+    cleaned = clean_json_string(raw)
+    try:
+        parsed = json.loads(cleaned)
+    except json.JSONDecodeError:
+        parsed = post_processing(cleaned)
+    if not isinstance(parsed, dict):
+        return None
+    answers = []
+    for i in range(page_count):
+        value = parsed.get(f"Page_{i+1}")
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False)
+        answers.append(value.strip())
+    return answers
+
+
+def split_page_responses(requests, responses, client):
+    """
+    Maps the responses of build_page_requests() back onto pages. Returns a
+    list with one (text, seconds) tuple or exception per page. Packed requests
+    that failed or could not be split are retried one page per request.
+    """
+    page_count = sum(len(r["pages"]) for r in requests)
+    per_page = [None] * page_count
+    retry = []
+    for request, response in zip(requests, responses):
+        pages = request["pages"]
+        if len(pages) == 1:
+            per_page[pages[0]] = response
+            continue
+        answers = None
+        if not isinstance(response, BaseException):
+            answers = _split_multipage_answer(response[0], len(pages))
+        if answers is None:
+            retry.extend((i, request) for i in pages)
+            continue
+        for i, answer in zip(pages, answers):
+            per_page[i] = (answer, response[1])
+
+    if retry:
+        retry_messages = []
+        for i, request in retry:
+            image = request["messages"][request["pages"].index(i)]
+            retry_messages.append([image, {"type": "text", "text": request["prompt"]}])
+        for (i, _), response in zip(retry, call_vlm_batch(retry_messages, client)):
+            per_page[i] = response
+    return per_page
 
-def process_image_file(file_data, target_size=None):
+
+def call_vlm_pages(page_uris, prompt, client, return_exceptions=True):
+    """
+    Runs `prompt` on every page image, packing several pages per request
+    (see build_page_requests) and sending the requests as one batch.
+    Returns results aligned with `page_uris`, like call_vlm_batch.
+    """
+    requests = build_page_requests(page_uris, prompt)
+    responses = call_vlm_batch([r["messages"] for r in requests], client)
+    per_page = split_page_responses(requests, responses, client)
+    if not return_exceptions:
+        for response in per_page:
+            if isinstance(response, BaseException):
+                raise response
+    return per_page
+
+def process_image_file(file_data, profile="classification"):
     """
-    Opens an image file (provided as a file-like object), optionally resizes it, converts it to PNG bytes,
-    and returns a data URI and the image bytes.
+    Opens an image file (provided as a file-like object), fits it to a resolution
+    profile (aspect ratio kept, never upscaled) and encodes it under THRESHOLD_BYTES.
+    Returns a data URI and the image bytes.
     """
     try:
-        img = Image.open(file_data)
-        img = ImageOps.exif_transpose(img)
-        if target_size:
-            img = img.resize(target_size)
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        image_bytes = buffered.getvalue()
-        encoded_image = base64.b64encode(image_bytes).decode("utf-8")
-        data_uri = f"data:image/png;base64,{encoded_image}"
-        return data_uri, image_bytes
+        encoded = encode_image(file_data, max_bytes=THRESHOLD_BYTES, profile=profile_for(profile))
+        return encoded.data_uri, encoded.data
     except Exception as e:
         raise Exception(f"Error processing image file: {e}")
 
-def process_pdf_file(file_data, target_size=(1024, 1024)):
+def process_pdf_file(file_data, profile="classification"):
     """
     Converts the first page of a PDF (provided as a file-like object) into an image using PyMuPDF.
-    The page is rendered with an explicit zoom factor, then processed with PIL to match the same
-    quality and dimensions as image files.
+    The page is rendered straight at the resolution profile (zoom computed from the page rect,
+    aspect ratio kept) and encoded once under THRESHOLD_BYTES, like image files.
     Returns a data URI and the processed image bytes.
     """
     try:
@@ -69,152 +440,106 @@ def process_pdf_file(file_data, target_size=(1024, 1024)):
         if not pdf_bytes:
             raise Exception("PDF file is empty or could not be read.")
 
-        # Open the PDF from bytes.
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        # Load the first page and render with an explicit zoom (improves resolution).
-        page = doc.load_page(0)
-        matrix = fitz.Matrix(1.75, 1.75)
-        pix = page.get_pixmap(matrix=matrix)
-        image_bytes = pix.tobytes("png")
+        # Open the PDF from bytes; the render is shared with later stages.
+        doc = open_cached_pdf(pdf_bytes)
+        encoded = encode_pdf_page(doc, 0, profile=profile)
         doc.close()
-
-
-        img = Image.open(BytesIO(image_bytes))
-        img = ImageOps.exif_transpose(img)  # Correct for any EXIF orientation issues.
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        # Resize to the target dimensions.
-        img = img.resize(target_size)
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        processed_bytes = buffered.getvalue()
-
-        # Downscale if needed using the pre-existing THRESHOLD_BYTES.
-        if len(processed_bytes) > THRESHOLD_BYTES:
-            data_uri, processed_bytes, _ = downscale_until(processed_bytes)
-        else:
-            encoded_image = base64.b64encode(processed_bytes).decode("utf-8")
-            data_uri = f"data:image/png;base64,{encoded_image}"
-        
-        return data_uri, processed_bytes
+        return encoded.data_uri, encoded.data
     except Exception as e:
         raise Exception(f"Error processing PDF file: {e}")
 
 
-def downscale_until(image_bytes, threshold=THRESHOLD_BYTES, scale_factor=1, filetype="png"):
+def encode_pdf_page(doc, page_num, zoom=1.75, max_bytes=THRESHOLD_BYTES, max_side=None, profile=None):
     """
-    Repeatedly downscale the image by scale_factor until its size is below the threshold.
-    Returns a tuple (data_uri, new_image_bytes, downsized_flag).
+    Renders one page of a CachedDocument (see open_cached_pdf) and encodes it under
+    max_bytes, reusing earlier renders and encodings of the same page. `profile` (a
+    doc_type or profile name, see resolution_profiles) replaces the fixed zoom.
+    Returns an EncodedImage (bytes, format, size and lazy data_uri).
     """
-    downsized = False
-    current_bytes = image_bytes
-    while len(current_bytes) > threshold:
-        try:
-            doc = fitz.open(stream=current_bytes, filetype=filetype)
-            # For downscaling, use a matrix with the provided scale_factor.
-            page = doc[0]
-            matrix = fitz.Matrix(scale_factor, scale_factor)
-            pix = page.get_pixmap(matrix=matrix)
-            current_bytes = pix.tobytes("png")
-            downsized = True
-        except Exception as ex:
-            st.write("Downscaling error:", ex)
-            break
-    encoded_image = base64.b64encode(current_bytes).decode("utf-8")
-    data_uri = f"data:image/png;base64,{encoded_image}"
-    return data_uri, current_bytes, downsized
-
-
+    if profile is not None:
+        profile = profile_for(profile)
+    return doc.encoded(page_num, zoom=zoom, max_bytes=max_bytes, max_side=max_side, profile=profile)
 
 
-
-def process_multipage_document(file_data, extraction_prompt, max_page=6):
+def process_multipage_document(file_data, extraction_prompt, max_page=6, profile="multi_column"):
     """
     Extracts text data from the first few pages of a PDF by converting them to images
-    and sending each to the VLM. Returns a JSON string of combined, cleaned results.
+    and sending them to the VLM, several pages per request, as one concurrent batch.
+    Returns a JSON string of combined, cleaned results.
     """
     import base64
     from openai import APIStatusError
 
     combined_results = {}
-    doc = fitz.open(stream=file_data.read(), filetype="pdf")
-
-    for page_num in range(min(max_page, len(doc))):
-        page = doc.load_page(page_num)
-        pix = page.get_pixmap(matrix=fitz.Matrix(1.75, 1.75))
-        img_bytes = pix.tobytes("png")
-        uri = f"data:image/png;base64,{base64.b64encode(img_bytes).decode()}"
+    doc = open_cached_pdf(file_data.read())
+    page_count = min(max_page, doc.page_count)
+
+    pages = list(range(page_count))
+    client = get_vlm_client()
+
+    # Born-digital PDFs: one text-only request per page, no rendering.
+    texts = {page_num: document_text(doc, [page_num]) for page_num in pages} if VLM_TEXT_EXTRACTION_ENABLED else {}
+    if not (texts and all(texts.values())):
+        # Blank pages are not sent; the others keep their Page_N numbers.
+        pages, blank = content_pages(doc, pages)
+        for page_num in blank:
+            st.info(f"Skipping page {page_num+1}: blank")
+    page_texts = [texts[page_num] for page_num in pages] if texts else []
+    if pages and all(page_texts):
+        doc.close()
+        record_input_path("extraction", "text", "multipage")
+        page_messages = [text_messages(text, extraction_prompt) for text in page_texts]
+        with st.spinner(f"Extracting data from {len(pages)} page(s) (text layer)…"):
+            responses = call_vlm_batch(page_messages, client)
+    else:
+        record_input_path("extraction", "image", "multipage")
+        doc.prefetch(pages, profile=profile_for(profile))
+        page_uris = [encode_pdf_page(doc, page_num, profile=profile).data_uri for page_num in pages]
+        doc.close()
 
-        messages = [
-            {"type": "image_url", "image_url": {"url": uri}},
-            {"type": "text",      "text": extraction_prompt}
+        page_messages = [
+            [
+                {"type": "image_url", "image_url": {"url": uri}},
+                {"type": "text",      "text": extraction_prompt}
+            ]
+            for uri in page_uris
         ]
 
-        with st.spinner(f"Extracting data from page {page_num+1}/{max_page}…"):
-            fb_raw   = st.secrets["huggingface"]
-            fb_creds = fb_raw.to_dict()
-            client = OpenAI(
-                base_url="https://router.huggingface.co/hyperbolic/v1",
-                # base_url="https://mf32siy1syuf3src.us-east-1.aws.endpoints.huggingface.cloud/v1/",
-                api_key=fb_creds["token"]
-            )
-            try:
-                # First attempt
-                raw_output, _ = call_vlm(messages, client)
-
-            except APIStatusError as e:
-                # If request body too large, downscale and retry
-                if "length limit exceeded" in str(e).lower():
-                    st.warning(f"Page {page_num+1}: payload too large—downscaling and retrying…")
-
-                    # Decode original bytes, downscale to <100 KB
-                    original_bytes = base64.b64decode(uri.split(",", 1)[1])
-                    new_uri, small_bytes, _ = downscale_until(
-                        original_bytes,
-                        threshold=100_000,
-                        scale_factor=0.5
-                    )
-
-                    # Update the message payload
-                    messages[0]["image_url"]["url"] = new_uri
-
-                    # Retry the VLM call
-                    raw_output, _ = call_vlm(messages, client)
-                else:
-                    # Re-raise unexpected errors
-                    raise
+        with st.spinner(f"Extracting data from {len(pages)} page(s)…"):
+            responses = call_vlm_pages(page_uris, extraction_prompt, client)
+
+    for page_num, messages, response in zip(pages, page_messages, responses):
+        if (isinstance(response, APIStatusError) and "length limit exceeded" in str(response).lower()
+                and messages[0]["type"] == "image_url"):
+            # If request body too large, downscale and retry
+            st.warning(f"Page {page_num+1}: payload too large—downscaling and retrying…")
+
+            # Decode original bytes, re-encode to <100 KB
+            uri = messages[0]["image_url"]["url"]
+            original_bytes = base64.b64decode(uri.split(",", 1)[1])
+            small = encode_image(original_bytes, max_bytes=100_000)
+
+            # Update the message payload
+            messages[0]["image_url"]["url"] = small.data_uri
+
+            # Retry the VLM call
+            response = call_vlm(messages, client)
+        if isinstance(response, BaseException):
+            # Re-raise unexpected errors
+            raise response
+        raw_output, _ = response
 
         # Clean and parse the response
         stripped = raw_output.replace("```json", "").replace("```", "").strip()
         page_data = post_processing(stripped)
         combined_results[f"Page_{page_num+1}"] = page_data
 
-    doc.close()
     return json.dumps(combined_results, indent=2, ensure_ascii=False)
 
 
 
 
 
-def upscale_image(image_bytes, zoom=1.75, filetype="png"):
-    """
-    Upscales the image using the specified zoom factor.
-    Returns a tuple (data_uri, new_image_bytes). In case of failure, returns the original image.
-    """
-    try:
-        doc = fitz.open(stream=image_bytes, filetype=filetype)
-        page = doc[0]
-        matrix = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=matrix)
-        new_bytes = pix.tobytes("png")
-        encoded_image = base64.b64encode(new_bytes).decode("utf-8")
-        data_uri = f"data:image/png;base64,{encoded_image}"
-        return data_uri, new_bytes
-    except Exception as ex:
-        st.write("Upscaling failed:", ex)
-        encoded_image = base64.b64encode(image_bytes).decode("utf-8")
-        return f"data:image/png;base64,{encoded_image}", image_bytes
-
 def safe_json_loads(text):
     """
     Cleans and loads a JSON string by removing common markdown formatting.
@@ -275,25 +600,47 @@ def process_initial_contract(pdf_bytes: bytes, client: OpenAI, max_pages: int =
     In combining, only keep 'sellers' and 'buyers', discarding 'voucher_list'.
     Return ordered dict: contract fields first, then sellers and buyers.
     """
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    doc = open_cached_pdf(pdf_bytes)
     pages_to_check = doc.page_count if max_pages is None else min(doc.page_count, max_pages)
 
     combined = {'sellers': [], 'buyers': []}
 
-    # Process first page: full contract + parties
+    # The first page is always read; later blank pages are not sent.
+    pages = []
     if pages_to_check > 0:
-        page0 = doc.load_page(0)
-        pix = page0.get_pixmap(matrix=fitz.Matrix(1.75, 1.75))
-        img0 = pix.tobytes("png")
-        if len(img0) > THRESHOLD_BYTES:
-            uri0, img0, _ = downscale_until(img0)
-        else:
-            uri0 = "data:image/png;base64," + base64.b64encode(img0).decode()
-        messages0 = [
-            {"type": "image_url", "image_url": {"url": uri0}},
+        rest, blank = content_pages(doc, range(1, pages_to_check))
+        pages = [0] + rest
+        for page_num in blank:
+            st.info(f"Skipping page {page_num+1}: blank")
+
+    # Render every page once up front so the VLM calls can be fanned out.
+    doc.prefetch(pages, profile=profile_for("initial contract of sale"))
+    page_uris = [
+        encode_pdf_page(doc, page_num, profile="initial contract of sale").data_uri
+        for page_num in pages
+    ]
+
+    # First page: full contract + parties. Subsequent pages: PARTIES detection,
+    # packed several pages per request. Both go out in the same batch.
+    first_batch = []
+    if pages_to_check > 0:
+        first_batch.append([
+            {"type": "image_url", "image_url": {"url": page_uris[0]}},
             {"type": "text", "text": INITIAL_CONTRACT_OF_SALE_PROMPT}
-        ]
-        raw0, _ = call_vlm(messages0, client)
+        ])
+    detect_requests = build_page_requests(page_uris[1:], detect_parties_prompt)
+    first_batch.extend(r["messages"] for r in detect_requests)
+    first_responses = call_vlm_batch(first_batch, client)
+    if pages_to_check > 0:
+        first_responses = [first_responses[0]] + split_page_responses(
+            detect_requests, first_responses[1:], client
+        )
+    for response in first_responses:
+        if isinstance(response, BaseException):
+            raise response
+
+    if pages_to_check > 0:
+        raw0, _ = first_responses[0]
         cleaned0 = raw0.strip().lstrip("```json").rstrip("```").strip()
 #         st.write(cleaned0)
         try:
@@ -307,31 +654,16 @@ def process_initial_contract(pdf_bytes: bytes, client: OpenAI, max_pages: int =
             else:
                 combined[k] = v
 
-    # Process subsequent pages for additional parties & voucher_list
-    for page_num in range(1, pages_to_check):
-        page = doc.load_page(page_num)
-        # render page
-        pix = page.get_pixmap(matrix=fitz.Matrix(1.75, 1.75))
-        img = pix.tobytes("png")
-        if len(img) > THRESHOLD_BYTES:
-            uri, img, _ = downscale_until(img)
-        else:
-            uri = "data:image/png;base64," + base64.b64encode(img).decode()
-
-        # Detect PARTIES section
-        resp, _ = call_vlm([
-            {"type": "image_url", "image_url": {"url": uri}},
-            {"type": "text", "text": detect_parties_prompt}
-        ], client)
-#         st.write(resp)
-        if resp.strip().lower() != 'yes':
-            continue
+    # Extract parties and vouchers from the pages that have a PARTIES section
+    party_uris = [
+        uri for uri, (resp, _) in zip(page_uris[1:], first_responses[1:])
+        if resp.strip().lower() == 'yes'
+    ]
+    party_responses = call_vlm_pages(
+        party_uris, extract_parties_and_vouchers_prompt, client, return_exceptions=False
+    )
 
-        # Extract parties and vouchers
-        raw, _ = call_vlm([
-            {"type": "image_url", "image_url": {"url": uri}},
-            {"type": "text", "text": extract_parties_and_vouchers_prompt}
-        ], client)
+    for raw, _ in party_responses:
         cleaned = raw.strip().lstrip("```json").rstrip("```").strip()
 #         st.write(cleaned)
         try:
@@ -0,0 +1,102 @@
+# test_hedging.py
+
+import threading
+import time
+
+import pytest
+
+from scripts.utils.hedging import HedgeBudget, HedgeCancelled, HedgingPolicy, StreamCancel
+
+
+class FakeStream:
+    """Blocks like a stream waiting for its next chunk until closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+    def wait(self, seconds=5):
+        self.closed.wait(seconds)
+        raise HedgeCancelled()
+
+
+def policy(delay=0.2, budget=10, key=None):
+    p = HedgingPolicy(enabled=True, min_delay=delay, min_samples=1, budget=HedgeBudget(per_minute=budget))
+    p.ttft.record(delay, key)
+    return p
+
+
+def test_cancel_closes_attached_stream_and_children():
+    parent = StreamCancel()
+    child = StreamCancel(parent)
+    stream = FakeStream()
+    child.attach(stream)
+    parent.set()
+    assert child.is_set() and stream.closed.is_set()
+
+    late = FakeStream()
+    child.attach(late)
+    assert late.closed.is_set()
+    assert StreamCancel(parent).is_set()
+
+
+def test_losing_stream_is_closed():
+    streams = {}
+
+    def attempt(client, on_first_token, cancel):
+        if client == "slow":
+            streams["slow"] = FakeStream()
+            cancel.attach(streams["slow"])
+            streams["slow"].wait()
+        on_first_token()
+        return client
+
+    stats = {}
+    p = policy(delay=0.05)
+    assert p.run(attempt, "slow", "fast", stats=stats) == "fast"
+    assert stats["hedged"] and stats["hedge_won"]
+    assert streams["slow"].closed.wait(1)
+    # The winner's TTFT is recorded: from the start of the call in stats,
+    # from the hedge's own start in the history.
+    assert stats["ttft"] >= 0.05
+    fastest, count = p.ttft.percentile(1)
+    assert count == 2 and fastest < 0.05
+
+
+def test_hedge_delay_is_per_key():
+    p = policy(delay=0.05, key=("id_side", "small"))
+    for _ in range(5):
+        p.ttft.record(3.0, ("emirates_id", "large"))
+    assert p.hedge_delay(("id_side", "small")) == 0.05
+    assert p.hedge_delay(("emirates_id", "large")) == 3.0
+    assert p.hedge_delay(("poa", "large")) is None
+
+
+def test_failed_primary_does_not_wait_out_the_delay():
+    def attempt(client, on_first_token, cancel):
+        raise ConnectionError("refused")
+
+    start = time.monotonic()
+    with pytest.raises(ConnectionError):
+        policy(delay=2.0, budget=0).run(attempt, "primary")
+    assert time.monotonic() - start < 1.0
+
+
+def test_fast_primary_is_not_hedged():
+    clients = []
+
+    def attempt(client, on_first_token, cancel):
+        clients.append(client)
+        on_first_token()
+        return client
+
+    stats = {}
+    assert policy(delay=1.0).run(attempt, "primary", "hedge", stats=stats) == "primary"
+    assert clients == ["primary"] and stats["hedged"] is False
+
+
+def test_budget_caps_hedges():
+    budget = HedgeBudget(per_minute=2)
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
@@ -0,0 +1,114 @@
+# test_job_queue.py
+
+import threading
+
+import pytest
+
+from scripts.utils.job_queue import (
+    DONE,
+    FAILED,
+    INTERACTIVE_PRIORITY,
+    PREFETCH_PRIORITY,
+    QUEUED,
+    RUNNING,
+    JobQueue,
+    batch_finished,
+)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def documents(*names):
+    return [(name, f"%PDF {name}".encode()) for name in names]
+
+
+def statuses(queue, batch_id):
+    return [job["status"] for job in queue.batch_jobs(batch_id)]
+
+
+def test_claims_in_enqueue_order(queue):
+    batch = queue.enqueue(documents("a.pdf", "b.pdf"), appointment_id="42")
+    first, second = queue.claim("w1"), queue.claim("w1")
+    assert (first["filename"], second["filename"]) == ("a.pdf", "b.pdf")
+    assert first["payload"] == b"%PDF a.pdf" and first["attempts"] == 1
+    assert queue.claim("w1") is None
+    assert statuses(queue, batch) == [RUNNING, RUNNING]
+    assert queue.latest_batch("42") == batch
+
+
+def test_interactive_jobs_outrank_prefetch(queue):
+    queue.enqueue(documents("prefetch.pdf"), priority=PREFETCH_PRIORITY)
+    queue.enqueue(documents("csr.pdf"))
+    assert queue.claim("w", min_priority=INTERACTIVE_PRIORITY)["filename"] == "csr.pdf"
+    assert queue.claim("w", min_priority=INTERACTIVE_PRIORITY) is None
+    assert queue.claim("w")["filename"] == "prefetch.pdf"
+
+
+def test_a_job_is_claimed_once(queue):
+    queue.enqueue(documents(*[f"{i}.pdf" for i in range(20)]))
+    claimed, lock = [], threading.Lock()
+
+    def work(worker):
+        while (job := queue.claim(worker)) is not None:
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == len(set(claimed)) == 20
+
+
+def test_complete_and_fail(queue):
+    batch = queue.enqueue(documents("a.pdf", "b.pdf", "c.pdf"))
+    a, b = queue.claim("w"), queue.claim("w")
+    queue.complete(a["id"], "w", {"doc_type": "ids"})
+    queue.fail(b["id"], "w", "ValueError: bad page")
+    assert statuses(queue, batch) == [DONE, FAILED, QUEUED]
+    assert queue.batch_results(batch) == [{"doc_type": "ids"}, None, None]
+    assert not batch_finished(queue.batch_jobs(batch))
+    c = queue.claim("w")
+    queue.complete(c["id"], "w", [{"doc_type": "passport"}])
+    assert batch_finished(queue.batch_jobs(batch))
+    assert queue.batch_jobs(batch)[1]["error"] == "ValueError: bad page"
+
+
+def test_stale_jobs_are_requeued_then_failed(queue):
+    batch = queue.enqueue(documents("a.pdf"))
+    job = queue.claim("crashed")
+    assert queue.requeue_stale(stale_after=60) == 0
+    assert queue.requeue_stale(stale_after=-1, max_attempts=2) == 1
+    assert statuses(queue, batch) == [QUEUED]
+
+    retry = queue.claim("w2")
+    assert retry["id"] == job["id"] and retry["attempts"] == 2
+    # The first worker's late result no longer counts.
+    queue.complete(job["id"], "crashed", "stale")
+    assert statuses(queue, batch) == [RUNNING]
+
+    assert queue.requeue_stale(stale_after=-1, max_attempts=2) == 1
+    jobs = queue.batch_jobs(batch)
+    assert jobs[0]["status"] == FAILED and jobs[0]["error"] == "worker stopped responding"
+
+
+def test_heartbeat_keeps_a_job_alive(queue):
+    queue.enqueue(documents("a.pdf"))
+    job = queue.claim("w")
+    queue.heartbeat([job["id"]], "w")
+    assert queue.requeue_stale(stale_after=60) == 0
+
+
+def test_purge_and_counts(queue):
+    queue.enqueue(documents("a.pdf", "b.pdf"), priority=PREFETCH_PRIORITY)
+    job = queue.claim("w")
+    queue.complete(job["id"], "w", {})
+    assert queue.counts() == {DONE: 1, QUEUED: 1}
+    assert queue.active_by_priority() == {PREFETCH_PRIORITY: 1}
+    assert queue.purge(retention=3600) == 0
+    assert queue.purge(retention=-1) == 1
+    assert queue.counts() == {QUEUED: 1}
@@ -0,0 +1,197 @@
+# test_mrz.py
+
+from scripts.utils.mrz import (
+    apply_id_mrz,
+    apply_passport_mrz,
+    check_digit,
+    covers_identity,
+    find_mrz,
+    nationality_name,
+    parse_mrz,
+    read_page_mrz,
+)
+
+ICAO_TD3 = [
+    "P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<",
+    "L898902C36UTO7408122F1204159ZE184226B<<<<<10",
+]
+ICAO_TD1 = [
+    "I<UTOD231458907<<<<<<<<<<<<<<<",
+    "7408122F1204159UTO<<<<<<<<<<<6",
+    "ERIKSSON<<ANNA<MARIA<<<<<<<<<<",
+]
+
+
+def td3(surname, given, number, nationality, birth, sex, expiry):
+    line1 = f"P<{nationality}{surname}<<{given.replace(' ', '<')}".ljust(44, "<")[:44]
+    number = number.ljust(9, "<")
+    optional = "<" * 14
+    body = (number + check_digit(number) + nationality + birth + check_digit(birth) + sex
+            + expiry + check_digit(expiry) + optional + check_digit(optional))
+    composite = body[0:10] + body[13:20] + body[21:43]
+    return [line1, body + check_digit(composite)]
+
+
+def emirates_id_back(eid_digits, surname, given, birth, sex, expiry, nationality="IND"):
+    line1 = f"ILARE{'123456789'}{check_digit('123456789')}{eid_digits}"
+    line2 = f"{birth}{check_digit(birth)}{sex}{expiry}{check_digit(expiry)}{nationality}".ljust(29, "<")
+    composite = line1[5:30] + line2[0:7] + line2[8:15] + line2[18:29]
+    line3 = f"{surname}<<{given.replace(' ', '<')}".ljust(30, "<")
+    return [line1, line2 + check_digit(composite), line3]
+
+
+def test_check_digit_icao_examples():
+    assert check_digit("L898902C3") == "6"
+    assert check_digit("740812") == "2"
+    assert check_digit("120415") == "9"
+    assert check_digit("<<<<<<<<<<<<<<") == "0"
+
+
+def test_icao_specimens_parse_and_validate():
+    passport = parse_mrz(ICAO_TD3)
+    assert passport["valid"] and passport["format"] == "TD3"
+    assert passport["document_number"] == "L898902C3"
+    assert passport["birth_date"] == "12/08/1974"
+    assert (passport["surname"], passport["given_names"]) == ("ERIKSSON", "ANNA MARIA")
+
+    card = parse_mrz(ICAO_TD1)
+    assert card["valid"] and card["format"] == "TD1"
+    assert card["document_number"] == "D23145890"
+
+
+def test_find_mrz_in_noisy_text_and_digit_fixes():
+    noisy = ["PASSPORT", "Name: Anna", ICAO_TD3[0], ICAO_TD3[1].replace("7408122", "74O8122"), "end"]
+    found = find_mrz("\n".join(noisy))
+    assert found["valid"]
+    assert found["birth_date"] == "12/08/1974"
+
+
+def test_misread_character_fails_check():
+    lines = [ICAO_TD3[0], ICAO_TD3[1].replace("L898902C3", "L898902C8")]
+    assert parse_mrz(lines)["valid"] is False
+
+
+def test_passport_mrz_overwrites_only_mrz_fields():
+    mrz = parse_mrz(td3("SMITH", "JOHN", "123456789", "GBR", "900101", "M", "300101"))
+    assert mrz["valid"]
+    extracted = {
+        "fullname": "John Smith",
+        "Nationality or Place of Birth": "GBR",
+        "Date of Birth": "01/07/1990",
+        "Gender": "M",
+        "Date of Issue": "02/01/2020",
+        "Date of Expiry": "01/01/2030",
+    }
+    fields, changed = apply_passport_mrz(extracted, mrz)
+    assert fields["Date of Issue"] == "02/01/2020"
+    assert fields["fullname"] == "John Smith"
+    assert fields["Nationality or Place of Birth"] == "United Kingdom"
+    assert fields["Date of Birth"] == "01/01/1990"
+    assert fields["Passport Number"] == "123456789"
+    assert set(changed) == {"Nationality or Place of Birth", "Date of Birth", "Passport Number"}
+
+
+def test_passport_mrz_fixes_a_misread_name():
+    mrz = parse_mrz(td3("SMITH", "JOHN", "123456789", "GBR", "900101", "M", "300101"))
+    fields, changed = apply_passport_mrz({"fullname": "Jahn Smlth"}, mrz)
+    assert fields["fullname"] == "John Smith"
+    assert fields["Date of Issue"] == "Not found"
+    assert "fullname" in changed
+
+
+def test_truncated_mrz_name_is_not_used():
+    mrz = parse_mrz(td3("WOLFESCHLEGELSTEINHAUSEN", "HUBERT BLAINE CHARLES DAVID",
+                        "123456789", "USA", "900101", "M", "300101"))
+    assert mrz["valid"] and mrz["name_truncated"]
+    fields, _ = apply_passport_mrz({"fullname": "Hubert Blaine Charles David Wolfeschlegelsteinhausen"}, mrz)
+    assert fields["fullname"] == "Hubert Blaine Charles David Wolfeschlegelsteinhausen"
+
+
+def test_id_mrz_keeps_back_and_non_mrz_fields():
+    mrz = find_mrz("\n".join(emirates_id_back("784199012345671", "KUMAR", "RAVI", "900315", "M", "290101")))
+    assert mrz["valid"]
+    extracted = {
+        "front": {
+            "name_arabic": "رافي كومار",
+            "name_english": "Ravi Kumar",
+            "emirates_id": "784-1990-1234567-7",
+            "nationality": "IND",
+            "gender": "Male",
+            "issuing_date": "01/01/2024",
+            "expiry_date": "01/01/2029",
+            "date_of_birth": "15/03/1990",
+        },
+        "back": {"occupation": "Engineer", "issuing_place": "Dubai"},
+    }
+    fields, changed = apply_id_mrz(extracted, mrz)
+    assert fields["back"] == {"occupation": "Engineer", "issuing_place": "Dubai"}
+    assert fields["front"]["name_arabic"] == "رافي كومار"
+    assert fields["front"]["issuing_date"] == "01/01/2024"
+    assert fields["front"]["gender"] == "Male"
+    assert fields["front"]["nationality"] == "India"
+    assert fields["front"]["emirates_id"] == "784-1990-1234567-1"
+    assert set(changed) == {"nationality", "emirates_id"}
+
+
+def test_id_mrz_gender_uses_long_form_when_correcting():
+    mrz = find_mrz("\n".join(emirates_id_back("784199012345671", "KUMAR", "RAVI", "900315", "F", "290101")))
+    fields, _ = apply_id_mrz({"front": {"gender": "Male"}}, mrz)
+    assert fields["front"]["gender"] == "Female"
+
+
+def test_nationality_name():
+    assert nationality_name("ARE") == "United Arab Emirates"
+    assert nationality_name("D") == "Germany"
+    assert nationality_name("UTO") is None
+
+
+class FakeDocument:
+    def __init__(self, text="", ocr=""):
+        self._text, self._ocr, self.ocr_calls = text, ocr, []
+
+    def text(self, page_num):
+        return self._text
+
+    def ocr_text(self, page_num, top=0.0):
+        self.ocr_calls.append(top)
+        return self._ocr
+
+
+def test_read_page_mrz_prefers_the_text_layer():
+    doc = FakeDocument(text="\n".join(ICAO_TD3))
+    assert read_page_mrz(doc, 0)["document_number"] == "L898902C3"
+    assert doc.ocr_calls == []
+
+
+def test_read_page_mrz_falls_back_to_bottom_band_ocr():
+    doc = FakeDocument(text="Passport\nRepublic of Utopia", ocr="\n".join(ICAO_TD1))
+    assert read_page_mrz(doc, 0)["format"] == "TD1"
+    assert len(doc.ocr_calls) == 1 and doc.ocr_calls[0] > 0
+
+
+def test_read_page_mrz_rejects_failed_check_digits():
+    bad = [ICAO_TD3[0], ICAO_TD3[1].replace("L898902C3", "L898902C8")]
+    assert read_page_mrz(FakeDocument(text="\n".join(bad)), 0) is None
+    assert read_page_mrz(FakeDocument(), 0) is None
+
+
+def test_covers_identity_needs_the_full_name():
+    assert covers_identity(parse_mrz(ICAO_TD3))
+    long_name = parse_mrz(td3("WOLFESCHLEGELSTEINHAUSEN", "HUBERT BLAINE CHARLES DAVID",
+                              "123456789", "USA", "900101", "M", "300101"))
+    assert not covers_identity(long_name)
+    assert not covers_identity(None)
+
+
+def test_short_passport_extraction_is_completed_from_the_mrz():
+    mrz = parse_mrz(td3("SMITH", "JOHN", "123456789", "GBR", "900101", "M", "300101"))
+    fields, _ = apply_passport_mrz({"Date of Issue": "02/01/2020"}, mrz)
+    assert fields == {
+        "fullname": "John Smith",
+        "Nationality or Place of Birth": "United Kingdom",
+        "Date of Birth": "01/01/1990",
+        "Gender": "M",
+        "Date of Issue": "02/01/2020",
+        "Date of Expiry": "01/01/2030",
+        "Passport Number": "123456789",
+    }
@@ -0,0 +1,106 @@
+# test_page_triage.py
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import fitz  # PyMuPDF
+
+from scripts.utils.page_triage import (
+    TRIAGE_SIDE,
+    content_pages,
+    hash_distance,
+    is_blank,
+    perceptual_hash,
+    triage_images,
+)
+from scripts.utils.render_cache import CachedDocument, PageRenderCache
+
+A4 = (595, 842)
+
+
+def render(page):
+    # triage_document works on TRIAGE_SIDE renders.
+    page = page.copy()
+    page.thumbnail((TRIAGE_SIDE, TRIAGE_SIDE))
+    return page
+
+
+def id_photocopy(seed):
+    """An A4 page with one ID card photocopied on it; same layout, different person."""
+    rng = np.random.default_rng(seed)
+    page = Image.new("L", A4, 255)
+    draw = ImageDraw.Draw(page)
+    draw.rectangle((100, 120, 495, 370), outline=0, width=3)
+    # Portrait: a different face-sized blob per person.
+    x, y = 130 + int(rng.integers(0, 20)), 160 + int(rng.integers(0, 20))
+    draw.ellipse((x, y, x + 90, y + 120), fill=int(rng.integers(40, 120)))
+    for row in range(6):
+        length = int(rng.integers(80, 250))
+        draw.rectangle((250, 160 + row * 30, 250 + length, 172 + row * 30), fill=30)
+    return render(page)
+
+
+def party_page(names):
+    page = Image.new("L", A4, 255)
+    draw = ImageDraw.Draw(page)
+    draw.text((60, 40), "PARTIES", fill=0)
+    for i, name in enumerate(names):
+        draw.text((60, 100 + i * 40), name, fill=0)
+        draw.line((60, 120 + i * 40, 535, 120 + i * 40), fill=0)
+    return render(page)
+
+
+def test_blank_page_detected():
+    blank = render(Image.new("L", A4, 250))
+    assert is_blank(np.asarray(blank))
+    assert not is_blank(np.asarray(id_photocopy(1)))
+
+
+def test_different_id_photocopies_are_all_kept():
+    pages = [id_photocopy(seed) for seed in range(4)]
+    triage = triage_images(pages)
+    assert triage["keep"] == [0, 1, 2, 3]
+    assert triage["duplicates"] == {}
+
+
+def test_party_pages_with_different_buyers_are_kept():
+    pages = [
+        party_page(["Seller: Ahmed Ali", "Buyer: John Smith"]),
+        party_page(["Seller: Ahmed Ali", "Buyer: Maria Lopez"]),
+        party_page(["Seller: Fatima Noor", "Buyer: Wei Chen"]),
+    ]
+    assert triage_images(pages)["duplicates"] == {}
+
+
+def test_identical_copies_collapse_and_are_counted():
+    contract = [id_photocopy(7), id_photocopy(8)]
+    blank = render(Image.new("L", A4, 255))
+    triage = triage_images(contract + [blank] + contract + contract)
+    assert triage["keep"] == [0, 1]
+    assert triage["blank"] == [2]
+    assert triage["duplicates"] == {3: 0, 4: 1, 5: 0, 6: 1}
+    assert triage["copies"] == 3
+
+
+def test_copies_for_distinct_and_irregular_pages():
+    triage = triage_images([id_photocopy(seed) for seed in range(3)])
+    assert triage["copies"] == 1
+    assert triage_images([id_photocopy(1), id_photocopy(2), id_photocopy(1)])["copies"] is None
+
+
+def test_hash_distance_zero_for_same_image():
+    image = id_photocopy(3)
+    assert hash_distance(perceptual_hash(image), perceptual_hash(image.copy())) == 0
+
+
+def test_content_pages_skips_blanks_and_keeps_page_numbers():
+    pdf = fitz.open()
+    for text in ["Sellers", None, "Buyers", None]:
+        page = pdf.new_page(width=300, height=400)
+        if text:
+            page.insert_text((30, 60), text * 4, fontsize=28)
+    data = pdf.tobytes()
+    pdf.close()
+    with CachedDocument(data, cache=PageRenderCache()) as doc:
+        assert content_pages(doc) == ([0, 2], [1, 3])
+        assert content_pages(doc, range(1, 4)) == ([2], [1, 3])
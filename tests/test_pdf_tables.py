@@ -0,0 +1,59 @@
+# test_pdf_tables.py
+
+import fitz
+
+from scripts.utils.pdf_tables import read_pdf_tables
+
+WORDS = "The attorney may sign on behalf of the principal all contracts and deeds relating to the property".split()
+
+
+def make_pdf(draw):
+    doc = fitz.open()
+    draw(doc.new_page())
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def two_column_text(page):
+    for col, x in enumerate((50, 320)):
+        for i in range(20):
+            start = (i * 3 + col) % 10
+            page.insert_text((x, 80 + i * 14), " ".join(WORDS[start:start + 6]), fontsize=10)
+
+
+def aligned_table(page):
+    rows = [
+        ["Name", "Nationality", "Emirates ID"],
+        ["Ali Hassan", "UAE", "784-1990-1234567-1"],
+        ["Sara Omar", "Egypt", "784-1985-7654321-2"],
+        ["John Smith", "UK", "784-1970-1111111-3"],
+    ]
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            page.insert_text((50 + c * 170, 80 + r * 20), cell, fontsize=10)
+
+
+def ruled_table(page):
+    rows = [["Name", "Role"], ["Ali", "Principal"], ["Sara", "Attorney"]]
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            rect = fitz.Rect(50 + c * 150, 80 + r * 20, 200 + c * 150, 100 + r * 20)
+            page.draw_rect(rect, color=(0, 0, 0))
+            page.insert_text((rect.x0 + 3, rect.y1 - 5), cell, fontsize=10)
+
+
+def test_multi_column_text_is_not_a_table():
+    assert read_pdf_tables(make_pdf(two_column_text), pages=[1]) == []
+
+
+def test_aligned_table_without_ruling_lines():
+    (frame,) = read_pdf_tables(make_pdf(aligned_table), pages=[1])
+    assert list(frame.columns) == ["Name", "Nationality", "Emirates ID"]
+    assert "784-1985-7654321-2" in frame["Emirates ID"].tolist()
+
+
+def test_ruled_table_and_missing_pages():
+    (frame,) = read_pdf_tables(make_pdf(ruled_table), pages=[1, 2])
+    assert list(frame.columns) == ["Name", "Role"]
+    assert frame["Role"].tolist() == ["Principal", "Attorney"]
@@ -0,0 +1,35 @@
+# test_prompt_registry.py
+
+from scripts.config.prompt_registry import (
+    PROMPT_REGISTRY,
+    BANK_PROMPT,
+    LEGAL_PROMPT,
+    PERSONAL_PROMPT,
+    POA_CHECK_PROMPT,
+    PROPERTY_PROMPT,
+)
+
+# doc_type spellings the extraction dispatch in ocr_utils.process_document accepts.
+DISPATCHED = {
+    LEGAL_PROMPT: [
+        "title deed", "title deed (lease to own)", "title deed lease to own",
+        "title deed (lease finance)", "title deed lease finance", "pre title deed",
+        "usufruct right certificate", "restrain property certificate", "initial contract of sale",
+        "initial contract of usufruct", "donation contract", "contract f",
+    ],
+    PROPERTY_PROMPT: ["noc non objection certificate", "noc", "soa"],
+    BANK_PROMPT: ["cheques", "mortgage letter", "liability letter", "mortgage contract", "customer statement"],
+    PERSONAL_PROMPT: ["ids", "passport", "residence visa", "poa"],
+}
+
+
+def test_dispatched_doc_types_are_labels():
+    for prompt, doc_types in DISPATCHED.items():
+        labels = PROMPT_REGISTRY[prompt]["labels"]
+        assert [t for t in doc_types if t not in labels] == []
+
+
+def test_poa_check_accepts_negative_answers():
+    labels = PROMPT_REGISTRY[POA_CHECK_PROMPT]["labels"]
+    assert "poa" in labels
+    assert {"not poa", "no", "legal", "property", "others"} <= set(labels)
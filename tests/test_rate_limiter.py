@@ -0,0 +1,134 @@
+# test_rate_limiter.py
+
+import time
+
+import pytest
+
+from scripts.utils.rate_limiter import (
+    AIMDLimiter,
+    CircuitBreaker,
+    TokenBucket,
+    VLMGuard,
+    ModelUnavailableError,
+    VLMUnavailableError,
+    is_model_unavailable,
+    is_retryable,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, message=None):
+        super().__init__(message or f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_token_bucket_burst_then_timeout():
+    bucket = TokenBucket(rate=1, burst=3)
+    deadline = time.monotonic() + 0.05
+    for _ in range(3):
+        bucket.acquire(deadline)
+    with pytest.raises(VLMUnavailableError):
+        bucket.acquire(deadline)
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=100, burst=1)
+    bucket.acquire(time.monotonic() + 1)
+    start = time.monotonic()
+    bucket.acquire(time.monotonic() + 1)
+    assert time.monotonic() - start < 0.5
+
+
+def test_aimd_grows_on_success_and_halves_on_throttle():
+    limiter = AIMDLimiter(initial=4, maximum=8)
+    limiter.on_success(1.0)
+    assert limiter.limit == pytest.approx(4.25)
+    limiter.on_throttle()
+    assert limiter.limit == pytest.approx(2.125)
+
+
+def test_aimd_slow_is_judged_per_key():
+    limiter = AIMDLimiter(initial=4, maximum=8)
+    for _ in range(3):
+        limiter.on_success(0.3, key=("broad_classification", "small"))
+    before = limiter.limit
+    # A long extraction after quick classifications is not a slowdown.
+    limiter.on_success(6.0, key=("title_deed", "large"))
+    assert limiter.limit > before
+    limiter.on_success(0.9, key=("broad_classification", "small"))
+    assert limiter.limit < before
+
+
+def test_aimd_acquire_times_out_at_limit():
+    limiter = AIMDLimiter(initial=1)
+    limiter.acquire(time.monotonic() + 1)
+    with pytest.raises(VLMUnavailableError):
+        limiter.acquire(time.monotonic() + 0.02)
+    limiter.release()
+    limiter.acquire(time.monotonic() + 0.02)
+
+
+def test_breaker_opens_then_lets_one_probe_through():
+    breaker = CircuitBreaker(failures=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.wait_until_allowed(time.monotonic() + 1) is False
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(VLMUnavailableError):
+        breaker.wait_until_allowed(time.monotonic() + 0.01)
+    assert breaker.wait_until_allowed(time.monotonic() + 1) is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.cooldown == pytest.approx(0.1)
+    assert breaker.wait_until_allowed(time.monotonic() + 1) is True
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.cooldown == pytest.approx(0.05)
+
+
+def test_retryable_errors():
+    assert is_retryable(StatusError(429)) and is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400))
+    assert is_retryable(TimeoutError())
+
+
+def test_model_unavailable_errors():
+    assert is_model_unavailable(StatusError(404))
+    assert is_model_unavailable(StatusError(400, "The model `Qwen/Qwen2.5-VL-3B-Instruct` does not exist."))
+    assert is_model_unavailable(StatusError(422, "Model Qwen/Qwen2.5-VL-3B-Instruct is not supported"))
+    assert is_model_unavailable(ModelUnavailableError("no backend"))
+    assert not is_model_unavailable(StatusError(400, "maximum context length exceeded"))
+    assert not is_model_unavailable(StatusError(503, "model not found"))
+
+
+def guard(**kwargs):
+    return VLMGuard(bucket=TokenBucket(rate=1000, burst=100), limiter=AIMDLimiter(initial=2),
+                    breaker=CircuitBreaker(failures=5, cooldown=0.01), queue_timeout=2, **kwargs)
+
+
+def test_guard_retries_throttled_calls(monkeypatch):
+    monkeypatch.setattr("scripts.utils.rate_limiter.backoff_delay", lambda attempt: 0)
+    outcomes = [StatusError(429), StatusError(503), "ids"]
+
+    def fn():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    stats = {}
+    assert guard(max_retries=3).call(fn, stats=stats, key="k") == "ids"
+    assert stats["retries"] == 2
+
+
+def test_guard_does_not_retry_client_errors():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise StatusError(400)
+
+    g = guard(max_retries=3)
+    with pytest.raises(StatusError):
+        g.call(fn)
+    assert len(calls) == 1
+    assert g.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,62 @@
+# test_render_cache.py
+
+import gc
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from scripts.utils.render_cache import CachedDocument, PageRenderCache, pixmap_to_image
+
+
+def make_pdf(pages=2):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=200, height=300)
+        page.insert_text((20, 40), f"Page {i + 1}", fontsize=24)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_pixmap_to_image_outlives_pixmap():
+    doc = fitz.open(stream=make_pdf(1), filetype="pdf")
+    pix = doc.load_page(0).get_pixmap(alpha=False)
+    expected = (pix.width, pix.height, pix.samples)
+    image = pixmap_to_image(pix)
+    del pix
+    doc.close()
+    gc.collect()
+    assert image.mode == "RGB" and image.size == expected[:2]
+    assert image.tobytes() == expected[2]
+    assert not hasattr(image, "_pixmap")
+
+
+def test_gray_render():
+    doc = fitz.open(stream=make_pdf(1), filetype="pdf")
+    pix = doc.load_page(0).get_pixmap(colorspace=fitz.csGRAY, alpha=False)
+    assert pixmap_to_image(pix).mode == "L"
+    doc.close()
+
+
+def test_cached_document_renders_each_page_once():
+    cache = PageRenderCache(max_bytes=64 * 1024 * 1024)
+    pdf_bytes = make_pdf(2)
+    with CachedDocument(pdf_bytes, cache=cache) as doc:
+        assert doc.page_count == 2
+        first = doc.image(0, zoom=1.0)
+        assert doc.image(0, zoom=1.0) is first
+        assert doc.image(1, zoom=1.0) is not first
+        assert doc.text(1).strip() == "Page 2"
+    # Cached entries are served after the fitz document was closed.
+    assert CachedDocument(pdf_bytes, cache=cache).image(0, zoom=1.0) is first
+
+
+def test_lru_eviction_by_bytes():
+    cache = PageRenderCache(max_bytes=100 * 100 * 3 * 2)
+    images = [Image.new("RGB", (100, 100)) for _ in range(3)]
+    cache.put("a", images[0])
+    cache.put("b", images[1])
+    cache.get("a")
+    cache.put("c", images[2])
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.total_bytes == 100 * 100 * 3 * 2
@@ -0,0 +1,154 @@
+# test_vlm_cache.py
+
+import base64
+import threading
+import time
+
+import pytest
+
+from scripts.utils.vlm_cache import VLMCache, make_cache_key
+
+PARAMS = {"temperature": 0, "seed": 2025, "max_tokens": 24}
+BACKENDS = ["https://router.huggingface.co/hyperbolic/v1"]
+
+
+def image_part(data):
+    return {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + base64.b64encode(data).decode()}}
+
+
+def messages(data=b"page-1", text="classify"):
+    return [image_part(data), {"type": "text", "text": text}]
+
+
+def key(msgs=None, model="large", params=PARAMS, backends=BACKENDS):
+    return make_cache_key(messages() if msgs is None else msgs, model, params, backends=backends)
+
+
+def test_key_is_stable():
+    assert key() == key()
+    assert key(backends=list(reversed(BACKENDS + ["http://x/v1"]))) == key(backends=BACKENDS + ["http://x/v1"])
+
+
+@pytest.mark.parametrize("other", [
+    dict(msgs=messages(data=b"page-2")),
+    dict(msgs=messages(text="extract")),
+    dict(model="small"),
+    dict(params=dict(PARAMS, max_tokens=1024)),
+    dict(backends=["http://127.0.0.1:8089/v1"]),
+])
+def test_key_changes_with_inputs(other):
+    assert key(**other) != key()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VLMCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024, ttl=60)
+
+
+def test_get_set(cache):
+    assert cache.get("k") is None
+    cache.set("k", "title deed")
+    assert cache.get("k") == "title deed"
+
+
+def test_ttl_expires(cache):
+    cache.set("k", "ids")
+    cache.ttl = 0.01
+    time.sleep(0.02)
+    assert cache.get("k") is None
+
+
+def test_evicts_least_recently_used(cache):
+    cache.set("old", "a" * 400)
+    cache.set("new", "b" * 400)
+    cache.get("old")
+    cache.set("third", "c" * 400)
+    assert cache.get("new") is None
+    assert cache.get("old") is not None and cache.get("third") is not None
+
+
+def test_get_or_compute_coalesces_concurrent_misses(cache):
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(1)
+        return "passport"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert [value for value, _ in results] == ["passport"] * 4
+    assert sorted(hit for _, hit in results) == [False, True, True, True]
+    assert cache.get_or_compute("k", compute) == ("passport", True)
+
+
+def test_failed_compute_is_not_cached(cache):
+    def fail():
+        raise RuntimeError("503")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", fail)
+    assert cache.get_or_compute("k", lambda: "ids") == ("ids", False)
+
+
+class Cancelled(Exception):
+    pass
+
+
+def test_waiter_computes_when_owner_is_cancelled(cache):
+    started = threading.Event()
+    release = threading.Event()
+
+    def cancelled():
+        started.set()
+        release.wait(1)
+        raise Cancelled()
+
+    errors = []
+
+    def owner():
+        try:
+            cache.get_or_compute("k", cancelled)
+        except Cancelled as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=owner)
+    thread.start()
+    started.wait(1)
+    waiter = []
+    waiting = threading.Thread(
+        target=lambda: waiter.append(cache.get_or_compute("k", lambda: "passport", retry_on=(Cancelled,)))
+    )
+    waiting.start()
+    time.sleep(0.05)
+    release.set()
+    thread.join()
+    waiting.join()
+    assert len(errors) == 1 and waiter == [("passport", False)]
+    assert cache.get("k") == "passport"
+
+
+def test_waiter_stops_waiting_after_timeout(cache):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(1)
+        return "slow"
+
+    thread = threading.Thread(target=cache.get_or_compute, args=("k", slow))
+    thread.start()
+    started.wait(1)
+    assert cache.get_or_compute("k", lambda: "fast", wait_timeout=0.01) == ("fast", False)
+    release.set()
+    thread.join()
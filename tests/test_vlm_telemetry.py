@@ -0,0 +1,36 @@
+# test_vlm_telemetry.py
+
+import collections
+import threading
+
+from scripts.utils.vlm_telemetry import count_input_paths, input_path_summary, percentile, record_input_path
+
+
+def test_percentile_nearest_rank():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([3, 1, 2, 4], 99) == 4
+
+
+def test_count_input_paths_only_sees_its_own_threads():
+    mine = collections.Counter()
+
+    def submission():
+        with count_input_paths(mine):
+            record_input_path("classification", "text", "passport")
+            record_input_path("extraction", "image", "passport")
+
+    def other_session():
+        record_input_path("extraction", "text", "ids")
+
+    threads = [threading.Thread(target=submission), threading.Thread(target=other_session)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record_input_path("extraction", "text", "ids")
+
+    summary = input_path_summary(mine)
+    assert summary["_all"] == {"text": 1, "image": 1, "text_ratio": 0.5}
+    assert summary["extraction"]["image"] == 1 and summary["extraction"]["text"] == 0
+    assert input_path_summary()["_all"]["text"] >= 3